@@ -10,21 +10,22 @@ function ready() {
     function fetchSections() {
         console.log("fetchSections");
         const courseId = document.getElementById("course_id").value;
-        data = JSON.stringify({'courseId': courseId});
+        const params = new URLSearchParams({'course_id': courseId});
         const xhr = new XMLHttpRequest();
         if (!window.location.origin) {
           window.location.origin = window.location.protocol + "//" + window.location.hostname + (window.location.port ? ':' + window.location.port: '');
         }
-        xhr.open("POST", window.location.origin + "/sms/admin/section/fetch/");
-        xhr.setRequestHeader("Content-Type", "application/json");
+        <!-- GET lets the browser revalidate its cached copy and reuse it on a 304 -->
+        xhr.open("GET", window.location.origin + "/sms/admin/section/fetch/?" + params.toString());
         xhr.onload = function() {
             const secContainer = document.getElementById("section_list");
             if (this.status == 200) {
-                const sections = JSON.parse(this.responseText);
+                <!-- Rows are [id, section_name] arrays -->
+                const sections = JSON.parse(this.responseText).rows;
                 let htmlBlock = "<select class='form-control' name='section' id='section'>";
                 if (sections.length > 0) {
-                    sections.forEach(section=> {
-                       htmlBlock += "<option value='"+ section.pk +"'>"+ section.fields.section_name +"</option>";
+                    sections.forEach(([id, section_name]) => {
+                       htmlBlock += "<option value='"+ id +"'>"+ section_name +"</option>";
                     });
                     htmlBlock += "</select>";
                 }
@@ -39,7 +40,7 @@ function ready() {
             }
 
         };
-        xhr.send(data);
+        xhr.send();
 
     }
 
@@ -47,27 +48,27 @@ function ready() {
         console.log("getSubjects");
         var id = document.getElementById("course_id").value;
         var xhr = new XMLHttpRequest();
-        var data = JSON.stringify({'course_id': id});
+        var params = new URLSearchParams({'course_id': id});
 
         document.getElementById("course_subjects").innerHTML = '';
 
         if (!window.location.origin) {
           window.location.origin = window.location.protocol + "//" + window.location.hostname + (window.location.port ? ':' + window.location.port: '');
         }
-        xhr.open("POST", window.location.origin + "/sms/admin/ajax/getsubjects/", true);
-        xhr.setRequestHeader('Content-Type', 'application/json');
+        xhr.open("GET", window.location.origin + "/sms/admin/ajax/getsubjects/?" + params.toString(), true);
         xhr.onload = function() {
             let htmlBlock = "<div class='card card-primary'><div class='card-header'><h3 class='card-title'>Subjects</h3></div><div class='card-body'>";
             if (this.status == 200) {
-                let courseSubjects = JSON.parse(this.responseText);
+                <!-- Rows are [id, subject_name] arrays -->
+                let courseSubjects = JSON.parse(this.responseText).rows;
                 if (courseSubjects.length > 0) {
                     courseSubjects.forEach(renderSubjects);
 
-                    function renderSubjects(subject) {
-                        htmlBlock += '<div class="form-check"><input type="checkbox" name="subject_list[]" id="subject_'+subject.fields.subject_name +
-                        '" value="'+subject.pk+'">' +
-                        '<label for="subject_'+subject.fields.subject_name+'" class="ml-1">' +
-                        subject.fields.subject_name + '</label></div>'
+                    function renderSubjects([id, subject_name]) {
+                        htmlBlock += '<div class="form-check"><input type="checkbox" name="subject_list[]" id="subject_'+subject_name +
+                        '" value="'+id+'">' +
+                        '<label for="subject_'+subject_name+'" class="ml-1">' +
+                        subject_name + '</label></div>'
                     }
                 }
                 else {
@@ -81,7 +82,7 @@ function ready() {
             htmlBlock += '</div></div>'
             document.getElementById("course_subjects").innerHTML = htmlBlock;
         };
-        xhr.send(data);
+        xhr.send();
     }
 }
 
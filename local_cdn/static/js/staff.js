@@ -14,20 +14,21 @@ function ready() {
         const sectionSel = document.getElementById("staff_subject");
         const courseId = sectionSel.options[sectionSel.selectedIndex].getAttribute("data-course");
         console.log(courseId);
-        data = JSON.stringify({'courseId': courseId});
+        const params = new URLSearchParams({'course_id': courseId});
         const xhr = new XMLHttpRequest();
-        xhr.open("POST", "{% url 'ajax-staff-fetch-sections' %}");
-        xhr.setRequestHeader("Content-Type", "application/json");
+        <!-- GET lets the browser revalidate its cached copy and reuse it on a 304 -->
+        xhr.open("GET", "/sms/staff/section/fetch/?" + params.toString());
         xhr.onload = function() {
             const secContainer = document.getElementById("section_list");
             if (this.status == 200) {
                 console.log("status 200");
-                const sections = JSON.parse(this.responseText);
+                <!-- Rows are [id, section_name] arrays -->
+                const sections = JSON.parse(this.responseText).rows;
                 console.log(sections);
                 let htmlBlock = "<label for='school_year'>Section</label><select class='form-control' name='section' id='section'>";
                 if (sections.length > 0) {
-                    sections.forEach(section=> {
-                       htmlBlock += "<option value='"+ section.pk +"'>"+ section.fields.section_name +"</option>";
+                    sections.forEach(([id, section_name]) => {
+                       htmlBlock += "<option value='"+ id +"'>"+ section_name +"</option>";
                     });
                     htmlBlock += "</select>";
                     document.getElementById("btn_fetch_students").removeAttribute("disabled", "disabled");
@@ -43,7 +44,7 @@ function ready() {
             }
 
         };
-        xhr.send(data);
+        xhr.send();
 
     }
 
@@ -60,23 +61,25 @@ function ready() {
         const staff_id = {{user.id}}
         const subject_id = document.getElementById("staff_subject").value;
         const school_year_id = document.getElementById("school_year").value;
+        const section_id = document.getElementById("section").value;
 
-        <!-- JSON stringify data parameters -->
-        let data = JSON.stringify({'staff_id': staff_id, 'subject_id': subject_id, 'school_year_id': school_year_id});
+        <!-- Query string parameters -->
+        const params = new URLSearchParams({'staff_id': staff_id, 'subject_id': subject_id,
+                                            'section_id': section_id, 'school_year_id': school_year_id});
 
         const xhr = new XMLHttpRequest()
-        xhr.open("POST", "{% url 'ajax-staff-fetch-students' %}");
-        xhr.setRequestHeader("Content-Type", "application/json");
+        xhr.open("GET", "/sms/staff/students/fetch/?" + params.toString());
         xhr.onload = function() {
             const studContainer = document.getElementById("student_list");
             let htmlBlock = "<div class='form-group'>";
             if (this.status == 200) {
-                const students = JSON.parse(this.responseText);
+                <!-- Rows are [id, first_name, middle_initial, last_name] arrays -->
+                const students = JSON.parse(this.responseText).rows;
                 if (students.length > 0) {
-                    students.forEach(student => {
+                    students.forEach(([id, first_name, middle_initial, last_name]) => {
                        htmlBlock += "<div class='form-control'><label><input type='checkbox' class='student mr-1' name='student[]' id='student' value='" +
-                       student.pk+"'></input>" + student.fields.first_name+ " " + student.fields.middle_initial + ". " +
-                       student.fields.last_name +"</label></div>";
+                       id+"'></input>" + first_name+ " " + middle_initial + ". " +
+                       last_name +"</label></div>";
                     });
                     document.getElementById("btn_save_attendance").removeAttribute("disabled", "disabled");
                 }
@@ -92,7 +95,7 @@ function ready() {
             }
 
         };
-        xhr.send(data);
+        xhr.send();
     }
 
     function saveAttendance() {
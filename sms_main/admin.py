@@ -6,6 +6,7 @@ from django.contrib.auth.admin import UserAdmin
 # from .forms import CustomUserChangeForm, RegistrationForm
 from .forms import RegistrationForm
 from .models import CustomUserProfile, Course
+from .provisioning import provision_user
 
 
 class CustomUserProfileAdmin(admin.ModelAdmin):
@@ -15,6 +16,13 @@ class CustomUserProfileAdmin(admin.ModelAdmin):
     list_display = ['email', 'first_name', 'middle_initial', 'last_name', 'profile_pic','is_staff', 'is_active', 'is_superuser']
     list_editable = ['profile_pic']
 
+    def save_model(self, request, obj, form, change):
+        if change:
+            super().save_model(request, obj, form, change)
+        else:
+            # New users also need their role row
+            provision_user(obj)
+
 
 class CoursesAdmin(admin.ModelAdmin):
     model = Course
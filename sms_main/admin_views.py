@@ -1,28 +1,39 @@
 import json
 import datetime
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.messages import get_messages
-from django.core import serializers
 from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
 from django.core.validators import validate_email
 from django.db import models
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse_lazy
 from django.utils.decorators import method_decorator
 from django.views import View
+from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
-from django.views.generic import TemplateView, CreateView, UpdateView, ListView, DeleteView
+from django.views.decorators.http import condition
+from django.views.generic import TemplateView, CreateView, UpdateView, ListView, DeleteView, FormView
 
+from . import exports, instrumentation, lookups
+from .etags import aggregate_validators
 from .forms import RegisterStaffForm, RegisterStudentForm, AddCourseForm, AddSubjectForm, ManageStaffForm, \
     ManageStudentsForm, ManageSubjectsForm, ManageCoursesForm, EditStaffForm, EditStudentForm, EditSubjectForm, \
-    AddSchoolYearForm, EditCourseForm, EditSchoolYearForm, AddSectionForm
-from .mixins import AdminCheckMixin
+    AddSchoolYearForm, EditCourseForm, EditSchoolYearForm, AddSectionForm, StudentTableFilterForm, \
+    StudentImportForm
+from .exports import ExportError
+from .mixins import AdminCheckMixin, ExportMixin, KeysetListMixin, ReplicaReadMixin
 from .models import Course, Subject, CustomUserProfile, Staff, Student, SchoolYearModel, OfferedSubject, CourseSection, \
     StaffFeedBack, LeaveReportStaff
+from .pagination import KeysetPaginator, InvalidCursor, cached_count
+from .provisioning import provision_user, update_user
+from .serialization import projection_response
+from .student_import import COLUMNS as IMPORT_COLUMNS, StudentImportError, import_students
 from collections import OrderedDict
 
 
@@ -63,6 +74,32 @@ class AdminDashboardView(LoginRequiredMixin, AdminCheckMixin, TemplateView):
     }
 
 
+class InstrumentationSummaryView(LoginRequiredMixin, AdminCheckMixin, TemplateView):
+    """Rolling per-view timings and query counts recorded by the instrumentation middleware of this process"""
+    template_name = 'admin/instrumentation.html'
+    links = {
+        'Home': 'admin-dashboard',
+        'Performance': ''
+    }
+    extra_context = {
+        'page_title': 'Performance',
+        'page_header_title': 'Performance',
+        'breadcrumbs': OrderedDict(links)
+    }
+
+    def get(self, request, *args, **kwargs):
+        if request.GET.get('format') == 'json':
+            return JsonResponse({'requests': len(instrumentation.RECENT), 'views': instrumentation.summary()})
+        return super().get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['views'] = instrumentation.summary()
+        context['recorded_requests'] = len(instrumentation.RECENT)
+        context['window'] = instrumentation.RECENT.maxlen
+        return context
+
+
 class AddStaffView(LoginRequiredMixin, AdminCheckMixin, CreateView):
     template_name = 'admin/add_staff.html'
     model = get_user_model()
@@ -80,12 +117,10 @@ class AddStaffView(LoginRequiredMixin, AdminCheckMixin, CreateView):
     }
 
     def form_valid(self, form):
-        user = form.save()
-        user.refresh_from_db()
-        user.staff.address = form.cleaned_data.get('address')
-        user.save()
+        self.object = form.save(commit=False)
+        provision_user(self.object, address=form.cleaned_data.get('address'))
         custom_message(self.request, "Staff Registration Successful", "success")
-        return super(AddStaffView, self).form_valid(form)
+        return redirect(self.get_success_url())
 
     def form_invalid(self, form):
         custom_message(self.request, "Student Registration Failed", "error")
@@ -98,43 +133,69 @@ class AddStudentView(LoginRequiredMixin, AdminCheckMixin, CreateView):
     model = get_user_model()
     form_class = RegisterStudentForm
     success_url = reverse_lazy('admin-dashboard')
-    school_year = SchoolYearModel.objects.all()
     links = {
         'Home': 'admin-dashboard',
         'Add Student': ''
     }
     extra_context = {
         'page_header_title': 'Add Student',
-        'school_year': school_year,
         'default_pic': '/media/default.png',
         'breadcrumbs': OrderedDict(links)
     }
 
     def form_valid(self, form):
-        user = form.save(commit=False)
-        # Set instance attributes to be used by the signal for saving extra details in the Student Model
-        user._gender = form.cleaned_data.get('gender')
-        user._address = form.cleaned_data.get('address')
-        user._school_year = form.cleaned_data.get('school_year')
-        user._course_id = form.cleaned_data.get('course_id')
-        user._year_level = form.cleaned_data.get('year_level')
-        user._section = form.cleaned_data.get('section')
-        user.save()
-
-        # Make an entry for subjects enrolled by the student
-        for subject in form.cleaned_data.get('subject_list'):
-            # Get the subject and student instance
-            stud = user.student
-            subj = OfferedSubject(subject_id=subject, student_id=stud, school_year=user._school_year)
-            subj.save()
+        self.object = form.save(commit=False)
+        # Save the user, its Student row and an entry for each subject enrolled by the student in one transaction
+        provision_user(self.object,
+                       subjects=form.cleaned_data.get('subject_list'),
+                       gender=form.cleaned_data.get('gender'),
+                       address=form.cleaned_data.get('address'),
+                       school_year=form.cleaned_data.get('school_year'),
+                       course_id=form.cleaned_data.get('course_id'),
+                       year_level=form.cleaned_data.get('year_level'),
+                       section=form.cleaned_data.get('section'))
         custom_message(self.request, "Student Registration Successful", "success")
-        return super(AddStudentView, self).form_valid(form)
+        return redirect(self.get_success_url())
 
     def form_invalid(self, form):
         custom_message(self.request, "Student Registration Failed", "error")
         return super(AddStudentView, self).form_invalid(form)
 
 
+class ImportStudentsView(LoginRequiredMixin, AdminCheckMixin, FormView):
+    """Register many students at once from an uploaded .csv or .xlsx file, see student_import.py"""
+    template_name = 'admin/import_students.html'
+    form_class = StudentImportForm
+    links = {
+        'Home': 'admin-dashboard',
+        'Import Students': ''
+    }
+    extra_context = {
+        'page_header_title': 'Import Students',
+        'breadcrumbs': OrderedDict(links),
+        'columns': IMPORT_COLUMNS,
+    }
+
+    def form_valid(self, form):
+        upload = form.cleaned_data['file']
+        try:
+            result = import_students(upload, upload.name, workers=getattr(settings, 'STUDENT_IMPORT_WORKERS', 0))
+        except StudentImportError as e:
+            form.add_error('file', str(e))
+            return self.form_invalid(form)
+
+        if result.errors:
+            custom_message(self.request, f"{result.created} of {result.total} students imported, "
+                                         f"{result.failed} rows were rejected.", "error")
+        else:
+            custom_message(self.request, f"{result.created} students imported.", "success")
+        return self.render_to_response(self.get_context_data(form=self.form_class(), result=result))
+
+    def form_invalid(self, form):
+        custom_message(self.request, "Student Import Failed", "error")
+        return super(ImportStudentsView, self).form_invalid(form)
+
+
 class AddCourseView(LoginRequiredMixin, AdminCheckMixin, CreateView):
     model = Course
     form_class = AddCourseForm
@@ -185,7 +246,6 @@ class AddSectionView(CreateView):
     model = CourseSection
     template_name = 'admin/add_section.html'
     form_class = AddSectionForm
-    courses = Course.objects.all().order_by("course_name").only('id', 'course_name')
     success_url = reverse_lazy('add-section')
     links = {
         'Home': 'admin-dashboard',
@@ -193,10 +253,14 @@ class AddSectionView(CreateView):
     }
     extra_context = {
         'page_header_title': 'Add Section',
-        'courses_obj': courses,
         'breadcrumbs': OrderedDict(links)
     }
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['courses_obj'] = lookups.courses()
+        return context
+
     def form_valid(self, form):
         custom_message(self.request, 'Section has been created.', "success")
         return super(AddSectionView, self).form_valid(form)
@@ -229,8 +293,9 @@ class AddSchoolYearView(LoginRequiredMixin, AdminCheckMixin, CreateView):
         return super(AddSchoolYearView, self).form_invalid(form)
 
 
-class ManageSchoolYearView(LoginRequiredMixin, AdminCheckMixin, ListView):
+class ManageSchoolYearView(LoginRequiredMixin, AdminCheckMixin, ReplicaReadMixin, KeysetListMixin, ListView):
     model = SchoolYearModel
+    list_only = ('id', 'school_year_start', 'school_year_end')
     template_name = 'admin/manage_school_year.html'
     context_object_name = 'school_year_obj'
     form_class = ManageStaffForm
@@ -244,8 +309,11 @@ class ManageSchoolYearView(LoginRequiredMixin, AdminCheckMixin, ListView):
     }
 
 
-class ManageStaffView(LoginRequiredMixin, AdminCheckMixin, ListView):
+class ManageStaffView(LoginRequiredMixin, AdminCheckMixin, ReplicaReadMixin, KeysetListMixin, ListView):
     model = Staff
+    list_select_related = ('user_profile',)
+    list_only = ('id', 'user_profile__id', 'user_profile__first_name', 'user_profile__last_name',
+                 'user_profile__email', 'user_profile__is_active', 'user_profile__last_login')
     template_name = 'admin/manage_staff.html'
     context_object_name = 'staff_obj'
     form_class = ManageStaffForm
@@ -259,23 +327,134 @@ class ManageStaffView(LoginRequiredMixin, AdminCheckMixin, ListView):
     }
 
 
-class ManageStudentsView(LoginRequiredMixin, AdminCheckMixin, ListView):
-    model = Student
+class ManageStudentsView(LoginRequiredMixin, AdminCheckMixin, ReplicaReadMixin, TemplateView):
+    """Page shell of the students table. The rows are loaded page by page from AjaxManageStudentsData."""
     template_name = 'admin/manage_students.html'
-    context_object_name = 'students_obj'
-    form_class = ManageStudentsForm
     links = {
         'Home': 'admin-dashboard',
         'Manage Student': ''
     }
     extra_context = {
         'page_header_title': 'Manage Students',
-        'breadcrumbs': OrderedDict(links)
-    }
+        'breadcrumbs': OrderedDict(links),
+        'year_levels': Student.Levels.choices[1:],
+        'statuses': Student.Status.choices,
+    }
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['courses_obj'] = lookups.courses()
+        context['sections_obj'] = lookups.sections()
+        context['school_years_obj'] = lookups.school_years()
+        return context
+
+
+# Sort choices of the students table and the columns each one orders by
+STUDENT_SORT_FIELDS = {
+    'id': ('user_profile_id',),
+    'name': ('user_profile__last_name', 'user_profile__first_name'),
+    'email': ('user_profile__email',),
+    'course': ('course_id__course_name',),
+    'date_created': ('date_created',),
+    'school_year': ('school_year__school_year_start',),
+}
+# Filter parameters of the students table and the lookup each one filters on
+STUDENT_FILTER_FIELDS = {
+    'course': 'course_id',
+    'section': 'section',
+    'school_year': 'school_year',
+    'year_level': 'year_level',
+    'stat': 'stat',
+}
+
+
+def students_queryset(params):
+    """
+    Students matching the filters of the Manage Students table and the order they are listed in.
+    The table and its export both read from here so they always show the same rows.
+    :param params: cleaned_data of a StudentTableFilterForm
+    :return: (queryset, filters, ordering), the filters are the cache key of the total
+    """
+    filters = {lookup: params[name] for name, lookup in STUDENT_FILTER_FIELDS.items()
+               if params[name] not in (None, '')}
+    prefix = '-' if params['dir'] == 'desc' else ''
+    ordering = [prefix + field for field in STUDENT_SORT_FIELDS[params['sort'] or 'id']] + [prefix + 'id']
+    return Student.objects.filter(**filters), filters, ordering
 
 
-class ManageSubjectsView(LoginRequiredMixin, AdminCheckMixin, ListView):
+class AjaxManageStudentsData(LoginRequiredMixin, AdminCheckMixin, ReplicaReadMixin, View):
+    """
+    Server-side data source of the Manage Students table.
+    Rows are read with one joined values() query and paged with keyset pagination.
+    """
+    page_size = 50
+    columns = (
+        'id', 'user_profile_id', 'user_profile__first_name', 'user_profile__last_name', 'user_profile__email',
+        'user_profile__user_level', 'user_profile__is_active', 'user_profile__last_login',
+        'user_profile__profile_pic', 'course_id__course_name', 'gender', 'stat', 'year_level', 'address',
+        'date_created', 'date_updated', 'school_year__school_year_start', 'school_year__school_year_end',
+    )
+
+    def get(self, *args, **kwargs):
+        form = StudentTableFilterForm(self.request.GET)
+        if not form.is_valid():
+            return JsonResponse({"success": False, "errors": form.errors}, status=400)
+        params = form.cleaned_data
+
+        queryset, filters, ordering = students_queryset(params)
+        paginator = KeysetPaginator(queryset.values(*self.columns), ordering, params['limit'] or self.page_size)
+        try:
+            rows, next_cursor = paginator.page(params['cursor'])
+        except InvalidCursor:
+            return JsonResponse({"success": False, "errors": {"cursor": ["Invalid cursor."]}}, status=400)
+
+        data = {"success": True, "rows": [self.serialize_row(row) for row in rows], "next_cursor": next_cursor}
+        # The total only changes with the filters so it is sent with the first page only
+        if not params['cursor']:
+            data["total"] = cached_count(queryset, filters)
+        return JsonResponse(data)
+
+    @staticmethod
+    def serialize_row(row):
+        start, end = row['school_year__school_year_start'], row['school_year__school_year_end']
+        return {
+            'id': row['user_profile_id'],
+            'first_name': row['user_profile__first_name'],
+            'last_name': row['user_profile__last_name'],
+            'email': row['user_profile__email'],
+            'user_level': row['user_profile__user_level'],
+            'is_active': row['user_profile__is_active'],
+            'last_login': row['user_profile__last_login'],
+            'profile_pic': default_storage.url(row['user_profile__profile_pic'] or 'default.png'),
+            'course': row['course_id__course_name'],
+            'gender': row['gender'],
+            'stat': row['stat'],
+            'year_level': row['year_level'],
+            'address': row['address'],
+            'date_created': row['date_created'],
+            'date_updated': row['date_updated'],
+            'school_year': f"{start.strftime('%Y')} - {end.strftime('%Y')}",
+        }
+
+
+class ExportStudentsView(LoginRequiredMixin, AdminCheckMixin, ReplicaReadMixin, ExportMixin, View):
+    """Every student matching the filters of the Manage Students table, in its sort order"""
+    export = exports.STUDENTS
+    export_failure_url = 'manage-students'
+
+    def get_export_queryset(self):
+        form = StudentTableFilterForm(self.request.GET)
+        if not form.is_valid():
+            raise ExportError('Invalid student filters.')
+        queryset, _, ordering = students_queryset(form.cleaned_data)
+        return queryset.order_by(*ordering)
+
+
+class ManageSubjectsView(LoginRequiredMixin, AdminCheckMixin, ReplicaReadMixin, KeysetListMixin, ListView):
     model = Subject
+    list_select_related = ('course_id', 'staff_id')
+    list_only = ('id', 'subject_name', 'date_created', 'is_offered', 'course_id__course_name',
+                 'staff_id__first_name', 'staff_id__middle_initial', 'staff_id__last_name')
     template_name = 'admin/manage_subjects.html'
     context_object_name = 'subjects_obj'
     form_class = ManageSubjectsForm
@@ -289,8 +468,9 @@ class ManageSubjectsView(LoginRequiredMixin, AdminCheckMixin, ListView):
     }
 
 
-class ManageCoursesView(LoginRequiredMixin, AdminCheckMixin, ListView):
+class ManageCoursesView(LoginRequiredMixin, AdminCheckMixin, ReplicaReadMixin, KeysetListMixin, ListView):
     model = Course
+    list_only = ('id', 'course_name', 'date_created')
     template_name = 'admin/manage_courses.html'
     context_object_name = 'courses_obj'
     form_class = ManageCoursesForm
@@ -324,12 +504,11 @@ class EditStaffView(LoginRequiredMixin, AdminCheckMixin, UpdateView):
         return get_object_or_404(get_user_model(), id=user_id)
 
     def form_valid(self, form):
-        user = form.save()
-        user.refresh_from_db()
-        user.staff.address = form.cleaned_data.get('address')
-        user.save()
+        self.object = form.save(commit=False)
+        update_user(self.object, address=form.cleaned_data.get('address'))
+        form.save_m2m()
         custom_message(self.request, "Staff Update Successful", "success")
-        return super(EditStaffView, self).form_valid(form)
+        return redirect(self.get_success_url())
 
 
 class EditStudentView(LoginRequiredMixin, AdminCheckMixin, UpdateView):
@@ -344,27 +523,30 @@ class EditStudentView(LoginRequiredMixin, AdminCheckMixin, UpdateView):
     }
     extra_context = {
         'page_header_title': 'Edit Student',
-        'course_obj': Course.objects.all().order_by('course_name'),
-        'school_year_obj': SchoolYearModel.objects.all().order_by('-id'),
         'breadcrumbs': OrderedDict(links)
     }
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['course_obj'] = lookups.courses()
+        context['school_year_obj'] = lookups.school_years()
+        return context
+
     def get_object(self):
         user_id = self.kwargs.get('id')
         return get_object_or_404(get_user_model(), id=user_id)
 
     def form_valid(self, form):
-        user = form.save()
-        user.refresh_from_db()
-        user.student.address = form.cleaned_data.get('address')
-        user.student.school_year = form.cleaned_data.get('school_year')
-        user.student.gender = form.cleaned_data.get('gender')
-        user.student.course_id = form.cleaned_data.get('course_id')
-        user.student.profile_pic = form.cleaned_data.get('profile_pic')
-        user.student.date_updated = form.cleaned_data.get('date_updated')
-        user.save()
+        self.object = form.save(commit=False)
+        # The Student row is no longer re-saved by a signal, write its fields explicitly
+        update_user(self.object,
+                    address=form.cleaned_data.get('address'),
+                    school_year=form.cleaned_data.get('school_year'),
+                    gender=form.cleaned_data.get('gender'),
+                    course_id=form.cleaned_data.get('course_id'))
+        form.save_m2m()
         custom_message(self.request, "Student Update Successful", "success")
-        return super(EditStudentView, self).form_valid(form)
+        return redirect(self.get_success_url())
 
     def form_invalid(self, form):
         custom_message(self.request, "Student Update Failed", "error")
@@ -382,11 +564,15 @@ class EditSubjectView(LoginRequiredMixin, AdminCheckMixin, UpdateView):
         'Edit Subject': ''
     }
     extra_context = {
-        'course_obj': Course.objects.all(),
-        'staff_obj': CustomUserProfile.objects.filter(user_level=2),
         'breadcrumbs': OrderedDict(links)
     }
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['course_obj'] = lookups.courses()
+        context['staff_obj'] = lookups.staff_users()
+        return context
+
     def get_object(self, queryset=None):
         subject_id = self.kwargs.get('id')
         return get_object_or_404(Subject, id=subject_id)
@@ -581,8 +767,11 @@ class DeleteSchoolYearView(LoginRequiredMixin, AdminCheckMixin, DeleteView):
         return get_object_or_404(SchoolYearModel, id=sy_id)
 
 
-class ViewFeedbacks(LoginRequiredMixin, AdminCheckMixin, ListView):
+class ViewFeedbacks(LoginRequiredMixin, AdminCheckMixin, ReplicaReadMixin, KeysetListMixin, ListView):
     model = StaffFeedBack
+    list_select_related = ('staff_id__user_profile',)
+    list_only = ('id', 'feedback', 'feedback_reply', 'date_replied', 'date_created',
+                 'staff_id__id', 'staff_id__user_profile__first_name', 'staff_id__user_profile__last_name')
     template_name = 'admin/view_feedbacks.html'
     context_object_name = 'feedback_obj'
 
@@ -595,8 +784,11 @@ class ViewFeedbacks(LoginRequiredMixin, AdminCheckMixin, ListView):
     }
 
 
-class ManageStaffLeaves(LoginRequiredMixin, AdminCheckMixin, ListView):
+class ManageStaffLeaves(LoginRequiredMixin, AdminCheckMixin, ReplicaReadMixin, KeysetListMixin, ListView):
     model = LeaveReportStaff
+    list_select_related = ('staff_id__user_profile',)
+    list_only = ('id', 'leave_start_date', 'leave_end_date', 'leave_message', 'leave_status',
+                 'staff_id__id', 'staff_id__user_profile__email')
     template_name = 'admin/manage_staff_leaves.html'
     context_object_name = 'leaves_obj'
 
@@ -609,6 +801,14 @@ class ManageStaffLeaves(LoginRequiredMixin, AdminCheckMixin, ListView):
     }
 
 
+class ExportStaffLeaves(LoginRequiredMixin, AdminCheckMixin, ReplicaReadMixin, ExportMixin, View):
+    export = exports.STAFF_LEAVES
+    export_failure_url = 'manage-staff-leaves'
+
+    def get_export_queryset(self):
+        return LeaveReportStaff.objects.order_by('id')
+
+
 class AjaxFeedbackReply(View):
     model = StaffFeedBack
     template_name = 'admin/feedback_reply.html'
@@ -643,30 +843,29 @@ class AjaxFeedbackReply(View):
         return JsonResponse({"replyStatus": fid, "msg": msg, "status": True})
 
 
+def offered_subjects_queryset(request):
+    """Subjects listed by AjaxGetSubjects"""
+    course_id = request.GET.get('course_id')
+    return lookups.offered_subjects.queryset(course_id) if course_id else None
+
+
+subjects_etag, subjects_last_modified = aggregate_validators(offered_subjects_queryset)
+
+
+@method_decorator(cache_control(private=True, no_cache=True), name='dispatch')
 class AjaxGetSubjects(View):
+    """Subjects offered under a course, answered with 304 when nothing changed"""
     model = OfferedSubject
 
-    @method_decorator(csrf_exempt)
-    def dispatch(self, request, *args, **kwargs):
-        return super(AjaxGetSubjects, self).dispatch(request, *args, **kwargs)
-
-    def post(self, *args, **kwargs):
-        if self.request.method == "POST":
-            # body_unicode = self.request.body.decode('utf-8') decode is only used in python 3.5below
-            body_unicode = self.request.body
-            body = json.loads(body_unicode)
-            course_id = body['course_id']
-            course_subjects = Subject.objects.filter(course_id=course_id, is_offered=True).order_by('subject_name')
-
-            if not course_subjects:
-                data = json.dumps({})
-            else:
-                data = serializers.serialize('json', course_subjects, fields=('id', 'subject_name'))
-            return HttpResponse(data, content_type="application/json")
-        else:
+    @method_decorator(condition(etag_func=subjects_etag, last_modified_func=subjects_last_modified))
+    def get(self, *args, **kwargs):
+        subjects = offered_subjects_queryset(self.request)
+        if subjects is None:
             return JsonResponse({"success": False, "method": self.request.method, "is_ajax": self.request.is_ajax()},
                                 status=400)
 
+        return projection_response(subjects, ('id', 'subject_name'))
+
 
 class AjaxCheckEmailDuplicate(View):
     model = get_user_model()
@@ -0,0 +1,188 @@
+from django.apps import apps as global_apps
+from django.db import transaction, IntegrityError
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import Attendance, AttendanceReport, AttendanceSummary, OfferedSubject, Student
+
+# Summary rows written per bulk insert when rebuilding
+SUMMARY_BATCH_SIZE = 2000
+
+
+class AttendanceError(Exception):
+    """Raised when an attendance entry cannot be written"""
+
+
+class DuplicateAttendanceError(AttendanceError):
+    """Raised when the attendance of the class was already taken today"""
+
+
+def todays_attendance(subject, section, school_year):
+    """
+    Attendance entry of a class for today, used to refuse a second one.
+    Answered from the index of the unique (subject, section, school year, day) constraint.
+    """
+    return Attendance.objects.filter(
+        subject_id=subject,
+        section_id=section,
+        school_year_id=school_year,
+        attendance_day=timezone.localdate()
+    ).only('id')
+
+
+def create_attendance(subject, section, school_year, user_profile_ids):
+    """
+    Create an attendance entry and one attendance report per present student.
+    The students are resolved in one query and every row is written inside a single transaction,
+    so the number of queries does not grow with the size of the class.
+    :param subject: Subject instance
+    :param section: CourseSection instance
+    :param school_year: SchoolYearModel instance
+    :param user_profile_ids: ids of the user profiles of the present students
+    :return: the new Attendance instance
+    """
+    user_profile_ids = {int(user_profile_id) for user_profile_id in user_profile_ids}
+
+    with transaction.atomic():
+        student_ids = list(Student.objects.filter(user_profile_id__in=user_profile_ids).values_list('id', flat=True))
+        if len(student_ids) != len(user_profile_ids):
+            raise AttendanceError('One or more selected students do not exist.')
+
+        try:
+            attendance = Attendance.objects.create(subject_id=subject, section_id=section, school_year=school_year)
+        except IntegrityError:
+            # Another request took the attendance of the class between the caller's check and this insert.
+            # Raising leaves the atomic block, which rolls the transaction back.
+            raise DuplicateAttendanceError('The attendance of this class was already taken today.')
+        AttendanceReport.objects.bulk_create(
+            [AttendanceReport(student_id_id=student_id, attendance_id=attendance) for student_id in student_ids]
+        )
+        count_session(subject, section, school_year, student_ids)
+    return attendance
+
+
+def count_session(subject, section, school_year, student_ids):
+    """
+    Add a session held to the summaries of the students of the class and a session attended to the present ones.
+    Students outside the class are not counted, like rebuild_attendance_summaries does.
+    """
+    enrolled = set(OfferedSubject.objects.filter(
+        subject_id=subject, school_year=school_year, student_id__section=section
+    ).values_list('student_id', flat=True))
+    if not enrolled:
+        return
+    AttendanceSummary.objects.bulk_create(
+        [AttendanceSummary(student_id_id=student_id, subject_id=subject, school_year=school_year)
+         for student_id in enrolled],
+        ignore_conflicts=True
+    )
+    summaries = AttendanceSummary.objects.filter(subject_id=subject, school_year=school_year)
+    now = timezone.now()
+    summaries.filter(student_id__in=enrolled).update(sessions_held=F('sessions_held') + 1, date_updated=now)
+    present = enrolled.intersection(student_ids)
+    if present:
+        summaries.filter(student_id__in=present).update(sessions_attended=F('sessions_attended') + 1,
+                                                        date_updated=now)
+
+
+def update_attendance(attendance_id, id_list):
+    """
+    Apply the checked/unchecked state of a class list to an existing attendance entry.
+    The students to add and to remove are computed as sets and written with one bulk_create and one delete.
+    :param attendance_id: id of the Attendance entry being corrected
+    :param id_list: list of {'id': student id, 'status': 1 if present else 0}
+    :return: sorted ids of the students present after the update
+    """
+    present = {int(stud['id']) for stud in id_list if stud['status']}
+    absent = {int(stud['id']) for stud in id_list if not stud['status']}
+
+    try:
+        with transaction.atomic():
+            # Lock the attendance entry so concurrent corrections of the same session are applied one at a time
+            try:
+                attendance = Attendance.objects.select_for_update().only(
+                    'id', 'subject_id', 'section_id', 'school_year'
+                ).get(pk=attendance_id)
+            except Attendance.DoesNotExist:
+                raise AttendanceError('The attendance entry does not exist.')
+
+            reports = AttendanceReport.objects.filter(attendance_id=attendance)
+            current = set(reports.values_list('student_id', flat=True))
+            to_add = present - current
+            to_remove = absent & current
+
+            if to_add:
+                AttendanceReport.objects.bulk_create(
+                    [AttendanceReport(student_id_id=student_id, attendance_id=attendance) for student_id in to_add]
+                )
+            if to_remove:
+                reports.filter(student_id__in=to_remove).delete()
+            if to_add or to_remove:
+                # Only the summaries of the students of the class, the ones count_session created
+                summaries = AttendanceSummary.objects.filter(
+                    subject_id=attendance.subject_id_id, school_year=attendance.school_year_id,
+                    student_id__section=attendance.section_id_id
+                )
+                now = timezone.now()
+                if to_add:
+                    summaries.filter(student_id__in=to_add).update(
+                        sessions_attended=F('sessions_attended') + 1, date_updated=now
+                    )
+                if to_remove:
+                    # Clamped at 0, the column is unsigned. Reports and summaries only disagree after a manual edit,
+                    # rebuild_attendance_summaries sets them right.
+                    summaries.filter(student_id__in=to_remove, sessions_attended__gt=0).update(
+                        sessions_attended=F('sessions_attended') - 1, date_updated=now
+                    )
+    except IntegrityError:
+        # The reports of unknown students, SQLite checks the foreign keys when the transaction commits
+        raise AttendanceError('One or more selected students do not exist.')
+
+    return sorted((current | to_add) - to_remove)
+
+
+def rebuild_attendance_summaries(apps=global_apps, batch_size=SUMMARY_BATCH_SIZE):
+    """
+    Replace every AttendanceSummary row with counts computed from the attendance entries and reports.
+    Each enrolled student gets a row per subject and school year. The sessions held are the attendance entries of
+    the student's section, the sessions attended the ones with a report for the student. Reads each table once with
+    a grouped query instead of counting per student.
+    :param apps: app registry the models are taken from, the migration that creates the table passes its own
+    :return: number of rows written
+    """
+    Attendance = apps.get_model('sms_main', 'Attendance')
+    AttendanceReport = apps.get_model('sms_main', 'AttendanceReport')
+    AttendanceSummary = apps.get_model('sms_main', 'AttendanceSummary')
+    OfferedSubject = apps.get_model('sms_main', 'OfferedSubject')
+
+    held = {
+        (row['subject_id'], row['section_id'], row['school_year']): row['sessions']
+        for row in Attendance.objects.values('subject_id', 'section_id', 'school_year').annotate(sessions=Count('id'))
+    }
+    attended = {
+        (row['student_id'], row['attendance_id__subject_id'], row['attendance_id__section_id'],
+         row['attendance_id__school_year']): row['sessions']
+        for row in AttendanceReport.objects.values(
+            'student_id', 'attendance_id__subject_id', 'attendance_id__section_id', 'attendance_id__school_year'
+        ).annotate(sessions=Count('id'))
+    }
+    enrolments = OfferedSubject.objects.values_list('student_id', 'subject_id', 'school_year',
+                                                    'student_id__section').distinct().iterator()
+
+    count = 0
+    with transaction.atomic():
+        AttendanceSummary.objects.all().delete()
+        batch = []
+        for student_id, subject_id, school_year_id, section_id in enrolments:
+            batch.append(AttendanceSummary(
+                student_id_id=student_id, subject_id_id=subject_id, school_year_id=school_year_id,
+                sessions_held=held.get((subject_id, section_id, school_year_id), 0),
+                sessions_attended=attended.get((student_id, subject_id, section_id, school_year_id), 0),
+            ))
+            if len(batch) >= batch_size:
+                AttendanceSummary.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        AttendanceSummary.objects.bulk_create(batch)
+        count += len(batch)
+    return count
@@ -0,0 +1,160 @@
+import queue
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql import base, creation
+from psycopg2 import extensions
+
+# Connection pools of the process, one per database and connection parameters, shared by its threads
+POOLS = {}
+POOLS_LOCK = threading.Lock()
+
+
+class PoolTimeout(base.Database.OperationalError):
+    """Raised when no pooled connection was free within the timeout"""
+
+
+class ConnectionPool:
+    """At most max_size connections to one database, idle ones are kept for the next request"""
+
+    def __init__(self, max_size, timeout):
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.max_size = max_size
+        self.timeout = timeout
+
+    def get(self, connect, check):
+        """
+        An idle connection, or a new one from connect() while the pool is not full
+        :param connect: callable opening a connection
+        :param check: callable returning whether an idle connection still works
+        """
+        if not self.slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f'No database connection was free within {self.timeout:g} s, all {self.max_size} '
+                              f'are in use.')
+        try:
+            while True:
+                try:
+                    connection = self.idle.get_nowait()
+                except queue.Empty:
+                    return connect()
+                if check(connection):
+                    return connection
+                connection.close()
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def put(self, connection):
+        """Give a connection back, it is closed when it broke or a transaction was left open"""
+        try:
+            if not connection.closed and connection.get_transaction_status() == extensions.TRANSACTION_STATUS_IDLE:
+                self.idle.put(connection)
+            else:
+                connection.close()
+        finally:
+            self.slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def close_pools():
+    """Close the idle connections of every pool, e.g. before dropping the test database"""
+    with POOLS_LOCK:
+        for pool in POOLS.values():
+            pool.close()
+        POOLS.clear()
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Idle pooled connections to the test database would prevent dropping it
+        close_pools()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL backend adding two options of later Django versions:
+    CONN_HEALTH_CHECKS (Django 4.1) checks a persistent connection still works before the first query of a request
+    instead of failing that request when the server closed it.
+    OPTIONS['pool'] (Django 5.1), e.g. {'max_size': 20, 'timeout': 30}, shares up to max_size connections between
+    the threads of the process. A request takes one on its first query and gives it back when it ends, so
+    CONN_MAX_AGE must be 0. Size it to the threads of the process and keep processes * max_size below the
+    max_connections of the server.
+    """
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+
+    @property
+    def pool_options(self):
+        return self.settings_dict['OPTIONS'].get('pool')
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # Not a psycopg2.connect() argument
+        params.pop('pool', None)
+        if self.pool_options and self.settings_dict['CONN_MAX_AGE']:
+            raise ImproperlyConfigured('A connection pool replaces persistent connections, set CONN_MAX_AGE to 0 '
+                                       'when OPTIONS["pool"] is used.')
+        return params
+
+    def get_pool(self, conn_params):
+        key = (self.alias, repr(sorted(conn_params.items())))
+        with POOLS_LOCK:
+            if key not in POOLS:
+                POOLS[key] = ConnectionPool(self.pool_options['max_size'], self.pool_options.get('timeout', 30))
+            return POOLS[key]
+
+    def get_new_connection(self, conn_params):
+        if not self.pool_options:
+            return super().get_new_connection(conn_params)
+        self.pool = self.get_pool(conn_params)
+        return self.pool.get(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params),
+                             self.connection_works)
+
+    def connection_works(self, connection):
+        if not self.settings_dict.get('CONN_HEALTH_CHECKS'):
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except base.Database.Error:
+            return False
+        return True
+
+    def connect(self):
+        super().connect()
+        # New or just taken from the pool after a check, it does not need another one
+        self.health_check_done = True
+
+    def _close(self):
+        if self.connection is not None and self.pool_options:
+            self.pool.put(self.connection)
+        else:
+            super()._close()
+
+    def close_if_unusable_or_obsolete(self):
+        # Called when a request starts and ends, the next query checks the connection again
+        self.health_check_done = False
+        super().close_if_unusable_or_obsolete()
+
+    def close_if_health_check_failed(self):
+        if self.connection is None or self.health_check_done or not self.settings_dict.get('CONN_HEALTH_CHECKS'):
+            return
+        if not self.is_usable():
+            self.close()
+        self.health_check_done = True
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
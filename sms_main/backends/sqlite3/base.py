@@ -0,0 +1,27 @@
+from django.db.backends.sqlite3 import base
+
+from sms_main.sqlite import apply_pragmas, configured_pragmas
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite backend applying SQLITE_PRAGMAS to every new connection and accepting OPTIONS['transaction_mode'].
+    With 'IMMEDIATE', transaction.atomic() takes the write lock when it starts. A deferred transaction that reads
+    before writing fails at once with "database is locked" when another connection wrote in between, busy_timeout
+    does not help it. Django 5.1 has the same option built in.
+    """
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # Not a sqlite3.connect() argument
+        params.pop('transaction_mode', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        apply_pragmas(conn, configured_pragmas())
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        self.cursor().execute(f'BEGIN {mode}' if mode else 'BEGIN')
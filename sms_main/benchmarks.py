@@ -0,0 +1,446 @@
+import time
+from contextlib import contextmanager
+from datetime import date
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from .models import (CustomUserProfile, Staff, Student, Course, CourseSection, SchoolYearModel, Subject,
+                     OfferedSubject)
+from .provisioning import provision_user, update_user
+
+# Registry of the available benchmark scenarios, filled by the @scenario decorator
+SCENARIOS = {}
+
+
+def scenario(name):
+    """Register a benchmark scenario under the given name"""
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+    return decorator
+
+
+@contextmanager
+def rollback():
+    """Run the block inside a transaction that is always rolled back so benchmarks leave no data behind"""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def measure(func, *args, **kwargs):
+    """
+    Call func and return the number of queries it ran and the elapsed time in milliseconds
+    :return: (result, query count, elapsed ms)
+    """
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = (time.perf_counter() - start) * 1000
+    return result, len(queries.captured_queries), elapsed
+
+
+def make_class(size, prefix='bench'):
+    """
+    Create a course, section, school year, staff and subject with `size` enrolled students.
+    Rows are written with bulk_create so building the fixture stays cheap for large classes.
+    :return: dict of the created objects
+    """
+    course = Course.objects.create(course_name=f'{prefix} course')
+    section = CourseSection.objects.create(section_name=f'{prefix} section', course_id=course)
+    school_year = SchoolYearModel.objects.create(school_year_start=date(2020, 6, 1), school_year_end=date(2021, 3, 31))
+    staff_user = CustomUserProfile(email=f'{prefix}.staff@example.com', first_name='Staff', middle_initial='S',
+                                   last_name=prefix, user_level=2, password='!')
+    provision_user(staff_user)
+    subject = Subject.objects.create(subject_name=f'{prefix} subject', staff_id=staff_user, course_id=course)
+
+    CustomUserProfile.objects.bulk_create([
+        CustomUserProfile(email=f'{prefix}.student{i}@example.com', first_name=f'First{i}', middle_initial='M',
+                          last_name=f'Last{i}', user_level=3, password='!')
+        for i in range(size)
+    ])
+    profiles = CustomUserProfile.objects.filter(email__startswith=f'{prefix}.student').values_list('id', flat=True)
+    Student.objects.bulk_create([
+        Student(user_profile_id=profile_id, course_id=course, section=section, school_year=school_year,
+                year_level=Student.Levels.FIRSTYEAR)
+        for profile_id in profiles
+    ])
+    students = Student.objects.filter(section=section).values_list('id', flat=True)
+    OfferedSubject.objects.bulk_create([
+        OfferedSubject(subject_id=subject, student_id_id=student_id, school_year=school_year)
+        for student_id in students
+    ])
+    return {
+        'course': course,
+        'section': section,
+        'school_year': school_year,
+        'staff': staff_user,
+        'subject': subject,
+        'user_profile_ids': list(profiles),
+        'student_ids': list(students),
+    }
+
+
+@scenario('attendance-create')
+def bench_attendance_create(sizes=(10, 60, 240)):
+    """Query count and time of create_attendance for growing class sizes"""
+    from .attendance import create_attendance
+
+    results = []
+    for size in sizes:
+        with rollback():
+            fixture = make_class(size)
+            _, queries, elapsed = measure(create_attendance, fixture['subject'], fixture['section'],
+                                          fixture['school_year'], fixture['user_profile_ids'])
+            results.append({'students': size, 'queries': queries, 'ms': round(elapsed, 2)})
+    return results
+
+
+@scenario('attendance-update')
+def bench_attendance_update(sizes=(10, 60, 240)):
+    """Query count and time of update_attendance flipping half of the class"""
+    from .attendance import create_attendance, update_attendance
+
+    results = []
+    for size in sizes:
+        with rollback():
+            fixture = make_class(size)
+            half = fixture['user_profile_ids'][:size // 2]
+            attendance = create_attendance(fixture['subject'], fixture['section'], fixture['school_year'], half)
+            # Mark the absent half present and the present half absent
+            id_list = [{'id': student_id, 'status': index >= size // 2}
+                       for index, student_id in enumerate(fixture['student_ids'])]
+            present, queries, elapsed = measure(update_attendance, attendance.id, id_list)
+            assert len(present) == size - size // 2
+            results.append({'students': size, 'queries': queries, 'ms': round(elapsed, 2)})
+    return results
+
+
+@scenario('attendance-matrix')
+def bench_attendance_matrix(students=80, sessions=120, present_rate=0.9):
+    """Queries and time of the term attendance matrix of one class, built in memory and encoded as JSON"""
+    import random
+    from datetime import timedelta
+
+    from .models import Attendance, AttendanceReport
+    from .rosters import attendance_matrix
+    from .serialization import dumps
+
+    rng = random.Random(0)
+    results = []
+    with rollback():
+        fixture = make_class(students)
+        first_day = fixture['school_year'].school_year_start
+        Attendance.objects.bulk_create([
+            Attendance(subject_id=fixture['subject'], section_id=fixture['section'],
+                       school_year=fixture['school_year'], attendance_day=first_day + timedelta(days=day))
+            for day in range(sessions)
+        ])
+        attendance_ids = Attendance.objects.filter(subject_id=fixture['subject']).values_list('id', flat=True)
+        AttendanceReport.objects.bulk_create([
+            AttendanceReport(attendance_id_id=attendance_id, student_id_id=student_id)
+            for attendance_id in attendance_ids for student_id in fixture['student_ids']
+            if rng.random() < present_rate
+        ])
+        args = (fixture['subject'].id, fixture['section'].id, fixture['school_year'].id, fixture['staff'].id)
+        # Best of three runs so the first run does not pay for warming the database pages
+        runs = [measure(lambda: dumps(attendance_matrix(*args))) for _ in range(3)]
+        data, queries, elapsed = min(runs, key=lambda run: run[2])
+        results.append({'students': students, 'sessions': sessions, 'queries': queries, 'bytes': len(data),
+                        'ms': round(elapsed, 2)})
+    return results
+
+
+@scenario('export-csv')
+def bench_export_csv(students=100, sessions=(10, 100, 1000)):
+    """
+    Time to the first and the last chunk and peak Python memory of the streamed attendance export, for terms of
+    a growing number of sessions. Memory should stay flat while the rows grow.
+    """
+    import tracemalloc
+    from datetime import timedelta
+
+    from .exports import ATTENDANCE, iter_csv
+    from .models import Attendance, AttendanceReport
+
+    results = []
+    with rollback():
+        fixture = make_class(students)
+        first_day = fixture['school_year'].school_year_start
+        Attendance.objects.bulk_create([
+            Attendance(subject_id=fixture['subject'], section_id=fixture['section'],
+                       school_year=fixture['school_year'], attendance_day=first_day + timedelta(days=day))
+            for day in range(max(sessions))
+        ])
+        attendance_ids = Attendance.objects.filter(subject_id=fixture['subject']).values_list('id', flat=True)
+        AttendanceReport.objects.bulk_create([
+            AttendanceReport(attendance_id_id=attendance_id, student_id_id=student_id)
+            for attendance_id in attendance_ids for student_id in fixture['student_ids']
+        ], batch_size=5000)
+
+        for count in sessions:
+            queryset = AttendanceReport.objects.filter(
+                attendance_id__subject_id=fixture['subject'],
+                attendance_id__attendance_day__lt=first_day + timedelta(days=count)
+            ).order_by('attendance_id__date_created', 'attendance_id', 'student_id')
+            tracemalloc.start()
+            start = time.perf_counter()
+            chunks = iter_csv(ATTENDANCE.header, ATTENDANCE.rows(queryset))
+            size = len(next(chunks))
+            first_chunk = (time.perf_counter() - start) * 1000
+            size += sum(len(chunk) for chunk in chunks)
+            elapsed = (time.perf_counter() - start) * 1000
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results.append({'rows': count * students, 'bytes': size, 'first_chunk_ms': round(first_chunk, 2),
+                            'ms': round(elapsed, 2), 'peak_kib': round(peak / 1024)})
+    return results
+
+
+@scenario('serialize-json')
+def bench_serialize_json(size=10000):
+    """Time to encode the students of a class with django.core.serializers and with the projection encoder"""
+    from django.core import serializers
+
+    from . import serialization
+
+    fields = ('id', 'first_name', 'middle_initial', 'last_name')
+
+    def projection():
+        return b''.join(serialization.iter_projection(students.all(), fields))
+
+    def projection_stdlib():
+        # Same encoder with the orjson fast path switched off
+        orjson, serialization.orjson = serialization.orjson, None
+        try:
+            return projection()
+        finally:
+            serialization.orjson = orjson
+
+    encoders = [('django-serializer', lambda: serializers.serialize('json', students.all(), fields=fields).encode()),
+                ('projection-json', projection_stdlib)]
+    if serialization.orjson is not None:
+        encoders.append(('projection-orjson', projection))
+
+    results = []
+    with rollback():
+        fixture = make_class(size)
+        students = CustomUserProfile.objects.filter(student__section=fixture['section'])
+        for name, encode in encoders:
+            # Best of three runs so the first run does not pay for warming the database pages
+            runs = [measure(encode) for _ in range(3)]
+            data, queries, elapsed = min(runs, key=lambda run: run[2])
+            results.append({'encoder': name, 'rows': size, 'queries': queries, 'bytes': len(data),
+                            'ms': round(elapsed, 2)})
+    return results
+
+
+@scenario('provisioning')
+def bench_provisioning(subject_counts=(0, 5, 20)):
+    """Queries run when creating, editing and logging in staff and students"""
+    from django.contrib.auth import user_logged_in
+    from django.test import RequestFactory
+
+    results = []
+    with rollback():
+        fixture = make_class(0)
+        subjects = [fixture['subject']] + [
+            Subject.objects.create(subject_name=f'bench subject {i}', staff_id=fixture['staff'],
+                                   course_id=fixture['course'])
+            for i in range(max(subject_counts) - 1)
+        ]
+
+        def new_user(email, user_level):
+            return CustomUserProfile(email=email, first_name='First', middle_initial='M', last_name='Last',
+                                     user_level=user_level, password='!')
+
+        staff, queries, elapsed = measure(provision_user, new_user('bench.new.staff@example.com', 2),
+                                          address='Somewhere')
+        results.append({'path': 'create staff', 'queries': queries, 'ms': round(elapsed, 2)})
+
+        for count in subject_counts:
+            student, queries, elapsed = measure(
+                provision_user, new_user(f'bench.new.student{count}@example.com', 3), subjects=subjects[:count],
+                gender='F', address='Somewhere', course_id=fixture['course'], section=fixture['section'],
+                school_year=fixture['school_year'], year_level=Student.Levels.FIRSTYEAR
+            )
+            results.append({'path': f'create student with {count} subjects', 'queries': queries,
+                            'ms': round(elapsed, 2)})
+
+        user = student.user_profile
+        user.first_name = 'Edited'
+        _, queries, elapsed = measure(update_user, user, address='Elsewhere', gender='M')
+        results.append({'path': 'edit student', 'queries': queries, 'ms': round(elapsed, 2)})
+
+        user = staff.user_profile
+        user.last_name = 'Edited'
+        _, queries, elapsed = measure(update_user, user, address='Elsewhere')
+        results.append({'path': 'edit staff', 'queries': queries, 'ms': round(elapsed, 2)})
+
+        # Sent by django.contrib.auth.login(), its update_last_login receiver saves last_login
+        request = RequestFactory().get('/')
+        _, queries, elapsed = measure(user_logged_in.send, sender=CustomUserProfile, request=request, user=user)
+        results.append({'path': 'login (last_login update)', 'queries': queries, 'ms': round(elapsed, 2)})
+    return results
+
+
+@scenario('request-identity')
+def bench_request_identity(url_names=('staff-dashboard', 'staff-leave-report', 'staff-feedback')):
+    """Queries per staff page with the database session/user lookups and with the cached request identity"""
+    from django.test import Client, override_settings
+    from django.urls import reverse
+
+    modes = [
+        ('db session + ModelBackend', {'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+                                       'AUTHENTICATION_BACKENDS': ['django.contrib.auth.backends.ModelBackend']}),
+        ('cached identity', {}),
+    ]
+    results = []
+    with rollback():
+        fixture = make_class(0)
+        for mode, overrides in modes:
+            with override_settings(**overrides):
+                client = Client(HTTP_HOST='localhost')
+                client.force_login(fixture['staff'])
+                for url_name in url_names:
+                    url = reverse(url_name)
+                    for run in ('first', 'warm'):
+                        response, queries, elapsed = measure(client.get, url)
+                        assert response.status_code == 200, (url, response.status_code)
+                        results.append({'mode': mode, 'page': url_name, 'request': run, 'queries': queries,
+                                        'ms': round(elapsed, 2)})
+    return results
+
+
+@scenario('login')
+def bench_login(iteration_counts=None, logins=10):
+    """Password hashes, queries and logins per second on one core through the login view, per PBKDF2 work factor"""
+    from unittest import mock
+
+    from django.conf import settings
+    from django.contrib.auth import hashers
+    from django.test import Client, override_settings
+    from django.urls import reverse
+
+    if iteration_counts is None:
+        iteration_counts = sorted({settings.PASSWORD_HASH_ITERATIONS, 100000, 20000}, reverse=True)
+
+    results = []
+    with rollback():
+        user = make_class(0)['staff']
+        for iterations in iteration_counts:
+            with override_settings(PASSWORD_HASH_ITERATIONS=iterations):
+                # Hash with the measured work factor so the logins do not upgrade the stored hash
+                user.set_password('bench-Password-1')
+                user.save(update_fields=['password'])
+                client = Client(HTTP_HOST='localhost')
+                data = {'username': user.email, 'password': 'bench-Password-1', 'user_level': user.user_level}
+
+                with mock.patch.object(hashers, 'pbkdf2', wraps=hashers.pbkdf2) as pbkdf2:
+                    start = time.perf_counter()
+                    for _ in range(logins):
+                        response, queries, _ = measure(client.post, reverse('login'), data)
+                        assert response.status_code == 302, response.status_code
+                    elapsed = time.perf_counter() - start
+                results.append({'iterations': iterations, 'hashes_per_login': pbkdf2.call_count / logins,
+                                'queries_per_login': queries, 'ms_per_login': round(elapsed / logins * 1000, 2),
+                                'logins_per_second_per_core': round(logins / elapsed, 1)})
+    return results
+
+
+@scenario('instrumentation-overhead')
+def bench_instrumentation_overhead(queries=100000, requests=5000):
+    """Cost the instrumentation middleware adds per query and per request"""
+    from django.http import HttpResponse
+    from django.test import RequestFactory
+
+    from .instrumentation import InstrumentationMiddleware, QueryRecorder, RECENT
+
+    def timed(first, second):
+        # Best of five alternating runs of both variants. Database round trips are left out, they vary far more
+        # between runs than the few microseconds measured here.
+        runs = ([], [])
+        for _ in range(5):
+            for func, times in zip((first, second), runs):
+                start = time.perf_counter()
+                func()
+                times.append((time.perf_counter() - start) * 1000)
+        return min(runs[0]), min(runs[1])
+
+    execute = lambda sql, params, many, context: None
+    recorder = QueryRecorder()
+    sql = 'SELECT "sms_main_course"."id" FROM "sms_main_course" WHERE "sms_main_course"."id" = %s'
+
+    def run_queries():
+        for i in range(queries):
+            execute(sql, (i,), False, None)
+
+    def run_queries_recorded():
+        for i in range(queries):
+            recorder(execute, sql, (i,), False, None)
+
+    plain = lambda request: HttpResponse(b'ok')
+    middleware = InstrumentationMiddleware(plain)
+    request = RequestFactory().get('/')
+
+    def run_requests(handler):
+        for _ in range(requests):
+            handler(request)
+
+    results = []
+    base, recorded = timed(run_queries, run_queries_recorded)
+    results.append({'measure': 'per query', 'overhead_us': round((recorded - base) / queries * 1000, 2)})
+    base, recorded = timed(lambda: run_requests(plain), lambda: run_requests(middleware))
+    RECENT.clear()
+    results.append({'measure': 'per request', 'overhead_us': round((recorded - base) / requests * 1000, 2)})
+    return results
+
+
+@scenario('sqlite-writes')
+def bench_sqlite_writes(worker_counts=(1, 2, 4, 8), seconds=3, class_size=40):
+    """Attendance writes per second from several processes on one SQLite file, per pragma profile and BEGIN mode"""
+    import os
+    import sqlite3
+    import tempfile
+    from multiprocessing import Pool
+
+    from .instrumentation import percentile
+    from .models import Attendance, AttendanceReport
+    from .sqlite import apply_pragmas, attendance_writer, configured_pragmas
+
+    if connection.vendor != 'sqlite':
+        return [{'skipped': f'the database is {connection.vendor}, not SQLite'}]
+    # Same tables, indexes and constraints as the project database, in a scratch file
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE tbl_name IN (%s, %s) AND sql IS NOT NULL ORDER BY type DESC",
+            [Attendance._meta.db_table, AttendanceReport._meta.db_table]
+        )
+        schema = [sql for sql, in cursor.fetchall()]
+
+    profiles = [('sqlite defaults', {}, 'BEGIN'), ('SQLITE_PRAGMAS', configured_pragmas(), 'BEGIN'),
+                ('SQLITE_PRAGMAS + IMMEDIATE', configured_pragmas(), 'BEGIN IMMEDIATE')]
+    results = []
+    for profile, pragmas, begin in profiles:
+        for workers in worker_counts:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                db = sqlite3.connect(path)
+                apply_pragmas(db, pragmas)
+                for sql in schema:
+                    db.execute(sql)
+                db.commit()
+                db.close()
+
+                start_at = time.time() + 0.5
+                with Pool(workers) as pool:
+                    runs = pool.starmap(attendance_writer, [
+                        (path, pragmas, begin, worker, start_at, seconds, class_size) for worker in range(workers)
+                    ])
+            durations = [duration for run, _ in runs for duration in run]
+            results.append({'profile': profile, 'workers': workers, 'writes': len(durations),
+                            'writes_per_s': round(len(durations) / seconds, 1),
+                            'locked_errors': sum(errors for _, errors in runs),
+                            'p95_ms': round(percentile(durations, 0.95), 2) if durations else None})
+    return results
@@ -0,0 +1,289 @@
+import random
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connections, router, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import lookups
+from .attendance import rebuild_attendance_summaries
+from .models import (CustomUserProfile, AdminHOD, Staff, Student, Course, CourseSection, SchoolYearModel, Subject,
+                     OfferedSubject, Attendance, AttendanceReport, StaffFeedBack, LeaveReportStaff)
+
+# Rows written per INSERT
+BATCH_SIZE = 2000
+
+# Share of the enrolled students marked present in a generated attendance entry
+PRESENT_RATE = 0.9
+
+# Start year of the latest generated school year, fixed so the same seed always gives the same dates
+LAST_SCHOOL_YEAR = 2020
+
+# Password of every generated user
+DEFAULT_PASSWORD = 'password'
+
+# Named dataset sizes. 'tiny' is used by the test suite, 'small' is the test suite's check that query counts do not
+# grow with the data: its student, staff, feedback and leave lists and its classes are longer than a 50-row page.
+# 'realistic' is a mid-sized school with a year of weekly attendance for every subject.
+SCALES = {
+    'tiny': {
+        'courses': 3,
+        'sections_per_course': 2,
+        'subjects_per_course': 4,
+        'subjects_per_student': 3,
+        'staff': 4,
+        'students': 60,
+        'school_years': 2,
+        'attendance_days': 4,
+        'feedback': 10,
+        'leave': 10,
+    },
+    'small': {
+        'courses': 3,
+        'sections_per_course': 1,
+        'subjects_per_course': 2,
+        'subjects_per_student': 2,
+        'staff': 60,
+        'students': 300,
+        'school_years': 1,
+        'attendance_days': 3,
+        'feedback': 60,
+        'leave': 60,
+    },
+    'realistic': {
+        'courses': 50,
+        'sections_per_course': 4,
+        'subjects_per_course': 10,
+        'subjects_per_student': 5,
+        'staff': 100,
+        'students': 20000,
+        'school_years': 1,
+        'attendance_days': 36,
+        'feedback': 1000,
+        'leave': 1000,
+    },
+}
+
+FIRST_NAMES = ('Maria', 'Jose', 'Juan', 'Ana', 'Mark', 'Angel', 'John', 'Grace', 'Paolo', 'Joy', 'Carlo', 'Rose',
+               'Miguel', 'Andrea', 'Rafael', 'Camille', 'Daniel', 'Bea', 'Gabriel', 'Nicole')
+LAST_NAMES = ('Santos', 'Reyes', 'Cruz', 'Bautista', 'Garcia', 'Mendoza', 'Torres', 'Flores', 'Ramos', 'Villanueva',
+              'Dela Cruz', 'Castillo', 'Aquino', 'Navarro', 'Domingo', 'Salazar', 'Rivera', 'Lopez', 'Gonzales',
+              'Dimayacyac')
+
+
+def insert(model, objects, batch_size=BATCH_SIZE, return_ids=True):
+    """
+    Write objects with bulk_create, batch_size rows at a time, without holding them all in memory.
+    SQLite does not return the primary keys of bulk inserts, so the new ids are read back as the ids above the
+    previous maximum. Nothing else may write to the table meanwhile.
+    :param objects: iterable of unsaved instances
+    :return: ids of the new rows in insertion order, the number of rows when return_ids is False
+    """
+    last_id = model.objects.aggregate(last=Max('id'))['last'] or 0
+    count = 0
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) >= batch_size:
+            model.objects.bulk_create(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+        count += len(batch)
+    if not return_ids:
+        return count
+    return list(model.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True))
+
+
+def insert_rows(model, fields, rows, batch_size=BATCH_SIZE, return_ids=False):
+    """
+    Write value tuples straight to the table of model with executemany, batch_size rows at a time.
+    Used for the large tables: building a model instance and preparing every value of every row is most of the
+    time bulk_create takes. Values must already be in their database form, see db_value().
+    :param fields: model field names, in the order of the values in each row
+    :param rows: iterable of tuples
+    :return: ids of the new rows in insertion order when return_ids is set, the number of rows otherwise
+    """
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(model._meta.get_field(name).column) for name in fields)
+    sql = f"INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES ({', '.join(['%s'] * len(fields))})"
+    last_id = model.objects.aggregate(last=Max('id'))['last'] or 0
+    count = 0
+    with connection.cursor() as cursor:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                cursor.executemany(sql, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+            count += len(batch)
+    if not return_ids:
+        return count
+    return list(model.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True))
+
+
+def db_value(model, field_name, value):
+    """value of a model field in the form insert_rows() expects"""
+    field = model._meta.get_field(field_name)
+    return field.get_db_prep_save(value, connections[router.db_for_write(model)])
+
+
+def class_days(school_year, count):
+    """count weekdays spread evenly over a school year"""
+    weekdays = []
+    day = school_year.school_year_start
+    while day <= school_year.school_year_end:
+        if day.weekday() < 5:
+            weekdays.append(day)
+        day += timedelta(days=1)
+    step = max(len(weekdays) // max(count, 1), 1)
+    return weekdays[::step][:count]
+
+
+def at_class_time(day):
+    value = datetime.combine(day, time(8))
+    return timezone.make_aware(value) if settings.USE_TZ else value
+
+
+def generate_dataset(seed=0, prefix='sms', password=DEFAULT_PASSWORD, batch_size=BATCH_SIZE, **scale):
+    """
+    Fill the database with a reproducible, randomly generated school.
+    Rows are written in batches with bulk_create and executemany, so no signal runs; the cached lookups and totals
+    are invalidated once at the end instead. The same seed and scale always produce the same data.
+    :param seed: seed of the random generator
+    :param prefix: start of the email address of every generated user, e.g. sms.student12@example.com
+    :param password: password of every generated user, hashed once
+    :param batch_size: rows written per INSERT
+    :param scale: courses, sections_per_course, subjects_per_course, subjects_per_student, staff, students,
+                  school_years, attendance_days, feedback and leave. Missing values are taken from SCALES['tiny'].
+    :return: dict of the number of rows written per model
+    """
+    scale = dict(SCALES['tiny'], **scale)
+    if scale['staff'] < 1:
+        raise ValueError('At least one staff member is needed to teach the subjects.')
+    if scale['school_years'] < 1:
+        raise ValueError('At least one school year is needed to enrol the students in.')
+    if not scale['courses'] and (scale['students'] or scale['subjects_per_course']):
+        raise ValueError('Students and subjects need at least one course.')
+    if not scale['sections_per_course'] and scale['students']:
+        raise ValueError('Students need at least one section per course.')
+    rng = random.Random(seed)
+    password = make_password(password)
+    counts = {}
+
+    def user(kind, number, level):
+        return CustomUserProfile(email=f'{prefix}.{kind}{number}@example.com', first_name=rng.choice(FIRST_NAMES),
+                                 middle_initial=chr(rng.randrange(65, 91)), last_name=rng.choice(LAST_NAMES),
+                                 user_level=level, password=password)
+
+    with transaction.atomic():
+        school_years = [
+            SchoolYearModel(school_year_start=date(year, 6, 1), school_year_end=date(year + 1, 3, 31))
+            for year in range(LAST_SCHOOL_YEAR - scale['school_years'] + 1, LAST_SCHOOL_YEAR + 1)
+        ]
+        for school_year, school_year_id in zip(school_years, insert(SchoolYearModel, school_years, batch_size)):
+            school_year.id = school_year_id
+        counts['school_years'] = len(school_years)
+
+        admin_id, = insert(CustomUserProfile, [user('admin', '', 1)], batch_size)
+        insert(AdminHOD, [AdminHOD(user_profile_id=admin_id)], batch_size, return_ids=False)
+        staff_user_ids = insert(CustomUserProfile, (user('staff', i, 2) for i in range(scale['staff'])), batch_size)
+        staff_ids = insert(Staff, (Staff(user_profile_id=user_id, address='Generated')
+                                   for user_id in staff_user_ids), batch_size)
+        counts['staff'] = len(staff_ids)
+
+        course_ids = insert(Course, (Course(course_name=f'Course {i + 1:03}')
+                                     for i in range(scale['courses'])), batch_size)
+        sections = {}
+        section_ids = insert(CourseSection, (CourseSection(section_name=f'{chr(65 + i % 26)}{i // 26 or ""}',
+                                                           course_id_id=course_id)
+                                             for course_id in course_ids
+                                             for i in range(scale['sections_per_course'])), batch_size)
+        for index, section_id in enumerate(section_ids):
+            sections.setdefault(course_ids[index // scale['sections_per_course']], []).append(section_id)
+        subjects = {}
+        subject_ids = insert(Subject, (Subject(subject_name=f'Subject {number + 1:03}-{i + 1:02}',
+                                               staff_id_id=rng.choice(staff_user_ids), course_id_id=course_id)
+                                       for number, course_id in enumerate(course_ids)
+                                       for i in range(scale['subjects_per_course'])), batch_size)
+        for index, subject_id in enumerate(subject_ids):
+            subjects.setdefault(course_ids[index // scale['subjects_per_course']], []).append(subject_id)
+        counts['courses'], counts['sections'], counts['subjects'] = len(course_ids), len(section_ids), len(subject_ids)
+
+        student_user_ids = insert(CustomUserProfile, (user('student', i, 3) for i in range(scale['students'])),
+                                  batch_size)
+        placements = [(rng.choice(course_ids), rng.randrange(scale['sections_per_course']), rng.choice(school_years))
+                      for _ in student_user_ids]
+        student_ids = insert(Student, (
+            Student(user_profile_id=user_id, gender=rng.choice('MF'), address='Generated', course_id_id=course_id,
+                    section_id=sections[course_id][section], school_year_id=school_year.id,
+                    year_level=rng.choice(Student.Levels.values[1:]))
+            for user_id, (course_id, section, school_year) in zip(student_user_ids, placements)
+        ), batch_size)
+        counts['students'] = len(student_ids)
+
+        # Students of each (subject, section, school year), the classes attendance is taken for
+        classes = {}
+        for student_id, (course_id, section, school_year) in zip(student_ids, placements):
+            offered = subjects.get(course_id, [])
+            for subject_id in rng.sample(offered, min(scale['subjects_per_student'], len(offered))):
+                classes.setdefault((subject_id, sections[course_id][section], school_year), []).append(student_id)
+        now = db_value(OfferedSubject, 'date_created', timezone.now())
+        counts['enrolments'] = insert_rows(
+            OfferedSubject, ('subject_id', 'student_id', 'school_year', 'date_created', 'date_updated'),
+            ((subject_id, student_id, school_year.id, now, now)
+             for (subject_id, _, school_year), students in classes.items() for student_id in students),
+            batch_size
+        )
+
+        # Every class meets on the same days of its school year, each attendance entry is dated on its day
+        days = {school_year.id: [(db_value(Attendance, 'attendance_date', at_class_time(day)),
+                                  db_value(Attendance, 'attendance_day', day))
+                                 for day in class_days(school_year, scale['attendance_days'])]
+                for school_year in school_years}
+        sessions = [(key, day) for key in classes for day in days[key[2].id]]
+        attendance_ids = insert_rows(
+            Attendance, ('subject_id', 'section_id', 'school_year', 'attendance_date', 'attendance_day',
+                         'date_created', 'date_updated'),
+            ((subject_id, section_id, school_year.id, taken, day, taken, taken)
+             for (subject_id, section_id, school_year), (taken, day) in sessions),
+            batch_size, return_ids=True
+        )
+        counts['attendance'] = len(attendance_ids)
+        # Like create_attendance, a report row is written for each present student only
+        counts['attendance_reports'] = insert_rows(
+            AttendanceReport, ('student_id', 'attendance_id', 'status', 'date_created', 'date_updated'),
+            ((student_id, attendance_id, False, taken, taken)
+             for attendance_id, (key, (taken, _)) in zip(attendance_ids, sessions)
+             for student_id in classes[key] if rng.random() < PRESENT_RATE),
+            batch_size
+        )
+        # The rows above bypass create_attendance, compute the summaries once from all of them
+        counts['attendance_summaries'] = rebuild_attendance_summaries(batch_size=batch_size)
+
+        latest = school_years[-1]
+        counts['feedback'] = insert(StaffFeedBack, (
+            StaffFeedBack(staff_id_id=rng.choice(staff_ids), feedback=f'Generated feedback {i + 1}',
+                          **({'feedback_reply': f'Generated reply {i + 1}', 'date_replied': timezone.now()}
+                             if rng.random() < 0.5 else {}))
+            for i in range(scale['feedback'])
+        ), batch_size, return_ids=False)
+        leave_days = class_days(latest, scale['leave']) or [latest.school_year_start]
+        counts['leave'] = insert(LeaveReportStaff, (
+            LeaveReportStaff(staff_id_id=rng.choice(staff_ids), leave_start_date=start,
+                             leave_end_date=start + timedelta(days=rng.randrange(5)),
+                             leave_message=f'Generated leave {i + 1}', leave_status=rng.choice((0, 1, 2)))
+            for i, start in enumerate(rng.choice(leave_days) for _ in range(scale['leave']))
+        ), batch_size, return_ids=False)
+
+    # bulk_create sends no signal, drop the cached lists and totals once for all the new rows
+    for model in (SchoolYearModel, Course, CourseSection, Subject, CustomUserProfile, Student):
+        lookups.bump_generation(model)
+    return counts
@@ -0,0 +1,45 @@
+import hashlib
+
+from django.db.models import Count, Max
+
+
+def make_etag(*parts):
+    return hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def aggregate_validators(build_queryset, date_fields=('date_updated',)):
+    """
+    ETag and Last-Modified functions computed from the newest update time and the row count of a queryset.
+    Both validators come from a single aggregate query per request. They are read from the database, not from the
+    per-process cache, so every worker answers a change the same way. The view must read its rows from the
+    database too, a cached copy could be older than the validators.
+    :param build_queryset: function(request) returning the filtered queryset, or None when parameters are missing
+    :param date_fields: update time fields the newest timestamp is taken from
+    :return: (etag_func, last_modified_func) for django.views.decorators.http.condition
+    """
+    def aggregate(request):
+        if not hasattr(request, '_sms_validators'):
+            queryset = build_queryset(request)
+            validators = None
+            if queryset is not None:
+                result = queryset.aggregate(
+                    row_count=Count('pk'), **{f'max_{index}': Max(field) for index, field in enumerate(date_fields)}
+                )
+                dates = [result[f'max_{index}'] for index in range(len(date_fields))]
+                dates = [value for value in dates if value is not None]
+                validators = (result['row_count'], max(dates) if dates else None)
+            request._sms_validators = validators
+        return request._sms_validators
+
+    def etag_func(request, *args, **kwargs):
+        validators = aggregate(request)
+        if validators is None:
+            return None
+        row_count, last_modified = validators
+        return make_etag(request.path, request.GET.urlencode(), row_count, last_modified)
+
+    def last_modified_func(request, *args, **kwargs):
+        validators = aggregate(request)
+        return validators[1] if validators else None
+
+    return etag_func, last_modified_func
@@ -0,0 +1,186 @@
+import csv
+import io
+import tempfile
+from datetime import datetime
+
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from .models import Student
+
+# Rows read from the database per round trip, and CSV lines sent to the client per chunk
+CHUNK_SIZE = 2000
+
+FORMATS = ('csv', 'xlsx')
+
+
+class ExportError(Exception):
+    """Raised when an export cannot be produced, the message is shown to the user"""
+
+
+def local_datetime(value):
+    """Naive local time, spreadsheets have no time zones"""
+    return timezone.localtime(value).replace(tzinfo=None) if isinstance(value, datetime) else value
+
+
+def label(choices):
+    """Converter showing the label of a stored choice"""
+    labels = dict(choices)
+    return lambda value: labels.get(value, value)
+
+
+class Export:
+    """
+    A downloadable table: the column headers and the values_list() field each column is read from.
+    converters maps a field to a function applied to its values, e.g. choice codes to labels.
+    """
+
+    def __init__(self, name, columns, converters=None):
+        self.name = name
+        self.header = [title for title, _ in columns]
+        self.fields = [field for _, field in columns]
+        self.converters = [(self.fields.index(field), convert) for field, convert in (converters or {}).items()]
+
+    def rows(self, queryset):
+        """
+        Yield the exported rows of queryset. They are read chunk_size at a time with values_list(), no model
+        instance is built and no more than a chunk is held in memory.
+        """
+        rows = queryset.values_list(*self.fields).iterator(chunk_size=CHUNK_SIZE)
+        if not self.converters:
+            yield from rows
+            return
+        for row in rows:
+            row = list(row)
+            for index, convert in self.converters:
+                row[index] = convert(row[index])
+            yield row
+
+    def filename(self, file_format):
+        return f'{self.name}-{timezone.localdate():%Y%m%d}.{file_format}'
+
+
+STUDENTS = Export('students', (
+    ('ID', 'user_profile_id'),
+    ('Email', 'user_profile__email'),
+    ('Last Name', 'user_profile__last_name'),
+    ('First Name', 'user_profile__first_name'),
+    ('Middle Initial', 'user_profile__middle_initial'),
+    ('Gender', 'gender'),
+    ('Course', 'course_id__course_name'),
+    ('Section', 'section__section_name'),
+    ('Year Level', 'year_level'),
+    ('Status', 'stat'),
+    ('School Year Start', 'school_year__school_year_start'),
+    ('School Year End', 'school_year__school_year_end'),
+    ('Active', 'user_profile__is_active'),
+    ('Date Registered', 'date_created'),
+), {
+    'year_level': label(Student.Levels.choices),
+    'stat': label(Student.Status.choices),
+    'date_created': local_datetime,
+})
+
+STAFF_LEAVES = Export('staff-leaves', (
+    ('ID', 'id'),
+    ('Staff Email', 'staff_id__user_profile__email'),
+    ('Last Name', 'staff_id__user_profile__last_name'),
+    ('First Name', 'staff_id__user_profile__first_name'),
+    ('Leave Start Date', 'leave_start_date'),
+    ('Leave End Date', 'leave_end_date'),
+    ('Leave Message', 'leave_message'),
+    ('Leave Status', 'leave_status'),
+    ('Date Applied', 'date_created'),
+), {
+    'leave_status': label(((0, 'Pending'), (1, 'Approved'), (2, 'Rejected'))),
+    'date_created': local_datetime,
+})
+
+# One row per student present at an attendance entry
+ATTENDANCE = Export('attendance', (
+    ('Date', 'attendance_id__attendance_day'),
+    ('Subject', 'attendance_id__subject_id__subject_name'),
+    ('Section', 'attendance_id__section_id__section_name'),
+    ('School Year Start', 'attendance_id__school_year__school_year_start'),
+    ('School Year End', 'attendance_id__school_year__school_year_end'),
+    ('Student ID', 'student_id__user_profile_id'),
+    ('Email', 'student_id__user_profile__email'),
+    ('Last Name', 'student_id__user_profile__last_name'),
+    ('First Name', 'student_id__user_profile__first_name'),
+))
+
+
+def drain(buffer):
+    value = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return value
+
+
+def iter_csv(header, rows, chunk_size=CHUNK_SIZE):
+    """
+    Yield a CSV document in pieces of chunk_size lines.
+    The header comes first, before rows is read, so the download starts before the query runs.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # Byte order mark so Excel reads the file as UTF-8
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    yield drain(buffer)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count == chunk_size:
+            yield drain(buffer)
+            count = 0
+    if count:
+        yield drain(buffer)
+
+
+def write_xlsx(header, rows, title):
+    """
+    Write the rows to a temporary .xlsx file and return it, open at the start.
+    A write-only workbook keeps no row in memory, but the file is a zip archive completed after the last row,
+    so it can only be sent once every row was written.
+    """
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise ExportError('Exporting .xlsx files requires the openpyxl package.')
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+def export_response(export, queryset, file_format='csv'):
+    """
+    Download of the rows of queryset.
+    CSV is streamed as the rows are read, memory use does not grow with the number of rows.
+    :param export: Export describing the columns
+    :param file_format: 'csv' or 'xlsx'
+    :return: StreamingHttpResponse or FileResponse
+    """
+    if file_format not in FORMATS:
+        raise ExportError(f"Unsupported export format '{file_format}', use one of {', '.join(FORMATS)}.")
+    # The rows are read while the response is sent, after the view returned and the routing of the request
+    # (see routers.ReplicaMiddleware) was reset, so the database is chosen now
+    queryset = queryset.using(queryset.db)
+
+    if file_format == 'xlsx':
+        output = write_xlsx(export.header, export.rows(queryset), export.name)
+        return FileResponse(output, as_attachment=True, filename=export.filename(file_format),
+                            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+    response = StreamingHttpResponse(iter_csv(export.header, export.rows(queryset)),
+                                     content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{export.filename(file_format)}"'
+    return response
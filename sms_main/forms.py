@@ -6,10 +6,12 @@ from django.contrib.auth import authenticate, get_user_model, login
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.core.exceptions import ValidationError
 from django.db.models import DateTimeField
+from django.forms.models import ModelChoiceIterator
 from django.http import HttpResponseRedirect
 
 from django.utils.translation import gettext_lazy as _
 
+from . import lookups
 from .models import (Student,
                      Staff,
                      AdminHOD,
@@ -24,19 +26,41 @@ from .models import (Student,
                      CustomUserProfile, SchoolYearModel, CourseSection)
 
 
-def get_sy_set():
-    queryset = SchoolYearModel.objects.all().order_by('-id')
-    return queryset
+class LookupChoiceIterator(ModelChoiceIterator):
+    """Build the choices from the cached rows of the field's lookup instead of querying the queryset"""
 
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for obj in self.field.lookup():
+            yield self.choice(obj)
 
-def get_course_set():
-    queryset = Course.objects.all().order_by('course_name')
-    return queryset
+    def __len__(self):
+        return len(self.field.lookup()) + (self.field.empty_label is not None)
 
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.lookup())
 
-def get_staff_set():
-    queryset = CustomUserProfile.objects.filter(user_level=2)
-    return queryset
+
+class LookupChoiceField(forms.ModelChoiceField):
+    """
+    ModelChoiceField whose choices come from a cached lookup (see lookups.py).
+    Rendering the field runs no query; only validating a submitted value reads the database.
+    """
+    iterator = LookupChoiceIterator
+
+    def __init__(self, lookup, *args, **kwargs):
+        self.lookup = lookup
+        super().__init__(lookup.queryset(), *args, **kwargs)
+
+    @property
+    def objects(self):
+        """The cached rows, for templates that render the options themselves"""
+        return self.lookup()
+
+
+class LookupMultipleChoiceField(LookupChoiceField, forms.ModelMultipleChoiceField):
+    """ModelMultipleChoiceField whose choices come from a cached lookup"""
 
 
 class LoginForm(AuthenticationForm):
@@ -51,17 +75,19 @@ class LoginForm(AuthenticationForm):
         user_level = self.cleaned_data.get('user_level')
 
         if email and password:
-            user = authenticate(email=email, password=password)
+            # Authenticate once and keep the result for get_user(), AuthenticationForm.clean() would hash the
+            # password a second time
+            self.user_cache = authenticate(self.request, email=email, password=password)
 
-            if not user:
+            if not self.user_cache:
                 messages.error(self.request, 'Invalid username or password')
                 raise ValidationError(_('Invalid username or password'), code='invalid')
-            elif not str(user_level) == str(user.user_level):
-                print("User level mismatch")
+            elif not str(user_level) == str(self.user_cache.user_level):
                 messages.error(self.request, 'Invalid login')
                 raise ValidationError(_('Invalid Login'), code='invalid')
+            self.confirm_login_allowed(self.user_cache)
 
-        return super(LoginForm, self).clean(*args, **kwargs)
+        return self.cleaned_data
 
 
 class RegistrationForm(UserCreationForm):
@@ -113,12 +139,12 @@ class RegisterStaffForm(RegistrationForm):
         )
 
 
-class ModifiedCourseChoiceField(forms.ModelChoiceField):
+class ModifiedCourseChoiceField(LookupChoiceField):
     def label_from_instance(self, obj):
         return obj.course_name
 
 
-class ModifiedSchoolYearChoiceField(forms.ModelChoiceField):
+class ModifiedSchoolYearChoiceField(LookupChoiceField):
     def label_from_instance(self, obj):
         return f"{obj.school_year_start}-{obj.school_year_end}"
 
@@ -128,7 +154,7 @@ class ModifiedStaffChoiceField(forms.ModelChoiceField):
         return obj.staff_id
 
 
-class ModifiedSectionChoiceField(forms.ModelChoiceField):
+class ModifiedSectionChoiceField(LookupChoiceField):
     def label_from_instance(self, obj):
         return obj.section_name
 
@@ -138,22 +164,21 @@ class RegisterStudentForm(RegistrationForm):
     year_level = forms.CharField(max_length=3)
     stat = forms.CharField(max_length=1, widget=forms.Select(), empty_value="Select Student Status")
     section = ModifiedSectionChoiceField(
-        queryset=CourseSection.objects.all().order_by('-section_name'),
+        lookups.sections,
         to_field_name='id',
         empty_label='-Select a Section-',
         required=True,
     )
     address = forms.CharField(max_length=255, widget=forms.TextInput())
     course_id = ModifiedCourseChoiceField(
-        queryset=Course.objects.all().order_by('course_name'),
+        lookups.courses,
         to_field_name='id',
         empty_label='-Select a Course-',
         required=True
     )
-    subject_choices = Subject.objects.all()
-    subject_list = forms.ModelMultipleChoiceField(queryset=subject_choices, widget=forms.CheckboxSelectMultiple)
+    subject_list = LookupMultipleChoiceField(lookups.subjects, widget=forms.CheckboxSelectMultiple)
     school_year = ModifiedSchoolYearChoiceField(
-        queryset=SchoolYearModel.objects.all().order_by('id'),
+        lookups.school_years,
         to_field_name='id',
         empty_label='-Select a School Year-',
         required=True
@@ -227,13 +252,9 @@ class AddCourseForm(forms.ModelForm):
 
 class AddSubjectForm(forms.ModelForm):
 
-    course_id = forms.ModelChoiceField(
-        get_course_set()
-    )
+    course_id = LookupChoiceField(lookups.courses)
 
-    staff_id = forms.ModelChoiceField(
-        get_staff_set()
-    )
+    staff_id = LookupChoiceField(lookups.staff_users)
 
     class Meta:
         model = Subject
@@ -283,11 +304,9 @@ class CreateAttendanceForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        student_choices = [(entry.user_profile.id, entry.user_profile.first_name) for entry in
-                           Student.objects.all().only('id', 'user_profile')]
-        print('student_choices')
-        print(student_choices)
-        self.fields['students'].choices = student_choices
+        # Read the choices straight from the joined user profile instead of loading each profile per student
+        student_choices = Student.objects.values_list('user_profile_id', 'user_profile__first_name')
+        self.fields['students'].choices = list(student_choices)
 
     class Meta:
         model = Attendance
@@ -338,6 +357,38 @@ class ManageStudentsForm(forms.ModelForm):
         fields = '__all__'
 
 
+class StudentTableFilterForm(forms.Form):
+    """Query parameters accepted by the Manage Students data endpoint"""
+    sort_choices = (
+        ('id', 'ID'),
+        ('name', 'Name'),
+        ('email', 'Email'),
+        ('course', 'Course'),
+        ('date_created', 'Date Registered'),
+        ('school_year', 'School Year'),
+    )
+
+    course = forms.IntegerField(required=False)
+    section = forms.IntegerField(required=False)
+    school_year = forms.IntegerField(required=False)
+    year_level = forms.ChoiceField(choices=Student.Levels.choices, required=False)
+    stat = forms.ChoiceField(choices=Student.Status.choices, required=False)
+    sort = forms.ChoiceField(choices=sort_choices, required=False)
+    dir = forms.ChoiceField(choices=(('asc', 'Ascending'), ('desc', 'Descending')), required=False)
+    limit = forms.IntegerField(min_value=1, max_value=200, required=False)
+    cursor = forms.CharField(required=False)
+
+
+class StudentImportForm(forms.Form):
+    file = forms.FileField(widget=forms.FileInput(attrs={'accept': '.csv,.xlsx', 'class': 'form-control-file'}))
+
+    def clean_file(self):
+        data = self.cleaned_data['file']
+        if not data.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError('Upload a .csv or .xlsx file.')
+        return data
+
+
 class ManageSubjectsForm(forms.ModelForm):
     class Meta:
         model = Subject
@@ -372,12 +423,8 @@ class EditStaffForm(forms.ModelForm):
 class EditStudentForm(forms.ModelForm):
     gender = forms.CharField(max_length=1)
     address = forms.CharField()
-    course_id = forms.ModelChoiceField(
-        get_course_set()
-    )
-    school_year = forms.ModelChoiceField(
-        get_sy_set()
-    )
+    course_id = LookupChoiceField(lookups.courses)
+    school_year = LookupChoiceField(lookups.school_years)
 
     # date_created = forms.DateTimeField()
     date_updated = forms.DateTimeField()
@@ -406,17 +453,12 @@ class EditStudentForm(forms.ModelForm):
             'profile_pic',
             'course_id',
             'school_year',
-            'date_updated'
         )
 
 
 class EditSubjectForm(forms.ModelForm):
-    course_id = forms.ModelChoiceField(
-        get_course_set()
-    )
-    staff_id = forms.ModelChoiceField(
-        get_staff_set()
-    )
+    course_id = LookupChoiceField(lookups.courses)
+    staff_id = LookupChoiceField(lookups.staff_users)
 
     class Meta:
         model = Subject
@@ -466,7 +508,30 @@ class EditSchoolYearForm(forms.ModelForm):
 #         print(self.fields['students'].choices)
 
 
-class LeaveApplicationForm(forms.ModelForm):
+class CurrentStaffMixin:
+    """
+    Resolves the submitted staff_id (a user profile id) to its Staff row.
+    Views pass the Staff row of the logged in user as `staff`, which comes from the cached request identity,
+    so no query is needed and an id of another staff member is rejected.
+    """
+
+    def __init__(self, *args, staff=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.staff = staff
+
+    def clean_staff_id(self, *args, **kwargs):
+        staff_id = self.cleaned_data['staff_id']
+        if self.staff is not None:
+            if staff_id != self.staff.user_profile_id:
+                raise ValidationError(_('Invalid staff.'), code='invalid')
+            return self.staff
+        s_id = Staff.objects.filter(user_profile=staff_id).first()
+        if not s_id:
+            raise ValidationError(_('Invalid staff.'), code='invalid')
+        return s_id
+
+
+class LeaveApplicationForm(CurrentStaffMixin, forms.ModelForm):
     staff_id = forms.IntegerField(widget=forms.TextInput())
 
     class Meta:
@@ -484,20 +549,13 @@ class LeaveApplicationForm(forms.ModelForm):
         cleaned_data = super(LeaveApplicationForm, self).clean()
         leave_start_date = self.cleaned_data['leave_start_date']
         leave_end_date = self.cleaned_data['leave_end_date']
-        staff_id = self.cleaned_data['staff_id']
-        if LeaveReportStaff.objects.filter(staff_id=staff_id, leave_start_date=leave_start_date, leave_end_date=leave_end_date):
+        staff_id = self.cleaned_data.get('staff_id')
+        if staff_id and LeaveReportStaff.objects.filter(staff_id=staff_id, leave_start_date=leave_start_date, leave_end_date=leave_end_date):
             raise ValidationError(_('There is already an existing application on the selected date.'), code='invalid')
         return cleaned_data
 
-    def clean_staff_id(self, *args, **kwargs):
-        staff_id = self.cleaned_data['staff_id']
-        s_id = Staff.objects.get(user_profile=staff_id)
-        if not s_id:
-            return ValidationError(_('Invalid staff.'), code='invalid')
-        return s_id
-
 
-class StaffFeedbackForm(forms.ModelForm):
+class StaffFeedbackForm(CurrentStaffMixin, forms.ModelForm):
     staff_id = forms.IntegerField(widget=forms.TextInput())
 
     class Meta:
@@ -507,16 +565,8 @@ class StaffFeedbackForm(forms.ModelForm):
             'feedback'
         )
 
-    def clean_staff_id(self, *args, **kwargs):
-        print("cleaning staff id")
-        staff_id = self.cleaned_data['staff_id']
-        s_id = Staff.objects.get(user_profile=staff_id)
-        if not s_id:
-            return ValidationError(_('Invalid staff.'), code='invalid')
-        return s_id
-
 
-class StaffEditFeedbackForm(forms.ModelForm):
+class StaffEditFeedbackForm(CurrentStaffMixin, forms.ModelForm):
     staff_id = forms.IntegerField(widget=forms.TextInput())
 
     class Meta:
@@ -526,14 +576,6 @@ class StaffEditFeedbackForm(forms.ModelForm):
             'feedback'
         )
 
-    def clean_staff_id(self, *args, **kwargs):
-        print("cleaning staff id")
-        staff_id = self.cleaned_data['staff_id']
-        s_id = Staff.objects.get(user_profile=staff_id)
-        if not s_id:
-            return ValidationError(_('Invalid staff.'), code='invalid')
-        return s_id
-
     def clean_feedback(self, *args, **kwargs):
         print("cleaning feedback message")
         return self.cleaned_data['feedback']
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """
+    Django's PBKDF2 hasher with the work factor read from the PASSWORD_HASH_ITERATIONS setting.
+    Hashes keep the pbkdf2_sha256 algorithm name, so existing passwords still verify and are re-hashed with the
+    configured iterations the next time their user logs in.
+    """
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_HASH_ITERATIONS', hashers.PBKDF2PasswordHasher.iterations)
@@ -0,0 +1,71 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+from .routers import primary
+
+# Seconds a user is kept in the cache. Saving the user or its role row drops it earlier.
+IDENTITY_TIMEOUT = 300
+
+# Reverse one-to-one relation of the role row of each user level
+ROLE_RELATIONS = {
+    1: 'adminhod',
+    2: 'staff',
+    3: 'student',
+}
+
+
+def user_cache_key(user_id):
+    return f'sms_main:identity:{user_id}'
+
+
+def load_user(user_id):
+    """
+    The user with the given id and its role row, read from the cache or loaded with one query.
+    :return: CustomUserProfile instance, None when the user does not exist
+    """
+    key = user_cache_key(user_id)
+    user = cache.get(key)
+    if user is None:
+        UserModel = get_user_model()
+        try:
+            # The role rows are joined in so request.user.staff and friends never run a query of their own
+            with primary():
+                user = UserModel._default_manager.select_related(*ROLE_RELATIONS.values()).get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        cache.set(key, user, IDENTITY_TIMEOUT)
+    return user
+
+
+def forget_user(user_id):
+    """Drop the cached copy of a user, now and again once the current transaction commits"""
+    key = user_cache_key(user_id)
+    cache.delete(key)
+    # A request running before the commit could cache the old rows again
+    transaction.on_commit(partial(cache.delete, key))
+
+
+def role_of(user):
+    """The AdminHOD, Staff or Student row of a user, None when it has none"""
+    relation = ROLE_RELATIONS.get(getattr(user, 'user_level', None))
+    return getattr(user, relation, None) if relation else None
+
+
+def role_id(user):
+    role = role_of(user)
+    return role.id if role is not None else None
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend that resolves the user of each request from the cache.
+    Together with the cached_db session engine an authenticated request runs no query before the view.
+    """
+
+    def get_user(self, user_id):
+        user = load_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
@@ -0,0 +1,163 @@
+import logging
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Limits applied to every view ('*') and overrides per view class or url name. A request above one of them is logged
+# as a warning. 'duplicates' is how many times one query may run in a request before it is reported as an N+1.
+DEFAULT_THRESHOLDS = {
+    '*': {'queries': 30, 'ms': 1000, 'duplicates': 5},
+}
+
+# Most recent requests kept for the summary, per process
+RECENT = deque(maxlen=getattr(settings, 'INSTRUMENTATION_SUMMARY_SIZE', 1000))
+
+
+class QueryRecorder:
+    """Database execute wrapper counting and timing the queries of one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            # The SQL still holds its placeholders, so the same query with other parameters has the same text
+            self.fingerprints[sql] += 1
+
+    def duplicates(self):
+        return {sql: count for sql, count in self.fingerprints.items() if count > 1}
+
+
+def view_names(request):
+    """(view class or function name, url name) of the resolved view"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '-', '-'
+    view = getattr(match.func, 'view_class', match.func)
+    return view.__name__, match.url_name or '-'
+
+
+def thresholds_for(*names):
+    configured = getattr(settings, 'INSTRUMENTATION_THRESHOLDS', DEFAULT_THRESHOLDS)
+    thresholds = dict(DEFAULT_THRESHOLDS['*'], **configured.get('*', {}))
+    for name in names:
+        thresholds.update(configured.get(name, {}))
+    return thresholds
+
+
+def check_thresholds(record):
+    thresholds = thresholds_for(record['view'], record['url_name'])
+    if record['queries'] > thresholds['queries']:
+        logger.warning('%s ran %d queries (threshold %d): %s', record['view'], record['queries'],
+                       thresholds['queries'], record['path'])
+    if record['ms'] > thresholds['ms']:
+        logger.warning('%s took %.1f ms (threshold %d ms): %s', record['view'], record['ms'], thresholds['ms'],
+                       record['path'])
+    for sql, count in record['duplicates'].items():
+        if count > thresholds['duplicates']:
+            logger.warning('%s ran the same query %d times, possible N+1: %s', record['view'], count, sql[:300])
+
+
+class InstrumentationMiddleware:
+    """
+    Records the wall time, query count, query time, repeated queries and response size of every request.
+    The figures are sent back in a Server-Timing header, kept in RECENT for the summary page and checked against
+    INSTRUMENTATION_THRESHOLDS. Queries are counted with a database execute wrapper, so DEBUG does not need to be on.
+    Place it first in MIDDLEWARE so the session and user lookups of the other middleware are counted too.
+    Queries run while a streaming response is being sent are not counted.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'INSTRUMENTATION_ENABLED', True):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'INSTRUMENTATION_SERVER_TIMING', True)
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(recorder))
+            response = self.get_response(request)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        view, url_name = view_names(request)
+        if response.streaming:
+            size = None
+        else:
+            size = len(response.content)
+        record = {
+            'view': view,
+            'url_name': url_name,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'ms': elapsed,
+            'queries': recorder.count,
+            'db_ms': recorder.duration * 1000,
+            'duplicates': recorder.duplicates(),
+            'bytes': size,
+            'time': time.time(),
+        }
+        RECENT.append(record)
+        check_thresholds(record)
+
+        if self.server_timing:
+            response['Server-Timing'] = (f'app;dur={elapsed:.1f}, '
+                                         f'db;dur={record["db_ms"]:.1f};desc="{recorder.count} queries"')
+        return response
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summary():
+    """
+    Figures per view over the requests kept in RECENT, slowest total time first
+    :return: list of dicts
+    """
+    per_view = {}
+    for record in list(RECENT):
+        per_view.setdefault((record['view'], record['url_name']), []).append(record)
+
+    rows = []
+    for (view, url_name), records in per_view.items():
+        durations = [record['ms'] for record in records]
+        queries = [record['queries'] for record in records]
+        sizes = [record['bytes'] for record in records if record['bytes'] is not None]
+        duplicates = Counter()
+        for record in records:
+            for sql, count in record['duplicates'].items():
+                duplicates[sql] = max(duplicates[sql], count)
+        rows.append({
+            'view': view,
+            'url_name': url_name,
+            'requests': len(records),
+            'total_ms': round(sum(durations), 1),
+            'avg_ms': round(sum(durations) / len(records), 1),
+            'p95_ms': round(percentile(durations, 0.95), 1),
+            'max_ms': round(max(durations), 1),
+            'avg_queries': round(sum(queries) / len(records), 1),
+            'max_queries': max(queries),
+            'avg_db_ms': round(sum(record['db_ms'] for record in records) / len(records), 1),
+            'avg_bytes': round(sum(sizes) / len(sizes)) if sizes else None,
+            'duplicate_queries': [{'sql': sql, 'count': count} for sql, count in duplicates.most_common(5)],
+        })
+    rows.sort(key=lambda row: row['total_ms'], reverse=True)
+    return rows
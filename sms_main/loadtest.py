@@ -0,0 +1,409 @@
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+from django.db.models import Max
+from django.urls import reverse
+
+from .instrumentation import percentile
+from .models import CustomUserProfile, OfferedSubject, Attendance
+
+CSRF_INPUT = re.compile(rb'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+# Classes loaded per staff member, each staff session takes the attendance of these
+CLASSES_PER_STAFF = 3
+
+
+class LoadTestError(Exception):
+    """Raised when the load test can not be set up"""
+
+
+class Stats:
+    """Latency and outcome of every request, per request name. Shared by all the sessions of a run."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.failures = defaultdict(int)
+
+    def add(self, name, elapsed, ok):
+        with self.lock:
+            self.latencies[name].append(elapsed)
+            if not ok:
+                self.failures[name] += 1
+
+    def row(self, name, latencies, failures, duration):
+        return {
+            'name': name,
+            'requests': len(latencies),
+            'failures': failures,
+            'error_rate': round(failures / len(latencies), 4),
+            'rps': round(len(latencies) / duration, 2),
+            'avg_ms': round(sum(latencies) / len(latencies), 1),
+            'p50_ms': round(percentile(latencies, 0.50), 1),
+            'p95_ms': round(percentile(latencies, 0.95), 1),
+            'p99_ms': round(percentile(latencies, 0.99), 1),
+            'max_ms': round(max(latencies), 1),
+        }
+
+    def report(self, duration):
+        """Figures per request name and for all requests together"""
+        with self.lock:
+            rows = [self.row(name, latencies, self.failures[name], duration)
+                    for name, latencies in sorted(self.latencies.items())]
+            everything = [elapsed for latencies in self.latencies.values() for elapsed in latencies]
+            total = self.row('total', everything, sum(self.failures.values()), duration) if everything else None
+        return {'endpoints': rows, 'total': total}
+
+
+class Session:
+    """A browser session: its cookies, the CSRF token of the last form it loaded and the stats it reports to"""
+
+    def __init__(self, base_url, stats, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.stats = stats
+        self.timeout = timeout
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()))
+        self.csrf_token = None
+
+    def request(self, name, path, params=None, form=None, body=None):
+        """
+        Send a request, following redirects, and record its latency under name
+        :param params: query string parameters
+        :param form: form fields, sent as a POST with the CSRF token of the last loaded form
+        :param body: JSON document, sent as a POST
+        :return: (final url, response body), None when the request failed
+        """
+        url = self.base_url + path
+        if params:
+            url += '?' + urlencode(params)
+        data, headers = None, {}
+        if form is not None:
+            data = urlencode(dict(form, csrfmiddlewaretoken=self.csrf_token or ''), doseq=True).encode()
+        elif body is not None:
+            data, headers = json.dumps(body).encode(), {'Content-Type': 'application/json'}
+
+        start = time.perf_counter()
+        try:
+            with self.opener.open(Request(url, data=data, headers=headers), timeout=self.timeout) as response:
+                content = response.read()
+                final_url = response.geturl()
+            result = final_url, content
+        except (HTTPError, URLError, OSError):
+            result = None
+        self.stats.add(name, (time.perf_counter() - start) * 1000, result is not None)
+
+        if result is not None:
+            token = CSRF_INPUT.search(result[1])
+            if token:
+                self.csrf_token = token.group(1).decode()
+        return result
+
+    def login(self, email, password, user_level):
+        login_path = reverse('login')
+        self.request('login page', login_path)
+        result = self.request('login', login_path,
+                              form={'username': email, 'password': password, 'user_level': user_level})
+        if result is None or result[0].split('?')[0].endswith(login_path):
+            raise LoadTestError(f'Unable to log in as {email}.')
+
+
+class Scenario:
+    """
+    What one kind of user does, in the style of a Locust user class: log in once, then run weighted tasks with a
+    random wait between them until the test ends.
+    """
+    weight = 1
+    user_level = None
+    tasks = ()
+
+    def __init__(self, session, user, rng):
+        self.session = session
+        self.user = user
+        self.rng = rng
+
+    def on_start(self):
+        self.session.login(self.user['email'], self.user['password'], self.user_level)
+
+    def run_task(self):
+        names, weights = zip(*self.tasks)
+        getattr(self, self.rng.choices(names, weights)[0])()
+
+    def get(self, url_name, **params):
+        return self.session.request(url_name, reverse(url_name), params=params)
+
+
+class StaffScenario(Scenario):
+    """Takes and corrects the attendance of the classes of a staff member"""
+    weight = 6
+    user_level = 2
+    tasks = (
+        ('dashboard', 1),
+        ('create_attendance', 1),
+        ('fetch_roster', 3),
+        ('fetch_attendance_list', 2),
+        ('view_attendance', 3),
+        ('update_attendance', 2),
+    )
+
+    def run_task(self):
+        self.current = self.rng.choice(self.user['classes'])
+        super().run_task()
+
+    def dashboard(self):
+        self.get('staff-dashboard')
+
+    def create_attendance(self):
+        # Load the form first, like a browser, for its CSRF token
+        self.get('view-student-attendance')
+        self.session.request('view-student-attendance (post)', reverse('view-student-attendance'), form={
+            'subject_id': self.current['subject_id'],
+            'section_id': self.current['section_id'],
+            'school_year': self.current['school_year_id'],
+            'students': [student['user_profile_id'] for student in self.current['students']
+                         if self.rng.random() < 0.9],
+        })
+
+    def fetch_roster(self):
+        self.get('ajax-staff-fetch-students', subject_id=self.current['subject_id'], staff_id=self.user['id'],
+                 section_id=self.current['section_id'], school_year_id=self.current['school_year_id'])
+
+    def fetch_attendance_list(self):
+        self.get('ajax-staff-fetch-attendance-report', subject_id=self.current['subject_id'],
+                 staff_id=self.user['id'], school_year_id=self.current['school_year_id'])
+
+    def view_attendance(self):
+        if self.current['attendance_id']:
+            self.session.request('ajax-view-student-attendance', reverse('ajax-view-student-attendance'), body={
+                'attendance': self.current['attendance_id'],
+                'subject_id': self.current['subject_id'],
+                'school_year_id': self.current['school_year_id'],
+            })
+
+    def update_attendance(self):
+        if self.current['attendance_id']:
+            self.session.request('ajax-update-student-attendance-report',
+                                 reverse('ajax-update-student-attendance-report'), body={
+                                     'attendance_id': self.current['attendance_id'],
+                                     'id_list': [{'id': student['id'], 'status': int(self.rng.random() < 0.9)}
+                                                 for student in self.current['students']],
+                                 })
+
+
+class AdminScenario(Scenario):
+    """Browses the manage pages"""
+    weight = 1
+    user_level = 1
+    tasks = (
+        ('dashboard', 1),
+        ('manage_students', 2),
+        ('students_data', 3),
+        ('manage_staff', 1),
+        ('manage_subjects', 1),
+        ('manage_courses', 1),
+    )
+
+    def dashboard(self):
+        self.get('admin-dashboard')
+
+    def manage_students(self):
+        self.get('manage-students')
+
+    def students_data(self):
+        self.get('ajax-manage-students-data', sort=self.rng.choice(('name', 'email', 'course')), limit=50)
+
+    def manage_staff(self):
+        self.get('manage-staff')
+
+    def manage_subjects(self):
+        self.get('manage-subjects')
+
+    def manage_courses(self):
+        self.get('manage-courses')
+
+
+class StudentScenario(Scenario):
+    weight = 3
+    user_level = 3
+    tasks = (
+        ('dashboard', 1),
+    )
+
+    def dashboard(self):
+        self.get('student-dashboard')
+
+
+SCENARIOS = {
+    'staff': StaffScenario,
+    'admin': AdminScenario,
+    'student': StudentScenario,
+}
+
+
+def load_users(prefix, password, limit=100):
+    """
+    Users of a database filled by generate_sms_data, per scenario name, with what their sessions need.
+    Everything is read before the test starts so the harness itself sends no query during the run.
+    :param prefix: the --prefix the data was generated with
+    :param password: the --password the data was generated with
+    :param limit: maximum number of users loaded per role
+    """
+    users = {}
+    profiles = CustomUserProfile.objects.filter(email__startswith=f'{prefix}.').order_by('id')
+    for name, scenario in SCENARIOS.items():
+        users[name] = [{'id': user_id, 'email': email, 'password': password}
+                       for user_id, email in profiles.filter(user_level=scenario.user_level)
+                       .values_list('id', 'email')[:limit]]
+
+    staff = {user['id']: user for user in users['staff']}
+    classes = {}
+    enrolments = (OfferedSubject.objects.filter(subject_id__staff_id__in=staff)
+                  .order_by('subject_id', 'student_id__section', 'student_id')
+                  .values_list('subject_id', 'subject_id__staff_id', 'student_id__section', 'school_year',
+                               'student_id', 'student_id__user_profile'))
+    for subject_id, staff_id, section_id, school_year_id, student_id, user_profile_id in enrolments.iterator():
+        key = (subject_id, section_id, school_year_id)
+        if key not in classes:
+            if len(staff[staff_id].setdefault('classes', [])) >= CLASSES_PER_STAFF:
+                continue
+            classes[key] = {'subject_id': subject_id, 'section_id': section_id, 'school_year_id': school_year_id,
+                            'attendance_id': None, 'students': []}
+            staff[staff_id]['classes'].append(classes[key])
+        classes[key]['students'].append({'id': student_id, 'user_profile_id': user_profile_id})
+
+    latest = (Attendance.objects.filter(subject_id__in={key[0] for key in classes})
+              .values_list('subject_id', 'section_id', 'school_year').annotate(last=Max('id')))
+    for subject_id, section_id, school_year_id, attendance_id in latest:
+        if (subject_id, section_id, school_year_id) in classes:
+            classes[subject_id, section_id, school_year_id]['attendance_id'] = attendance_id
+
+    users['staff'] = [user for user in users['staff'] if user.get('classes')]
+    if not any(users.values()):
+        raise LoadTestError(f'No users with the email prefix "{prefix}." were found, fill the database with '
+                            f'generate_sms_data first.')
+    return users
+
+
+def assign_scenarios(available, concurrency, rng):
+    """
+    Scenario of every session. Each available scenario gets one session so every page is measured, the remaining
+    sessions are split by weight. With fewer sessions than scenarios the heaviest scenarios get one each.
+    :param available: names of the scenarios that have users
+    :param concurrency: number of sessions
+    :param rng: random.Random the weighted choices are made with
+    :return: list of scenario names, one per session
+    """
+    scenarios = sorted(available, key=lambda name: -SCENARIOS[name].weight)[:concurrency]
+    scenarios += rng.choices(available, [SCENARIOS[name].weight for name in available],
+                             k=concurrency - len(scenarios))
+    return scenarios
+
+
+def run(base_url, users, concurrency=10, duration=60, wait=(0.0, 0.0), seed=0):
+    """
+    Run the scenarios against a server for a fixed time
+    :param base_url: e.g. http://127.0.0.1:8000
+    :param users: users per scenario name, see load_users()
+    :param concurrency: number of sessions running at once, see assign_scenarios()
+    :param duration: seconds the tasks are run for, logins included
+    :param wait: (min, max) seconds a session waits between two tasks
+    :param seed: seed of the choices the sessions make
+    :return: the Stats report, with the run settings under 'meta'
+    """
+    rng = random.Random(seed)
+    available = [name for name in SCENARIOS if users.get(name)]
+    if not available:
+        raise LoadTestError('There are no users to run the scenarios with.')
+    scenarios = assign_scenarios(available, concurrency, rng)
+    stats = Stats()
+    errors = []
+    deadline = time.monotonic() + duration
+
+    def session_loop(name, session_seed):
+        session_rng = random.Random(session_seed)
+        task = SCENARIOS[name](Session(base_url, stats), session_rng.choice(users[name]), session_rng)
+        try:
+            task.on_start()
+        except LoadTestError as e:
+            errors.append(str(e))
+            return
+        while time.monotonic() < deadline:
+            task.run_task()
+            if wait[1]:
+                time.sleep(session_rng.uniform(*wait))
+
+    threads = [threading.Thread(target=session_loop, args=(name, rng.random()), daemon=True)
+               for name in scenarios]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    result = stats.report(elapsed)
+    result['meta'] = {
+        'url': base_url,
+        'concurrency': concurrency,
+        'duration': round(elapsed, 1),
+        'wait': list(wait),
+        'seed': seed,
+        'sessions': {name: scenarios.count(name) for name in SCENARIOS},
+        'login_errors': errors,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    return result
+
+
+def compare(current, baseline, tolerance=0.1):
+    """
+    Compare a run with a saved baseline, endpoint by endpoint
+    :param tolerance: relative slowdown of p95/p99 or drop of the total throughput tolerated before a change counts
+                      as a regression
+    :return: list of dicts (name, metric, baseline, current, change, regression)
+    """
+    rows = []
+    baseline_rows = {row['name']: row for row in baseline['endpoints'] + [baseline['total']] if row}
+    for row in current['endpoints'] + [current['total']]:
+        before = baseline_rows.get(row['name']) if row else None
+        if before is None:
+            continue
+        for metric, worse in (('p95_ms', 1), ('p99_ms', 1), ('rps', -1), ('error_rate', 1)):
+            if metric == 'rps' and row['name'] != 'total':
+                # How requests split between the endpoints depends on the random task choices
+                continue
+            old, new = before[metric], row[metric]
+            change = (new - old) / old if old else (0.0 if new == old else float('inf'))
+            if metric == 'error_rate':
+                regression = new > old
+            else:
+                regression = change * worse > tolerance
+            rows.append({'name': row['name'], 'metric': metric, 'baseline': old, 'current': new,
+                         'change': round(change, 3), 'regression': regression})
+    return rows
+
+
+def start_server(host='127.0.0.1', port=0):
+    """
+    Serve the project from a background thread with Django's threaded development server, as a stand-in for
+    runserver or gunicorn when no server is running. It shares the process, and the GIL, with the sessions, so
+    prefer a real server for release baselines.
+    :return: (server, base url), call server.shutdown() when done
+    """
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadedWSGIServer((host, port), QuietHandler)
+    server.set_app(get_internal_wsgi_application())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}'
@@ -0,0 +1,114 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from .models import Course, CourseSection, SchoolYearModel, Subject
+from .routers import primary
+
+# Seconds a cached list is kept. Writes invalidate it earlier through the generation counters, the timeout only
+# bounds staleness when the cache backend is not shared between worker processes (e.g. locmem).
+LOOKUP_TIMEOUT = 300
+
+# Registered lookups per name
+LOOKUPS = {}
+
+
+def generation_key(model):
+    return f'sms_main:lookup-generation:{model._meta.label_lower}'
+
+
+def bump_generation(model):
+    """
+    Invalidate every cached lookup built from the given model, and its totals cached by pagination.cached_count.
+    Connected to its post_save/post_delete signals.
+    """
+    key = generation_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The counter expired or was evicted: restart it from a value the old cached lists can not have used
+        cache.set(key, int(time.time() * 1000000), None)
+
+
+def generations(models):
+    """Current generation of each model, starting the counters that are missing"""
+    keys = [generation_key(model) for model in models]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, int(time.time() * 1000000), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+class Lookup:
+    """
+    A small, rarely changing reference list (courses, sections, subjects, school years, ...).
+    Rows are loaded on first use and kept in Django's cache under a key that contains the generation of every
+    model the list is built from, so a write to any of those models makes the next read load fresh rows.
+    Declaring a lookup runs no query, so importing views and forms never touches the database.
+    """
+
+    def __init__(self, name, models, loader):
+        self.name = name
+        self.models = models
+        self.loader = loader
+        LOOKUPS[name] = self
+
+    def queryset(self, *args):
+        """The uncached queryset behind the lookup, e.g. for validating a submitted choice"""
+        return self.loader(*args)
+
+    def cache_key(self, *args):
+        version = '.'.join(str(generation) for generation in generations(self.models))
+        params = ','.join(str(arg) for arg in args)
+        return f'sms_main:lookup:{self.name}:{version}:{params}'
+
+    def __call__(self, *args):
+        """Return the rows of the lookup as a list, loading them when the cached copy is missing or outdated"""
+        key = self.cache_key(*args)
+        rows = cache.get(key)
+        if rows is None:
+            with primary():
+                rows = list(self.loader(*args))
+            cache.set(key, rows, LOOKUP_TIMEOUT)
+        return rows
+
+
+school_years = Lookup(
+    'school_years', (SchoolYearModel,),
+    lambda: SchoolYearModel.objects.order_by('-school_year_end')
+)
+courses = Lookup(
+    'courses', (Course,),
+    lambda: Course.objects.order_by('course_name').only('id', 'course_name')
+)
+sections = Lookup(
+    'sections', (CourseSection,),
+    lambda: CourseSection.objects.order_by('section_name').only('id', 'section_name', 'course_id')
+)
+course_sections = Lookup(
+    'course_sections', (CourseSection,),
+    lambda course_id: CourseSection.objects.filter(course_id=course_id).order_by('section_name')
+    .only('id', 'section_name')
+)
+subjects = Lookup(
+    'subjects', (Subject,),
+    lambda: Subject.objects.order_by('subject_name').only('id', 'subject_name')
+)
+offered_subjects = Lookup(
+    'offered_subjects', (Subject,),
+    lambda course_id: Subject.objects.filter(course_id=course_id, is_offered=True).order_by('subject_name')
+    .only('id', 'subject_name')
+)
+staff_subjects = Lookup(
+    'staff_subjects', (Subject, Course),
+    lambda staff_id: Subject.objects.filter(staff_id=staff_id).select_related('course_id').order_by('subject_name')
+    .only('id', 'subject_name', 'course_id__id', 'course_id__course_name')
+)
+staff_users = Lookup(
+    'staff_users', (get_user_model(),),
+    lambda: get_user_model().objects.filter(user_level=2).order_by('last_name', 'first_name')
+    .only('id', 'email', 'first_name', 'middle_initial', 'last_name')
+)
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from sms_main.datasets import BATCH_SIZE, DEFAULT_PASSWORD, SCALES, generate_dataset
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with a reproducible, randomly generated school for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=list(SCALES), default='tiny',
+                            help='Named dataset size the options below start from')
+        for name in SCALES['tiny']:
+            parser.add_argument(f"--{name.replace('_', '-')}", type=int, dest=name,
+                                help=f"{name.replace('_', ' ').capitalize()}, overrides the value of --scale")
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator')
+        parser.add_argument('--prefix', default='sms',
+                            help='Start of the generated email addresses, change it to generate into the same '
+                                 'database again')
+        parser.add_argument('--password', default=DEFAULT_PASSWORD, help='Password of every generated user')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows written per bulk insert')
+
+    def handle(self, *args, **options):
+        scale = dict(SCALES[options['scale']])
+        for name in scale:
+            if options[name] is not None:
+                if options[name] < 0:
+                    raise CommandError(f"--{name.replace('_', '-')} can not be negative.")
+                scale[name] = options[name]
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+
+        start = time.perf_counter()
+        try:
+            counts = generate_dataset(seed=options['seed'], prefix=options['prefix'], password=options['password'],
+                                      batch_size=options['batch_size'], **scale)
+        except ValueError as e:
+            raise CommandError(e)
+        except IntegrityError as e:
+            raise CommandError(f'{e}. Pass another --prefix to generate into a database that already holds '
+                               f'generated users.')
+        elapsed = time.perf_counter() - start
+
+        for name, count in counts.items():
+            self.stdout.write(f"  {name}: {count}")
+        self.stdout.write(self.style.SUCCESS(f"{sum(counts.values())} rows written in {elapsed:.1f} s."))
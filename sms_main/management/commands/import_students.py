@@ -0,0 +1,43 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sms_main.student_import import DEFAULT_CHUNK_SIZE, COLUMNS, StudentImportError, import_students, \
+    write_error_report
+
+
+class Command(BaseCommand):
+    help = f"Import students from a .csv or .xlsx file with the columns: {', '.join(COLUMNS)}"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path of the .csv or .xlsx file')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Rows written per bulk insert')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Processes used to hash passwords. Defaults to the number of CPUs.')
+        parser.add_argument('--errors', metavar='PATH',
+                            help='Write the rows that were not imported to this CSV file, "-" for stdout')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the file without saving anything')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1.')
+        try:
+            with open(options['path'], 'rb') as f:
+                result = import_students(f, options['path'], chunk_size=options['chunk_size'],
+                                         workers=options['workers'], dry_run=options['dry_run'])
+        except (OSError, StudentImportError) as e:
+            raise CommandError(e)
+
+        if options['errors'] == '-':
+            write_error_report(result.errors, sys.stdout)
+        elif options['errors']:
+            with open(options['errors'], 'w', newline='', encoding='utf-8') as f:
+                write_error_report(result.errors, f)
+        else:
+            for error in result.errors:
+                self.stderr.write(f"line {error.line} ({error.email}): {' '.join(error.messages)}")
+
+        action = 'valid' if options['dry_run'] else 'imported'
+        style = self.style.SUCCESS if not result.errors else self.style.WARNING
+        self.stdout.write(style(f"{result.created} of {result.total} rows {action}, {result.failed} rejected."))
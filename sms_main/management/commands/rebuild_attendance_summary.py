@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sms_main.attendance import SUMMARY_BATCH_SIZE, rebuild_attendance_summaries
+
+
+class Command(BaseCommand):
+    help = ('Recompute the per student attendance summaries from the attendance entries and reports, e.g. after '
+            'enrolments or sections changed or rows were written outside the attendance views')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SUMMARY_BATCH_SIZE, help='Rows written per bulk insert')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        start = time.perf_counter()
+        count = rebuild_attendance_summaries(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{count} summaries rebuilt in {time.perf_counter() - start:.1f} s."))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from sms_main.benchmarks import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = 'Run the sms_main benchmark scenarios and print their query counts and timings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help='Scenarios to run. Runs every scenario when omitted.')
+        parser.add_argument('--list', action='store_true', help='List the available scenarios')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for name, func in SCENARIOS.items():
+                self.stdout.write(f"{name}: {func.__doc__}")
+            return
+
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(unknown)}")
+
+        # Run once per SMS_DATABASE_URL to compare the backends
+        self.stdout.write(f"Database: {connection.vendor} {connection.settings_dict['NAME']}")
+        for name in names:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{name}: {SCENARIOS[name].__doc__}"))
+            for row in SCENARIOS[name]():
+                self.stdout.write('  ' + '  '.join(f"{key}={value}" for key, value in row.items()))
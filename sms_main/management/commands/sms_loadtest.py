@@ -0,0 +1,99 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sms_main.datasets import DEFAULT_PASSWORD
+from sms_main.loadtest import LoadTestError, compare, load_users, run, start_server
+
+COLUMNS = ('requests', 'failures', 'rps', 'avg_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms')
+
+
+class Command(BaseCommand):
+    help = ('Run scripted staff, admin and student sessions against a server and report throughput, latency '
+            'percentiles and error rates. Needs a database filled by generate_sms_data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Server to test, e.g. http://127.0.0.1:8000. Without it the project is '
+                                          'served from a stand-in server inside this process.')
+        parser.add_argument('--concurrency', type=int, default=10, help='Sessions running at once')
+        parser.add_argument('--duration', type=float, default=60, help='Seconds to run the sessions for')
+        parser.add_argument('--wait', type=float, nargs=2, default=(0.0, 0.0), metavar=('MIN', 'MAX'),
+                            help='Seconds a session waits between two tasks')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the choices the sessions make')
+        parser.add_argument('--prefix', default='sms', help='--prefix the data was generated with')
+        parser.add_argument('--password', default=DEFAULT_PASSWORD, help='--password the data was generated with')
+        parser.add_argument('--users', type=int, default=100, help='Users loaded per role')
+        parser.add_argument('--label', help='Name of the run stored in the baseline, e.g. the release')
+        parser.add_argument('--save', metavar='PATH', help='Save the results as a JSON baseline')
+        parser.add_argument('--compare', metavar='PATH',
+                            help='Compare the results with a saved baseline and fail on a regression')
+        parser.add_argument('--tolerance', type=float, default=0.1,
+                            help='Relative change of p95, p99 or throughput accepted by --compare')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['duration'] <= 0:
+            raise CommandError('--concurrency and --duration must be positive.')
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Unable to read the baseline: {e}")
+
+        server = None
+        url = options['url']
+        try:
+            users = load_users(options['prefix'], options['password'], options['users'])
+            if not url:
+                server, url = start_server()
+            self.stdout.write(f"Running {options['concurrency']} sessions against {url} for "
+                              f"{options['duration']:g} s...")
+            result = run(url, users, concurrency=options['concurrency'], duration=options['duration'],
+                         wait=tuple(options['wait']), seed=options['seed'])
+        except LoadTestError as e:
+            raise CommandError(e)
+        finally:
+            if server is not None:
+                server.shutdown()
+        result['meta']['label'] = options['label']
+        result['meta']['server'] = 'stand-in' if server is not None else 'external'
+
+        self.write_report(result)
+        if options['save']:
+            with open(options['save'], 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=2)
+            self.stdout.write(f"Baseline saved to {options['save']}.")
+        if baseline is not None:
+            self.write_comparison(result, baseline, options['tolerance'])
+
+    def write_report(self, result):
+        for error in result['meta']['login_errors']:
+            self.stderr.write(error)
+        if result['total'] is None:
+            raise CommandError('No request was sent.')
+        self.stdout.write(f"{'name':<42}" + ''.join(f"{column:>10}" for column in COLUMNS))
+        for row in result['endpoints'] + [result['total']]:
+            self.stdout.write(f"{row['name']:<42}" + ''.join(f"{row[column]:>10}" for column in COLUMNS))
+        total = result['total']
+        style = self.style.SUCCESS if not total['failures'] else self.style.WARNING
+        self.stdout.write(style(f"{total['requests']} requests, {total['rps']} per second, "
+                                f"{total['error_rate']:.2%} errors."))
+
+    def write_comparison(self, result, baseline, tolerance):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Compared with {baseline['meta'].get('label') or baseline['meta'].get('time')}:"))
+        for setting in ('concurrency', 'wait', 'server'):
+            if baseline['meta'].get(setting) != result['meta'].get(setting):
+                self.stderr.write(f"The baseline was run with {setting}={baseline['meta'].get(setting)}, the "
+                                  f"figures are not comparable.")
+        rows = compare(result, baseline, tolerance)
+        regressions = [row for row in rows if row['regression']]
+        for row in rows:
+            if row['name'] == 'total' or row['regression']:
+                line = (f"  {row['name']} {row['metric']}: {row['baseline']} -> {row['current']} "
+                        f"({row['change']:+.1%})")
+                self.stdout.write(self.style.ERROR(line) if row['regression'] else line)
+        if regressions:
+            raise CommandError(f"{len(regressions)} regression(s) against the baseline.")
+        self.stdout.write(self.style.SUCCESS('No regression against the baseline.'))
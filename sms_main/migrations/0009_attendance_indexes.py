@@ -0,0 +1,48 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:12
+
+from django.db import migrations, models
+from django.db.models import Min
+import django.db.models.deletion
+
+
+def remove_duplicate_reports(apps, schema_editor):
+    # Keep the first report of each student per attendance entry so the unique constraint can be added
+    AttendanceReport = apps.get_model('sms_main', 'AttendanceReport')
+    first = AttendanceReport.objects.values('attendance_id', 'student_id').annotate(first=Min('id')).values('first')
+    AttendanceReport.objects.exclude(id__in=first).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_main', '0008_auto_20200918_0928'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_reports, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='attendancereport',
+            name='attendance_id',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, to='sms_main.attendance'),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['subject_id', 'school_year', 'date_created'], name='attendance_subject_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='offeredsubject',
+            index=models.Index(fields=['subject_id', 'school_year'], name='enrolment_subject_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['section', 'school_year'], name='student_section_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subject',
+            index=models.Index(fields=['staff_id', 'subject_name'], name='subject_staff_name_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='attendancereport',
+            constraint=models.UniqueConstraint(fields=('attendance_id', 'student_id'), name='unique_attendance_student'),
+        ),
+    ]
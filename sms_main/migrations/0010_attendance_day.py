@@ -0,0 +1,53 @@
+# Generated by Django 3.1.14 on 2026-10-18 13:05
+
+from django.db import migrations, models
+from django.db.models import Min
+from django.db.models.functions import TruncDate
+import django.utils.timezone
+
+
+def fill_attendance_day(apps, schema_editor):
+    # Local date of the existing entries, then merge entries of a class taken more than once on the same day into
+    # the first one so the unique constraint can be added
+    Attendance = apps.get_model('sms_main', 'Attendance')
+    AttendanceReport = apps.get_model('sms_main', 'AttendanceReport')
+    Attendance.objects.update(attendance_day=TruncDate('attendance_date'))
+
+    duplicates = (Attendance.objects.values('subject_id', 'section_id', 'school_year', 'attendance_day')
+                  .annotate(first=Min('id'), entries=models.Count('id')).filter(entries__gt=1))
+    for group in duplicates:
+        first = group.pop('first')
+        group.pop('entries')
+        others = list(Attendance.objects.filter(**group).exclude(id=first).values_list('id', flat=True))
+        present = AttendanceReport.objects.filter(attendance_id=first).values('student_id')
+        AttendanceReport.objects.filter(attendance_id__in=others, student_id__in=present).delete()
+        kept = AttendanceReport.objects.filter(attendance_id__in=others).values('student_id').annotate(
+            first=Min('id')).values_list('first', flat=True)
+        AttendanceReport.objects.filter(attendance_id__in=others).exclude(id__in=list(kept)).delete()
+        AttendanceReport.objects.filter(attendance_id__in=others).update(attendance_id=first)
+        Attendance.objects.filter(id__in=others).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_main', '0009_attendance_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendance',
+            name='attendance_day',
+            field=models.DateField(null=True),
+        ),
+        migrations.RunPython(fill_attendance_day, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='attendance',
+            name='attendance_day',
+            field=models.DateField(default=django.utils.timezone.localdate),
+        ),
+        migrations.AddConstraint(
+            model_name='attendance',
+            constraint=models.UniqueConstraint(fields=('subject_id', 'section_id', 'school_year', 'attendance_day'), name='unique_class_attendance_day'),
+        ),
+    ]
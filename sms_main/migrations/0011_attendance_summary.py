@@ -0,0 +1,42 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from sms_main.attendance import rebuild_attendance_summaries
+
+
+def fill_attendance_summaries(apps, schema_editor):
+    # Counts of the attendance taken so far, create_attendance and update_attendance keep them up to date from now on
+    rebuild_attendance_summaries(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_main', '0010_attendance_day'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sessions_held', models.PositiveIntegerField(default=0)),
+                ('sessions_attended', models.PositiveIntegerField(default=0)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('school_year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sms_main.schoolyearmodel')),
+                ('student_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sms_main.student')),
+                ('subject_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sms_main.subject')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='attendancesummary',
+            index=models.Index(fields=['subject_id', 'school_year'], name='summary_subject_year_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='attendancesummary',
+            constraint=models.UniqueConstraint(fields=('student_id', 'subject_id', 'school_year'), name='unique_attendance_summary'),
+        ),
+        migrations.RunPython(fill_attendance_summaries, migrations.RunPython.noop),
+    ]
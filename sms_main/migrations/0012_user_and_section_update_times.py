@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 13:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_main', '0011_attendance_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coursesection',
+            name='date_updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='customuserprofile',
+            name='date_updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -1,8 +1,24 @@
+from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import UserPassesTestMixin
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import PermissionDenied, SuspiciousOperation
 from django.shortcuts import redirect, get_object_or_404
 
+from .exports import ExportError, export_response
+from .identity import role_of
+from .pagination import KeysetPaginator, InvalidCursor
+
+
+class RoleMixin:
+    """Access to the AdminHOD/Staff/Student row of the logged in user, cached with the user so it costs no query"""
+
+    def get_role(self):
+        return role_of(self.request.user)
+
+    def get_role_id(self):
+        role = self.get_role()
+        return role.id if role is not None else None
+
 
 class UserRedirectMixin:
     def get_next_url(self):
@@ -20,7 +36,7 @@ class UserRedirectMixin:
             return 'login'
 
 
-class AdminCheckMixin(UserPassesTestMixin, UserRedirectMixin):
+class AdminCheckMixin(UserPassesTestMixin, UserRedirectMixin, RoleMixin):
     def test_func(self):
         return self.request.user.is_active and self.request.user.user_level == 1
 
@@ -32,7 +48,7 @@ class AdminCheckMixin(UserPassesTestMixin, UserRedirectMixin):
         return redirect(redirect_path)
 
 
-class StaffCheckMixin(UserPassesTestMixin, UserRedirectMixin):
+class StaffCheckMixin(UserPassesTestMixin, UserRedirectMixin, RoleMixin):
     def test_func(self):
         return self.request.user.is_active and self.request.user.user_level == 2
 
@@ -44,7 +60,7 @@ class StaffCheckMixin(UserPassesTestMixin, UserRedirectMixin):
         return redirect(redirect_path)
 
 
-class StudentCheckMixin(UserPassesTestMixin, UserRedirectMixin):
+class StudentCheckMixin(UserPassesTestMixin, UserRedirectMixin, RoleMixin):
     def test_func(self):
         return self.request.user.is_active and self.request.user.user_level == 3
 
@@ -56,4 +72,67 @@ class StudentCheckMixin(UserPassesTestMixin, UserRedirectMixin):
         return redirect(redirect_path)
 
 
-
+class ReplicaReadMixin:
+    """
+    Marks a read-only view whose queries may run on the read replica (see routers.ReplicaMiddleware).
+    Only requests with one of replica_methods are sent there.
+    """
+    replica_methods = ('GET', 'HEAD')
+
+
+class ExportMixin:
+    """
+    GET downloads the rows of get_export_queryset() as described by export, as CSV or, with ?format=xlsx, as XLSX
+    (see exports.export_response). When the export cannot be produced the user is sent back with the reason.
+    """
+    export = None
+    export_failure_url = None
+
+    def get_export_queryset(self):
+        raise NotImplementedError
+
+    def get_export_failure_url(self):
+        return self.export_failure_url
+
+    def get(self, request, *args, **kwargs):
+        try:
+            return export_response(self.export, self.get_export_queryset(), request.GET.get('format', 'csv'))
+        except ExportError as e:
+            messages.error(request, str(e))
+            return redirect(self.get_export_failure_url())
+
+
+class KeysetListMixin:
+    """
+    Keyset (cursor) pagination for ListView.
+    Each page continues after the ordering values of the previous page's last row, so page N costs the same
+    as the first page no matter how large the table is. Views declare the ordering, ending with a unique key,
+    and the related rows and columns to load for the page.
+    """
+    keyset_ordering = ('id',)
+    page_size = 50
+    list_select_related = ()
+    list_only = ()
+    cursor_param = 'cursor'
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.list_select_related:
+            queryset = queryset.select_related(*self.list_select_related)
+        if self.list_only:
+            queryset = queryset.only(*self.list_only)
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        cursor = self.request.GET.get(self.cursor_param)
+        paginator = KeysetPaginator(self.object_list, self.keyset_ordering, self.page_size)
+        try:
+            rows, next_cursor = paginator.page(cursor)
+        except InvalidCursor:
+            raise SuspiciousOperation('Invalid page cursor.')
+
+        context = super().get_context_data(object_list=rows, **kwargs)
+        context['cursor_param'] = self.cursor_param
+        context['current_cursor'] = cursor
+        context['next_cursor'] = next_cursor
+        return context
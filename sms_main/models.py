@@ -29,14 +29,16 @@ class UserProfileManager(BaseUserManager):
         if not password:
             raise ValueError('Password is required')
 
+        from .provisioning import provision_user
+
         email = self.normalize_email(email)
         # Create an object model that will hold the user data
         user = self.model(email=email, first_name=first_name, middle_initial=middle_initial, last_name=last_name)
 
         # Encrypt the password
         user.set_password(password)
-        # Save the user data in the database using the default settings in the settings.py "DATABASE"
-        user.save(using=self._db)
+        # Save the user data together with its role row
+        provision_user(user)
 
         # return the newly created object
         return user
@@ -67,6 +69,8 @@ class CustomUserProfile(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
     profile_pic = models.ImageField(upload_to='photos/%Y/%m/%d', default="/default.png", blank=True)
+    # Validators of the student lists, a login only saves last_login and leaves it unchanged
+    date_updated = models.DateTimeField(auto_now=True)
 
     objects = UserProfileManager()
 
@@ -170,6 +174,12 @@ class Subject(models.Model):
     date_updated = models.DateTimeField(auto_now=datetime.now)
     is_offered = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            # Subjects of a staff member, listed by name
+            models.Index(fields=['staff_id', 'subject_name'], name='subject_staff_name_idx'),
+        ]
+
     def get_course_id(self):
         return self.course_id
 
@@ -183,6 +193,7 @@ class Subject(models.Model):
 class CourseSection(models.Model):
     section_name = models.CharField(default='FLOATING', max_length=255, blank=False, null=False)
     course_id = models.ForeignKey(Course, on_delete=models.CASCADE)
+    date_updated = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         """Return string representation of the user"""
@@ -231,6 +242,10 @@ class Student(models.Model):
         permissions = (
             ('can_view_page', 'Can view page'),
         )
+        indexes = [
+            # Class lists of a section for a school year
+            models.Index(fields=['section', 'school_year'], name='student_section_year_idx'),
+        ]
 
     def get_full_name(self):
         return self.user_profile.first_name
@@ -250,6 +265,12 @@ class OfferedSubject(models.Model):
     date_created = models.DateTimeField(auto_now_add=True)
     date_updated = models.DateTimeField(auto_now=datetime.now)
 
+    class Meta:
+        indexes = [
+            # Students enrolled in a subject for a school year
+            models.Index(fields=['subject_id', 'school_year'], name='enrolment_subject_year_idx'),
+        ]
+
     def get_absolute_url(self):
         return reverse('admin-dashboard')
 
@@ -266,18 +287,67 @@ class Attendance(models.Model):
     subject_id = models.ForeignKey(Subject, on_delete=models.DO_NOTHING)
     section_id = models.ForeignKey(CourseSection, on_delete=models.CASCADE)
     attendance_date = models.DateTimeField(auto_now_add=True)
+    # Local date the attendance was taken on, a class has at most one attendance entry per day
+    attendance_day = models.DateField(default=timezone.localdate)
     school_year = models.ForeignKey(SchoolYearModel, on_delete=models.CASCADE)
     date_created = models.DateTimeField(auto_now_add=True)
     date_updated = models.DateTimeField(auto_now=datetime.now)
 
+    class Meta:
+        indexes = [
+            # Attendance of a subject in a school year, by date (duplicate check and attendance lists)
+            models.Index(fields=['subject_id', 'school_year', 'date_created'], name='attendance_subject_year_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['subject_id', 'section_id', 'school_year', 'attendance_day'],
+                                    name='unique_class_attendance_day'),
+        ]
+
 
 class AttendanceReport(models.Model):
     student_id = models.ForeignKey(Student, on_delete=models.DO_NOTHING)
-    attendance_id = models.ForeignKey(Attendance, on_delete=models.DO_NOTHING)
+    # Indexed by the unique constraint below, which starts with this column
+    attendance_id = models.ForeignKey(Attendance, on_delete=models.DO_NOTHING, db_index=False)
     status = models.BooleanField(default=False)
     date_created = models.DateTimeField(auto_now_add=True)
     date_updated = models.DateTimeField(auto_now=datetime.now)
 
+    class Meta:
+        constraints = [
+            # A student is reported at most once per attendance entry
+            models.UniqueConstraint(fields=['attendance_id', 'student_id'], name='unique_attendance_student'),
+        ]
+
+
+class AttendanceSummary(models.Model):
+    """
+    Attendance sessions held and attended per enrolled student, subject and school year.
+    Kept up to date by create_attendance and update_attendance, rebuilt with `manage.py rebuild_attendance_summary`.
+    """
+    student_id = models.ForeignKey(Student, on_delete=models.CASCADE)
+    subject_id = models.ForeignKey(Subject, on_delete=models.CASCADE)
+    school_year = models.ForeignKey(SchoolYearModel, on_delete=models.CASCADE)
+    sessions_held = models.PositiveIntegerField(default=0)
+    sessions_attended = models.PositiveIntegerField(default=0)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student_id', 'subject_id', 'school_year'],
+                                    name='unique_attendance_summary'),
+        ]
+        indexes = [
+            # Rates of the students of a subject in a school year, e.g. who is at risk
+            models.Index(fields=['subject_id', 'school_year'], name='summary_subject_year_idx'),
+        ]
+
+    @property
+    def attendance_rate(self):
+        """Share of the sessions held the student attended, None before the first session"""
+        if not self.sessions_held:
+            return None
+        return self.sessions_attended / self.sessions_held
+
 
 class LeaveReportStaff(models.Model):
     staff_id = models.ForeignKey(Staff, on_delete=models.CASCADE)
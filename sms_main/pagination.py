@@ -0,0 +1,149 @@
+import hashlib
+import json
+from datetime import datetime
+from functools import reduce
+
+from django.core import signing
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .lookups import generations
+from .routers import primary
+
+CURSOR_SALT = 'sms_main.pagination.cursor'
+
+# Seconds a cached total is kept even if no write invalidates it earlier
+COUNT_CACHE_TIMEOUT = 300
+
+
+class InvalidCursor(Exception):
+    """Raised when a cursor is malformed or has been tampered with"""
+
+
+def encode_value(value):
+    # DjangoJSONEncoder cuts datetimes to milliseconds, the seek filter would match the last row of the page again
+    if isinstance(value, datetime):
+        return {'datetime': value.isoformat()}
+    return value
+
+
+def decode_value(value):
+    if not isinstance(value, dict):
+        return value
+    try:
+        parsed = parse_datetime(value['datetime']) if set(value) == {'datetime'} else None
+    except (TypeError, ValueError):
+        parsed = None
+    if parsed is None:
+        raise InvalidCursor('Invalid cursor.')
+    return parsed
+
+
+def encode_cursor(values, ordering):
+    """
+    Turn the ordering values of the last row of a page into a signed, opaque cursor string.
+    The ordering is signed with the values, a cursor only continues the ordering it was made for.
+    """
+    values = json.loads(json.dumps([encode_value(value) for value in values], cls=DjangoJSONEncoder))
+    return signing.dumps({'ordering': list(ordering), 'values': values}, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(cursor, ordering):
+    """
+    Read the ordering values back from a cursor
+    :param cursor: cursor string produced by encode_cursor
+    :param ordering: ordering the cursor must have been made for
+    :return: list of ordering values
+    """
+    try:
+        payload = signing.loads(cursor, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        raise InvalidCursor('Invalid cursor.')
+    # A cursor of another sort order, e.g. kept by the browser after the user changed the sort column
+    if not isinstance(payload, dict) or payload.get('ordering') != list(ordering):
+        raise InvalidCursor('Invalid cursor.')
+    values = payload.get('values')
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise InvalidCursor('Invalid cursor.')
+    return [decode_value(value) for value in values]
+
+
+def row_value(row, field):
+    """Read an ordering field from a values() dict or by following the '__' path on a model instance"""
+    if isinstance(row, dict):
+        return row[field]
+    return reduce(getattr, field.split('__'), row)
+
+
+class KeysetPaginator:
+    """
+    Seek (keyset) pagination over a queryset.
+    Instead of OFFSET, every page continues strictly after the ordering values of the previous page's last row,
+    so fetching page N costs the same as fetching the first page.
+    The last ordering field must be unique (usually the primary key) so the order is total and stable.
+    Ordering fields must be non-null: NULL compares as neither greater nor lower, the seek filter would skip the
+    rows holding it, and databases disagree on where NULLs sort.
+    Ordering fields that are read from values() rows must be part of the values() projection.
+    """
+
+    def __init__(self, queryset, ordering, page_size=50):
+        self.queryset = queryset
+        self.ordering = list(ordering)
+        self.fields = [field.lstrip('-') for field in self.ordering]
+        self.page_size = page_size
+
+    def seek_filter(self, values):
+        """
+        Build the condition 'row comes after values' for a composite ordering with mixed directions:
+        (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...
+        """
+        condition = Q()
+        equal = Q()
+        for ordering, field, value in zip(self.ordering, self.fields, values):
+            lookup = 'lt' if ordering.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return condition
+
+    def page(self, cursor=None):
+        """
+        Fetch one page
+        :param cursor: cursor returned with the previous page, None for the first page
+        :return: (rows, cursor of the next page or None on the last page)
+        """
+        queryset = self.queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(self.seek_filter(decode_cursor(cursor, self.ordering)))
+
+        # Read one extra row to know whether another page follows without running a COUNT
+        rows = list(queryset[:self.page_size + 1])
+        if len(rows) <= self.page_size:
+            return rows, None
+
+        rows = rows[:self.page_size]
+        values = [row_value(rows[-1], field) for field in self.fields]
+        if None in values:
+            raise ValueError(f'Keyset ordering fields must be non-null, {self.ordering} has a NULL value.')
+        return rows, encode_cursor(values, self.ordering)
+
+
+def cached_count(queryset, params):
+    """
+    Total number of rows of a filtered queryset, cached per set of filter params
+    until the model is written again or COUNT_CACHE_TIMEOUT passes.
+    Writes invalidate the totals with lookups.bump_generation, like the cached lookups.
+    :param queryset: filtered queryset to count
+    :param params: dict of the filters that produced the queryset, used as the cache key
+    """
+    generation, = generations([queryset.model])
+    digest = hashlib.md5(json.dumps(sorted(params.items()), cls=DjangoJSONEncoder).encode()).hexdigest()
+    key = f'sms_main:count:{queryset.model._meta.label_lower}:{generation}:{digest}'
+
+    count = cache.get(key)
+    if count is None:
+        with primary():
+            count = queryset.count()
+        cache.set(key, count, COUNT_CACHE_TIMEOUT)
+    return count
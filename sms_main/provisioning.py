@@ -0,0 +1,55 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .lookups import bump_generation
+from .models import AdminHOD, Staff, Student, OfferedSubject
+
+# Role row of each user level
+ROLE_MODELS = {
+    1: AdminHOD,
+    2: Staff,
+    3: Student,
+}
+
+
+def provision_user(user, subjects=(), **role_fields):
+    """
+    Save a new user together with its role row (AdminHOD, Staff or Student, picked by user_level) and, for students,
+    the enrolments of the given subjects. Everything is written in one transaction with one INSERT per table.
+    :param user: unsaved CustomUserProfile, with its password already set
+    :param subjects: Subject instances or ids the student is enrolled in
+    :param role_fields: field values of the role row, e.g. address for staff, or course_id and section for students
+    :return: the created role row, None for a user level without one
+    """
+    role_model = ROLE_MODELS.get(user.user_level)
+    with transaction.atomic():
+        user.save()
+        if role_model is None:
+            return None
+        role = role_model.objects.create(user_profile=user, **role_fields)
+        if subjects:
+            OfferedSubject.objects.bulk_create([
+                OfferedSubject(subject_id_id=getattr(subject, 'pk', subject), student_id=role,
+                               school_year_id=role.school_year_id)
+                for subject in subjects
+            ])
+    return role
+
+
+def update_user(user, **role_fields):
+    """
+    Save an existing user and update fields of its role row in one transaction, with a single UPDATE per table
+    :param user: CustomUserProfile with its changes applied
+    :param role_fields: field values of the role row to change
+    """
+    role_model = ROLE_MODELS[user.user_level]
+    with transaction.atomic():
+        user.save()
+        if role_fields:
+            if role_model._meta.get_field('date_updated').auto_now:
+                # update() skips the auto_now handling of save()
+                role_fields['date_updated'] = timezone.now()
+            role_model.objects.filter(user_profile=user).update(**role_fields)
+            if role_model is Student:
+                # update() sends no post_save, the cached totals of the students table filter on these fields
+                bump_generation(Student)
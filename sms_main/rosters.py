@@ -0,0 +1,79 @@
+from django.db.models import Exists, OuterRef, Value, F
+from django.db.models.functions import Concat
+
+from .models import Student, Attendance, AttendanceReport
+
+
+def full_name_expression(prefix='user_profile__'):
+    """Build the 'Last, First M.' display name in SQL from the related user profile"""
+    return Concat(
+        F(f'{prefix}last_name'), Value(', '),
+        F(f'{prefix}first_name'), Value(' '),
+        F(f'{prefix}middle_initial'), Value('.'),
+    )
+
+
+def class_roster(subject_id, school_year_id):
+    """
+    Students enrolled in a subject for a school year, read with one joined query.
+    Returns a values() queryset whose rows hold the student 'id' and the formatted 'full_name'.
+    """
+    return Student.objects.filter(
+        offeredsubject__subject_id=subject_id,
+        offeredsubject__school_year=school_year_id
+    ).annotate(
+        full_name=full_name_expression()
+    ).order_by(
+        'user_profile__last_name', 'user_profile__first_name'
+    ).values('id', 'full_name')
+
+
+def attendance_roster(attendance_id, subject_id, school_year_id):
+    """Class list of an attendance entry with an 'is_present' flag per student, computed in a single query"""
+    present = AttendanceReport.objects.filter(attendance_id=attendance_id, student_id=OuterRef('pk'))
+    return class_roster(subject_id, school_year_id).annotate(is_present=Exists(present))
+
+
+def attendance_matrix(subject_id, section_id, school_year_id, staff_id):
+    """
+    Term attendance of a class, students x sessions, as one bitset per student.
+    The sessions, the class list and the present records are read with one query each, the bits are set in memory.
+    Bit i of a student's bitset (least significant first) is set when the student attended sessions[i].
+    Only the classes of subjects taught by staff_id are returned.
+    :return: dict with 'sessions' [[id, day], ...] ordered by day, 'session_totals' (students present per session)
+             and 'students' [[id, full name, bitset as hex, sessions attended], ...]
+    """
+    sessions = list(Attendance.objects.filter(
+        subject_id=subject_id, section_id=section_id, school_year_id=school_year_id, subject_id__staff_id=staff_id
+    ).order_by('attendance_day', 'id').values_list('id', 'attendance_day'))
+    # One filter() call so every condition applies to the same enrolment
+    students = list(Student.objects.filter(
+        section=section_id,
+        offeredsubject__subject_id=subject_id,
+        offeredsubject__school_year=school_year_id,
+        offeredsubject__subject_id__staff_id=staff_id
+    ).annotate(
+        full_name=full_name_expression()
+    ).order_by(
+        'user_profile__last_name', 'user_profile__first_name'
+    ).values_list('id', 'full_name'))
+
+    column = {attendance_id: index for index, (attendance_id, _) in enumerate(sessions)}
+    bits = dict.fromkeys((student_id for student_id, _ in students), 0)
+    session_totals = [0] * len(sessions)
+    if sessions and students:
+        present = AttendanceReport.objects.filter(attendance_id__in=list(column)).values_list('student_id',
+                                                                                            'attendance_id')
+        for student_id, attendance_id in present.iterator():
+            # Students who left the section keep their reports but are not part of the class list
+            if student_id in bits:
+                index = column[attendance_id]
+                bits[student_id] |= 1 << index
+                session_totals[index] += 1
+
+    return {
+        'sessions': [[attendance_id, day] for attendance_id, day in sessions],
+        'session_totals': session_totals,
+        'students': [[student_id, full_name, format(bits[student_id], 'x'), bin(bits[student_id]).count('1')]
+                     for student_id, full_name in students],
+    }
@@ -0,0 +1,95 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+# Cookie telling the next requests of a browser to read from the primary, set after a request that wrote
+STICKY_COOKIE = 'sms_primary'
+
+# Database the sms_main reads of the current request go to, None for the primary
+read_database = ContextVar('sms_main_read_database', default=None)
+# Set while a request runs, records whether it wrote to the sms_main tables
+request_writes = ContextVar('sms_main_request_writes', default=None)
+
+
+def replica_alias():
+    """Alias of the read replica, None when DATABASES has none"""
+    alias = getattr(settings, 'REPLICA_DATABASE', 'replica')
+    return alias if alias in connections.databases else None
+
+
+@contextmanager
+def use_database(alias):
+    """Send the sms_main reads of the block to alias, None for the primary"""
+    token = read_database.set(alias)
+    try:
+        yield
+    finally:
+        read_database.reset(token)
+
+
+def primary():
+    """
+    Read from the primary inside the block. Used to fill the shared caches (lookups, counts, identities),
+    a lagging replica would store outdated rows under the current generation.
+    """
+    return use_database(None)
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends the reads of sms_main models to the replica while ReplicaMiddleware allows it for the current request.
+    Writes and every other read go to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'sms_main':
+            return read_database.get()
+        return None
+
+    def db_for_write(self, model, **hints):
+        writes = request_writes.get()
+        if writes is not None and model._meta.app_label == 'sms_main':
+            writes.append(model._meta.label)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
+
+
+class ReplicaMiddleware:
+    """
+    Runs the queries of views marked with ReplicaReadMixin on the read replica, for the HTTP methods listed in their
+    replica_methods. The view, its template rendering and its conditional (ETag) checks all read the replica.
+    A request that writes sets STICKY_COOKIE for REPLICA_STICKY_SECONDS, during which the browser's requests read from
+    the primary so the user always sees their own changes despite the replication lag.
+    Not used when DATABASES has no replica.
+    """
+
+    def __init__(self, get_response):
+        if replica_alias() is None:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.sticky_seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+
+    def __call__(self, request):
+        writes = []
+        writes_token = request_writes.set(writes)
+        read_token = read_database.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            read_database.reset(read_token)
+            request_writes.reset(writes_token)
+        if writes:
+            response.set_cookie(STICKY_COOKIE, '1', max_age=self.sticky_seconds, httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'view_class', view_func)
+        if request.method in getattr(view, 'replica_methods', ()) and STICKY_COOKIE not in request.COOKIES:
+            # Reset by __call__ once the response is ready
+            read_database.set(replica_alias())
@@ -0,0 +1,60 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.query import QuerySet
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the standard library encoder is used without it
+    orjson = None
+
+# Rows encoded per chunk when a response is built from a queryset
+CHUNK_SIZE = 2000
+
+_encoder = DjangoJSONEncoder(separators=(',', ':'), ensure_ascii=False)
+
+
+def dumps(obj):
+    """Encode obj as compact JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_encoder.default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    return _encoder.encode(obj).encode()
+
+
+def iter_rows(source, fields):
+    """
+    Yield the values of the given fields as tuples.
+    Querysets are read with values_list() so no model instance is built, lists of instances (e.g. cached lookups)
+    are read attribute by attribute.
+    """
+    if isinstance(source, QuerySet):
+        yield from source.values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+    else:
+        for obj in source:
+            yield tuple(getattr(obj, field) for field in fields)
+
+
+def iter_projection(source, fields, chunk_size=CHUNK_SIZE):
+    """
+    Encode rows as {"fields": [...], "rows": [[...], ...]} and yield the document in pieces of chunk_size rows.
+    :param source: queryset or iterable of model instances
+    :param fields: field names, in the order the values appear in each row
+    """
+    yield b'{"fields":' + dumps(list(fields)) + b',"rows":['
+    chunk = []
+    first = True
+    for row in iter_rows(source, fields):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield (b'' if first else b',') + dumps(chunk)[1:-1]
+            chunk = []
+            first = False
+    if chunk:
+        yield (b'' if first else b',') + dumps(chunk)[1:-1]
+    yield b']}'
+
+
+def projection_response(source, fields, **kwargs):
+    """HttpResponse holding the projection of source, see iter_projection"""
+    return HttpResponse(b''.join(iter_projection(source, fields)), content_type='application/json', **kwargs)
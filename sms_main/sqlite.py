@@ -0,0 +1,77 @@
+import sqlite3
+import time
+from datetime import date, datetime
+
+from django.conf import settings
+
+# Applied to every new connection of the sms_main.backends.sqlite3 backend, see SQLITE_PRAGMAS in settings.py.
+# busy_timeout comes first so switching the journal mode waits for other connections instead of failing.
+DEFAULT_PRAGMAS = {
+    # Milliseconds a connection waits for a lock held by another connection before "database is locked"
+    'busy_timeout': 5000,
+    # Readers no longer block the writer and the writer no longer blocks readers. Stored in the database file.
+    'journal_mode': 'WAL',
+    # With WAL, only syncs at checkpoints. A power loss can lose the last commits but never corrupts the file.
+    'synchronous': 'NORMAL',
+    # Negative values are KiB, 64 MiB of page cache per connection
+    'cache_size': -65536,
+    # Read the first 256 MiB of the file through memory mapping instead of read() calls
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+}
+
+
+def configured_pragmas():
+    return getattr(settings, 'SQLITE_PRAGMAS', DEFAULT_PRAGMAS) or {}
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    """
+    Run PRAGMA name = value for every entry of pragmas
+    :param dbapi_connection: sqlite3.Connection
+    :param pragmas: dict of pragma name to value
+    """
+    for name, value in pragmas.items():
+        dbapi_connection.execute(f'PRAGMA {name} = {value}')
+
+
+def attendance_writer(path, pragmas, begin, worker, start_at, seconds, class_size):
+    """
+    Worker process of the sqlite-writes benchmark. Until the time is up it writes attendance entries the way
+    create_attendance does: a read of the class, then the entry and its reports in a transaction opened with begin.
+    Only uses the standard library so it also runs in spawned processes.
+    :return: (durations of the committed transactions in ms, number of "database is locked" errors)
+    """
+    db = sqlite3.connect(path, timeout=5.0, isolation_level=None)
+    apply_pragmas(db, pragmas)
+    now = datetime.utcnow().isoformat(' ')
+    today = date.today().isoformat()
+    durations, errors = [], 0
+    time.sleep(max(start_at - time.time(), 0))
+    section = 0
+    while time.time() < start_at + seconds:
+        section += 1
+        start = time.perf_counter()
+        try:
+            db.execute(begin)
+            db.execute('SELECT COUNT(*) FROM sms_main_attendance WHERE subject_id_id = ?', (worker,)).fetchone()
+            attendance_id = db.execute(
+                'INSERT INTO sms_main_attendance (subject_id_id, section_id_id, school_year_id, attendance_date, '
+                'attendance_day, date_created, date_updated) VALUES (?, ?, 1, ?, ?, ?, ?)',
+                (worker, section, now, today, now, now)
+            ).lastrowid
+            db.executemany(
+                'INSERT INTO sms_main_attendancereport (student_id_id, attendance_id_id, status, date_created, '
+                'date_updated) VALUES (?, ?, 0, ?, ?)',
+                [(student_id, attendance_id, now, now) for student_id in range(class_size)]
+            )
+            db.execute('COMMIT')
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            db.execute('ROLLBACK')
+            errors += 1
+        else:
+            durations.append((time.perf_counter() - start) * 1000)
+    db.close()
+    return durations, errors
@@ -1,22 +1,30 @@
 import json
-from datetime import datetime, date
+from datetime import datetime
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core import serializers
 from django.http import request, HttpResponse, JsonResponse, Http404
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse_lazy
 from django.utils.decorators import method_decorator
 from django.views import View
+from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 from django.views.generic import TemplateView, ListView, CreateView, UpdateView
 
+from . import exports, lookups
 from .admin_views import custom_message
+from .attendance import create_attendance, update_attendance, todays_attendance, AttendanceError, \
+    DuplicateAttendanceError
+from .etags import aggregate_validators
 from .forms import CreateAttendanceForm, LeaveApplicationForm, StaffFeedbackForm, StaffEditFeedbackForm
-from .mixins import StaffCheckMixin
+from .exports import ExportError
+from .mixins import StaffCheckMixin, ReplicaReadMixin, ExportMixin
 from .models import Attendance, Subject, SchoolYearModel, OfferedSubject, CustomUserProfile, Student, AttendanceReport, \
     CourseSection, LeaveReportStaff, StaffFeedBack
+from .rosters import attendance_roster, attendance_matrix
+from .serialization import dumps, projection_response
 
 
 class StaffDashboardView(LoginRequiredMixin, StaffCheckMixin, TemplateView):
@@ -33,7 +41,6 @@ class CreateStudentAttendanceView(LoginRequiredMixin, StaffCheckMixin, CreateVie
     form_class = CreateAttendanceForm
     login_url = 'login'
     success_url = reverse_lazy('staff-dashboard')
-    school_years = SchoolYearModel.objects.all().order_by('-school_year_end')
     links = {
         'Home': 'staff-dashboard',
         'Student Attendance': ''
@@ -47,8 +54,8 @@ class CreateStudentAttendanceView(LoginRequiredMixin, StaffCheckMixin, CreateVie
         initial = super(CreateStudentAttendanceView, self).get_initial(**kwargs)
         initial['current_date'] = datetime.now
         initial['page_title'] = 'Staff Attendance'
-        initial['school_years_obj'] = SchoolYearModel.objects.all().order_by('-school_year_end')
-        initial['subjects_obj'] = Subject.objects.filter(staff_id=self.request.user.id).order_by('subject_name').only('id', 'subject_name', 'course_id')
+        initial['school_years_obj'] = lookups.school_years()
+        initial['subjects_obj'] = lookups.staff_subjects(self.request.user.id)
         return initial
 
     def form_valid(self, form):
@@ -58,46 +65,21 @@ class CreateStudentAttendanceView(LoginRequiredMixin, StaffCheckMixin, CreateVie
         section = form.cleaned_data['section_id']
 
         # Check if attendance entry already exists
-        existing_attendance = Attendance.objects.filter(
-            subject_id=subject,
-            school_year_id=school_year,
-            date_created__startswith=date.today(),
-            subject_id__staff_id=self.request.user.id
-        ).only('id')
-
-        is_error = False
-        if not existing_attendance:
-            # Create a new Attendance Entry
-            subject = get_object_or_404(Subject, pk=subject.id)
-            school_year = get_object_or_404(SchoolYearModel, pk=school_year.id)
-            section = get_object_or_404(CourseSection, id=section.id)
-            new_attendance = Attendance(subject_id=subject, school_year=school_year, section_id=section)
-            # Check if at least 1 student is present then make an attendance entry then make an  attendance report for every student
-            # otherwise, only make an attendance entry
-            if student_id_list:
-                for student_id in student_id_list:
-                    # Save an attendance for each selected students
-                    try:
-                        student = get_object_or_404(Student, user_profile=student_id)
-                        # Create an instance property for signal reference to create AttendanceReport Entry
-                        new_attendance._student_id = student
-                        new_attendance.save()
-                        # custom_message(self.request, 'Attendance has been created.', "success")
-                    except:
-                        # custom_message(self.request, "There's an error in saving the attendance.", "error")
-                        is_error = True
-                        break
-            else:
-                new_attendance._student_id = False
-                new_attendance.save()
-        else:
+        if todays_attendance(subject, section, school_year).exists():
             custom_message(self.request, "An attendance for this subject today already exists.", "error")
             return redirect(self.success_url)
 
-        if not is_error:
-            custom_message(self.request, 'Attendance has been created.', "success")
-        else:
+        # Create the attendance entry together with an attendance report for every selected student
+        try:
+            create_attendance(subject, section, school_year, student_id_list)
+        except DuplicateAttendanceError:
+            custom_message(self.request, "An attendance for this subject today already exists.", "error")
+            return redirect(self.success_url)
+        except AttendanceError:
             custom_message(self.request, "There's an error in saving the attendance.", "error")
+            return redirect(self.success_url)
+
+        custom_message(self.request, 'Attendance has been created.', "success")
         return redirect(self.success_url)
 
     def form_invalid(self, form):
@@ -105,118 +87,162 @@ class CreateStudentAttendanceView(LoginRequiredMixin, StaffCheckMixin, CreateVie
         return super().form_invalid(form)
 
 
-class StudentAttendanceReport(LoginRequiredMixin, StaffCheckMixin, ListView):
+class StudentAttendanceReport(LoginRequiredMixin, StaffCheckMixin, ReplicaReadMixin, ListView):
     model = Subject
     context_object_name = 'subjects_obj'
     template_name = 'staff/student_attendance_report.html'
-    school_years = SchoolYearModel.objects.all().order_by('-school_year_end')
     extra_context = {
         'page_title': 'Student Attendance Report',
         'page_header_title': 'Student Attendance Report',
-        'school_years_obj': school_years,
     }
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['school_years_obj'] = lookups.school_years()
+        return context
+
     def get_queryset(self):
         qs = super().get_queryset()
         # Filter query by the variable 'id' set from the url
         return qs.filter(staff_id=self.kwargs['id']).order_by('subject_name')
 
 
-class AjaxFetchStudents(View):
-    model = OfferedSubject
+def get_params(request, *names):
+    """Read the named GET parameters, None when one of them is missing"""
+    values = [request.GET.get(name) for name in names]
+    if not all(values):
+        return None
+    return values
 
-    @method_decorator(csrf_exempt)
-    def dispatch(self, *args, **kwargs):
-        return super(AjaxFetchStudents, self).dispatch(*args, **kwargs)
 
-    def get(self, *args, **kwargs):
-        custom_message(self.request, "Invalid AJAX Request", "error")
-        return JsonResponse({"success": False, "method": self.request.method, "is_ajax": self.request.is_ajax()})
+def enrolment_queryset(request):
+    """Enrolments behind AjaxFetchStudents, used to validate cached copies of its response"""
+    params = get_params(request, 'subject_id', 'staff_id', 'section_id', 'school_year_id')
+    if params is None:
+        return None
+    subject_id, staff_id, section_id, school_year_id = params
+    return OfferedSubject.objects.filter(subject_id=subject_id, subject_id__staff_id=staff_id,
+                                         student_id__section=section_id, student_id__school_year=school_year_id)
 
-    def post(self, *args, **kwargs):
-        students = []
-        if self.request.method == "POST":
-            body_unicode = self.request.body
-            body = json.loads(body_unicode)
-            subject_id = body['subject_id']
-            staff_id = body['staff_id']
-            section_id = body['section_id']
-            school_year_id = body['school_year_id']
-
-            # students = OfferedSubject.objects.filter(subject_id=subject_id, school_year=school_year_id, subject_id__staff_id=staff_id)
-            students = get_user_model().objects.filter(student__subjects__staff_id=staff_id,
-                                                       student__subjects__id=subject_id,
-                                                       student__section=section_id,
-                                                       student__school_year__id=school_year_id)
-
-        if not students:
-            data = json.dumps({})
-        else:
-            data = serializers.serialize('json', students, fields=('id', 'first_name', 'middle_initial', 'last_name'))
-        return HttpResponse(data, content_type="application/json")
 
+def attendance_list_queryset(request):
+    """Attendance entries listed by AjaxFetchAttendanceList"""
+    params = get_params(request, 'subject_id', 'staff_id', 'school_year_id')
+    if params is None:
+        return None
+    subject_id, staff_id, school_year_id = params
+    return Attendance.objects.filter(subject_id__staff_id=staff_id, subject_id=subject_id,
+                                     school_year_id=school_year_id)
 
-class AjaxFetchAttendanceList(View):
-    @method_decorator(csrf_exempt)
-    def dispatch(self, *args, **kwargs):
-        return super(AjaxFetchAttendanceList, self).dispatch(*args, **kwargs)
 
+def course_sections_queryset(request):
+    """Sections listed by AjaxFetchSections"""
+    params = get_params(request, 'course_id')
+    if params is None:
+        return None
+    return lookups.course_sections.queryset(*params)
+
+
+# The names come from the user profiles
+students_etag, students_last_modified = aggregate_validators(
+    enrolment_queryset,
+    date_fields=('date_updated', 'student_id__date_updated', 'student_id__user_profile__date_updated')
+)
+attendance_list_etag, attendance_list_last_modified = aggregate_validators(attendance_list_queryset)
+sections_etag, sections_last_modified = aggregate_validators(course_sections_queryset)
+
+
+def invalid_request(request):
+    return JsonResponse({"success": False, "method": request.method, "is_ajax": request.is_ajax()}, status=400)
+
+
+@method_decorator(cache_control(private=True, no_cache=True), name='dispatch')
+class AjaxFetchStudents(ReplicaReadMixin, View):
+    """Students enrolled in a subject and section. Browsers revalidate with the ETag and get 304 when unchanged."""
+    model = OfferedSubject
+
+    @method_decorator(condition(etag_func=students_etag, last_modified_func=students_last_modified))
     def get(self, *args, **kwargs):
-        custom_message(self.request, "Invalid AJAX Request", "error")
-        return JsonResponse({"success": False, "method": self.request.method, "is_ajax": self.request.is_ajax()})
+        params = get_params(self.request, 'subject_id', 'staff_id', 'section_id', 'school_year_id')
+        if params is None:
+            return invalid_request(self.request)
+        subject_id, staff_id, section_id, school_year_id = params
 
-    def post(self, *args, **kwargs):
-        students = []
-        if self.request.method == "POST":
-            body_unicode = self.request.body
-            body = json.loads(body_unicode)
-            subject_id = body['subject_id']
-            staff_id = body['staff_id']
-            school_year_id = body['school_year_id']
-            attendance = Attendance.objects.filter(subject_id__staff_id=staff_id,
-                                                       subject_id=subject_id,
-                                                       school_year_id=school_year_id)
-
-        if not attendance:
-            data = json.dumps({})
-        else:
-            data = serializers.serialize('json', attendance, fields=('id', 'attendance_date'))
-        return HttpResponse(data, content_type="application/json")
+        students = get_user_model().objects.filter(student__subjects__staff_id=staff_id,
+                                                   student__subjects__id=subject_id,
+                                                   student__section=section_id,
+                                                   student__school_year__id=school_year_id)
+        return projection_response(students, ('id', 'first_name', 'middle_initial', 'last_name'))
 
 
-class AjaxFetchSections(View):
+@method_decorator(cache_control(private=True, no_cache=True), name='dispatch')
+class AjaxFetchAttendanceList(ReplicaReadMixin, View):
+    """Attendance dates of a subject in a school year, answered with 304 when nothing changed"""
 
-    @method_decorator(csrf_exempt)
-    def dispatch(self, *args, **kwargs):
-        return super(AjaxFetchSections, self).dispatch(*args, **kwargs)
+    @method_decorator(condition(etag_func=attendance_list_etag, last_modified_func=attendance_list_last_modified))
+    def get(self, *args, **kwargs):
+        attendance = attendance_list_queryset(self.request)
+        if attendance is None:
+            return invalid_request(self.request)
+        return projection_response(attendance.order_by('attendance_date'), ('id', 'attendance_date'))
 
+
+@method_decorator(cache_control(private=True, no_cache=True), name='dispatch')
+class AjaxFetchSections(View):
+    """Sections of a course, answered with 304 when nothing changed"""
+
+    @method_decorator(condition(etag_func=sections_etag, last_modified_func=sections_last_modified))
     def get(self, *args, **kwargs):
-        custom_message(self.request, "Invalid AJAX Request", "error")
-        return JsonResponse({"success": False, "method": self.request.method, "is_ajax": self.request.is_ajax()})
+        sections = course_sections_queryset(self.request)
+        if sections is None:
+            return invalid_request(self.request)
 
-    def post(self, *args, **kwargs):
-        sections = []
-        if self.request.method == "POST":
-            body_unicode = self.request.body
-            body = json.loads(body_unicode)
-            course_id = body['courseId']
-            sections = CourseSection.objects.filter(course_id=course_id)
-        else:
-            custom_message(self.request, "Invalid AJAX Request", "error")
-            return JsonResponse({"success": False, "method": self.request.method, "is_ajax": self.request.is_ajax()})
+        return projection_response(sections, ('id', 'section_name'))
 
-        if not sections:
-            data = json.dumps({})
-        else:
-            data = serializers.serialize('json', sections, fields=('id', 'section_name'))
-        return HttpResponse(data, content_type="application/json")
+
+@method_decorator(cache_control(private=True, no_cache=True), name='dispatch')
+class AjaxAttendanceMatrix(LoginRequiredMixin, StaffCheckMixin, ReplicaReadMixin, View):
+    """
+    Attendance of a class over the whole term: the sessions, one bitset per student with its total and the total of
+    every session (see rosters.attendance_matrix). Bitsets are hex strings, they outgrow JavaScript numbers.
+    """
+
+    def get(self, *args, **kwargs):
+        params = get_params(self.request, 'subject_id', 'section_id', 'school_year_id')
+        if params is None:
+            return invalid_request(self.request)
+        matrix = attendance_matrix(*params, staff_id=self.request.user.id)
+        return HttpResponse(dumps(matrix), content_type='application/json')
+
+
+class ExportAttendance(LoginRequiredMixin, StaffCheckMixin, ReplicaReadMixin, ExportMixin, View):
+    """Students present at each attendance entry of a subject in a school year, for the subjects of the staff"""
+    export = exports.ATTENDANCE
+
+    def get_export_failure_url(self):
+        return reverse_lazy('view-student-attendance-report', kwargs={'id': self.request.user.id})
+
+    def get_export_queryset(self):
+        params = get_params(self.request, 'subject_id', 'school_year_id')
+        if params is None:
+            raise ExportError('Select a subject and a school year to export.')
+        subject_id, school_year_id = params
+        # Entries in the order of attendance_subject_year_idx, so only the students of one entry are sorted at a
+        # time and rows are sent as the entries are read instead of after sorting the whole term
+        return AttendanceReport.objects.filter(
+            attendance_id__subject_id=subject_id,
+            attendance_id__school_year=school_year_id,
+            attendance_id__subject_id__staff_id=self.request.user.id
+        ).order_by('attendance_id__date_created', 'attendance_id', 'student_id')
 
 
 class AjaxSaveStudentAttendance(View):
     pass
 
 
-class AjaxViewAttendance(View):
+class AjaxViewAttendance(ReplicaReadMixin, View):
+    # The class list is read with a POST
+    replica_methods = ('GET', 'HEAD', 'POST')
 
     @method_decorator(csrf_exempt)
     def dispatch(self, *args, **kwargs):
@@ -234,22 +260,10 @@ class AjaxViewAttendance(View):
             attendance_id = body['attendance']
             subject_id = body['subject_id']
             school_year = body['school_year_id']
-            qs = AttendanceReport.objects.select_related('student_id').filter(attendance_id=attendance_id).only('student_id')
-            class_list = OfferedSubject.objects.filter(subject_id=subject_id, school_year=school_year)
-            present_students = []
-            attendance_list = []
-            for ids in qs:
-                present_students.append(ids.student_id.id)
-            for student in class_list:
-                if student.student_id.id in present_students:
-                    is_present = 1
-                else:
-                    is_present = 0
-                student_name = [student.student_id.user_profile.last_name + ", ",
-                                student.student_id.user_profile.first_name,
-                                student.student_id.user_profile.middle_initial + "."]
-                full_name = " ".join(student_name)
-                attendance_list.append([{'id': student.student_id.id}, {'full_name': full_name}, {'is_present':is_present}])
+            # Class list, names and present flags are read together in one query
+            roster = attendance_roster(attendance_id, subject_id, school_year)
+            attendance_list = [[{'id': student['id']}, {'full_name': student['full_name']},
+                                {'is_present': int(student['is_present'])}] for student in roster]
             return JsonResponse(attendance_list, safe=False)
         else:
             custom_message(self.request, "Invalid AJAX Request", "error")
@@ -272,29 +286,19 @@ class AjaxUpdateAttendance(View):
             body = json.loads(body_unicode)
             attendance_id = body['attendance_id']
             id_list = body['id_list']
-            qs = AttendanceReport.objects.select_related('student_id').filter(attendance_id=attendance_id).values('student_id')
-            current_attendance = []
-            for attendance in qs:
-                cur_id = attendance['student_id']
-                current_attendance.append(cur_id)
-            for stud in id_list:
-                stud_id = int(stud['id'])
-                if stud['status']:
-                    if stud_id not in current_attendance:
-                        # Add student attendance record
-                        student = Student.objects.get(pk=stud['id'])
-                        att_id = Attendance.objects.get(pk=attendance_id)
-                        new_attendance = AttendanceReport(student_id=student, attendance_id=att_id)
-                        new_attendance.save()
-                elif stud_id in current_attendance:
-                    # Delete student attendance record
-                    AttendanceReport.objects.filter(student_id=stud['id'], attendance_id=attendance_id).delete()
+            try:
+                present = update_attendance(attendance_id, id_list)
+            except AttendanceError:
+                custom_message(self.request, "Unable to update the attendance report.", "error")
+                return JsonResponse({"success": False, "method": self.request.method, "is_ajax": self.request.is_ajax()},
+                                    status=400)
         else:
             custom_message(self.request, "Invalid AJAX Request", "error")
             return JsonResponse({"success": False, "method": self.request.method, "is_ajax": self.request.is_ajax()})
 
-        custom_message(self.request, "Attendance Report has been updated successfully","success")
-        return JsonResponse({"success": True, "method": self.request.method, "is_ajax": self.request.is_ajax()})
+        # Return the updated class list so the page can refresh itself without fetching it again
+        return JsonResponse({"success": True, "method": self.request.method, "is_ajax": self.request.is_ajax(),
+                             "present": present})
 
 
 class LeaveApplicationView(LoginRequiredMixin, StaffCheckMixin, CreateView):
@@ -307,6 +311,11 @@ class LeaveApplicationView(LoginRequiredMixin, StaffCheckMixin, CreateView):
         'page_header_title': 'Leave Application'
     }
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['staff'] = self.get_role()
+        return kwargs
+
     def form_valid(self, form):
         custom_message(self.request, 'Application for leave is sent successfully.', "success")
         return super().form_valid(form)
@@ -316,7 +325,7 @@ class LeaveApplicationView(LoginRequiredMixin, StaffCheckMixin, CreateView):
         return super().form_invalid(form)
 
 
-class LeaveReportView(LoginRequiredMixin, StaffCheckMixin, ListView):
+class LeaveReportView(LoginRequiredMixin, StaffCheckMixin, ReplicaReadMixin, ListView):
     model = LeaveReportStaff
     context_object_name = 'leave_report_obj'
     template_name = "staff/leave_report.html"
@@ -328,7 +337,7 @@ class LeaveReportView(LoginRequiredMixin, StaffCheckMixin, ListView):
     def get_queryset(self):
         qs = super().get_queryset()
         #Filter only leave applications of the current staff
-        return qs.filter(staff_id=self.request.user.staff.id).order_by('id')
+        return qs.filter(staff_id=self.get_role_id()).order_by('id')
 
 
 class StaffFeedBackView(LoginRequiredMixin, StaffCheckMixin, CreateView):
@@ -343,10 +352,15 @@ class StaffFeedBackView(LoginRequiredMixin, StaffCheckMixin, CreateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        staff_id = self.request.user.staff.id
+        staff_id = self.get_role_id()
         context["feedback_obj"] = StaffFeedBack.objects.filter(staff_id=staff_id)
         return context
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['staff'] = self.get_role()
+        return kwargs
+
     def form_valid(self, form):
         custom_message(self.request, 'Feedback is sent successfully.', "success")
         return super().form_valid(form)
@@ -370,6 +384,11 @@ class StaffEditFeedBackView(LoginRequiredMixin, StaffCheckMixin, UpdateView):
         feedback_id = self.kwargs.get('id')
         return get_object_or_404(StaffFeedBack, id=feedback_id)
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['staff'] = self.get_role()
+        return kwargs
+
     def form_valid(self, form):
         custom_message(self.request, 'Feedback has been updated.', "success")
         return super().form_valid(form)
@@ -0,0 +1,319 @@
+import csv
+import io
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction, IntegrityError
+
+from . import lookups
+from .models import CustomUserProfile, Student, OfferedSubject
+
+# Rows written per bulk_create batch
+DEFAULT_CHUNK_SIZE = 500
+
+# Passwords sent to a worker process at a time
+HASH_BATCH_SIZE = 8
+
+COLUMNS = ('email', 'first_name', 'middle_initial', 'last_name', 'password', 'gender', 'address', 'course',
+           'section', 'school_year', 'year_level', 'stat', 'subjects')
+REQUIRED_COLUMNS = ('email', 'first_name', 'middle_initial', 'last_name', 'gender', 'course', 'section',
+                    'school_year', 'year_level')
+GENDERS = ('M', 'F')
+
+# A row that could not be imported: line number in the file, email of the row and the list of problems
+RowError = namedtuple('RowError', 'line email messages')
+
+
+class StudentImportError(Exception):
+    """Raised when the import file itself cannot be read"""
+
+
+class ImportResult:
+    def __init__(self):
+        self.total = 0
+        self.created = 0
+        self.errors = []
+
+    @property
+    def failed(self):
+        return len(self.errors)
+
+
+def reference_key(value):
+    return ' '.join(str(value).split()).lower()
+
+
+def reference_map(objects, *names):
+    """Map the id and the (case insensitive) names of each object to its id"""
+    result = {}
+    for obj in objects:
+        result[str(obj.id)] = obj.id
+        for name in names:
+            result[reference_key(name(obj))] = obj.id
+    return result
+
+
+class ReferenceMaps:
+    """
+    Course, section, school year and subject maps used to validate the rows, built once per import from the cached
+    lookups so validating a row runs no query.
+    Each value may be given in the file either by id or by name, e.g. "BSIT", "A" or "2020 - 2021".
+    """
+
+    def __init__(self):
+        self.courses = reference_map(lookups.courses(), lambda course: course.course_name)
+        self.school_years = reference_map(lookups.school_years(), str, lambda sy: str(sy).replace(' ', ''))
+        self.sections = {}
+        for section in lookups.sections():
+            self.sections.setdefault(section.course_id_id, {}).update(
+                reference_map([section], lambda sec: sec.section_name)
+            )
+        self._subjects = {}
+
+    def subjects(self, course_id):
+        """Subjects offered under a course, loaded on first use"""
+        if course_id not in self._subjects:
+            self._subjects[course_id] = reference_map(lookups.offered_subjects(course_id),
+                                                      lambda subject: subject.subject_name)
+        return self._subjects[course_id]
+
+
+def read_rows(fileobj, filename):
+    """
+    Yield (line number, row dict) for each data row of a .csv or .xlsx file, one row at a time.
+    Column names are matched case insensitively.
+    :param fileobj: binary file object
+    :param filename: name of the file, its extension selects the format
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.csv':
+        text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+        try:
+            reader = csv.reader(text)
+            header = next(reader, None)
+            if header is None:
+                return
+            header = [reference_key(column) for column in header]
+            for values in reader:
+                if any(value.strip() for value in values):
+                    yield reader.line_num, dict(zip(header, values))
+        except UnicodeDecodeError:
+            raise StudentImportError('The CSV file must be UTF-8 encoded.')
+        except csv.Error as e:
+            raise StudentImportError(f'Unable to read the CSV file: {e}')
+        finally:
+            # Leave the underlying file open for the caller
+            text.detach()
+    elif extension == '.xlsx':
+        try:
+            import openpyxl
+        except ImportError:
+            raise StudentImportError('Reading .xlsx files requires the openpyxl package.')
+        workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            header = [reference_key(column or '') for column in header]
+            for line, values in enumerate(rows, start=2):
+                values = [cell_text(value) for value in values]
+                if any(values):
+                    yield line, dict(zip(header, values))
+        finally:
+            workbook.close()
+    else:
+        raise StudentImportError('Upload a .csv or .xlsx file.')
+
+
+def cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        # Spreadsheets store ids typed into a cell as floats
+        return str(int(value))
+    return str(value)
+
+
+def clean_row(raw, maps):
+    """
+    Validate a row against the reference maps
+    :return: (cleaned row, list of error messages)
+    """
+    raw = {column: (raw.get(column) or '').strip() for column in COLUMNS}
+    errors = [f'{column} is required.' for column in REQUIRED_COLUMNS if not raw[column]]
+    if errors:
+        return None, errors
+
+    row = {
+        'email': CustomUserProfile.objects.normalize_email(raw['email']),
+        'first_name': raw['first_name'],
+        'middle_initial': raw['middle_initial'],
+        'last_name': raw['last_name'],
+        'password': raw['password'],
+        'gender': raw['gender'].upper()[:1],
+        'address': raw['address'] or 'Unspecified',
+        'year_level': raw['year_level'].upper(),
+        'stat': raw['stat'].upper() or Student.Status.REGULAR,
+    }
+
+    try:
+        validate_email(row['email'])
+    except ValidationError:
+        errors.append(f"{raw['email']} is not a valid email address.")
+    if len(row['middle_initial']) > 2:
+        errors.append('middle_initial must be at most 2 characters.')
+    if row['gender'] not in GENDERS:
+        errors.append(f"Unknown gender {raw['gender']}.")
+    if row['year_level'] not in Student.Levels.values:
+        errors.append(f"Unknown year_level {raw['year_level']}.")
+    if row['stat'] not in Student.Status.values:
+        errors.append(f"Unknown stat {raw['stat']}.")
+
+    row['school_year_id'] = maps.school_years.get(reference_key(raw['school_year']))
+    if row['school_year_id'] is None:
+        errors.append(f"Unknown school_year {raw['school_year']}.")
+
+    row['course_id'] = maps.courses.get(reference_key(raw['course']))
+    if row['course_id'] is None:
+        errors.append(f"Unknown course {raw['course']}.")
+    else:
+        row['section_id'] = maps.sections.get(row['course_id'], {}).get(reference_key(raw['section']))
+        if row['section_id'] is None:
+            errors.append(f"Unknown section {raw['section']} for course {raw['course']}.")
+
+        subjects = maps.subjects(row['course_id'])
+        row['subject_ids'] = set()
+        for name in filter(None, (name.strip() for name in raw['subjects'].split(';'))):
+            subject_id = subjects.get(reference_key(name))
+            if subject_id is None:
+                errors.append(f"Subject {name} is not offered under course {raw['course']}.")
+            else:
+                row['subject_ids'].add(subject_id)
+
+    return row, errors
+
+
+def init_worker():
+    # Workers started with "spawn" (Windows, macOS) do not inherit the configured settings
+    django.setup()
+
+
+def hash_passwords(passwords, pool=None):
+    """Hash the passwords, in parallel when a process pool is given. Blank passwords become unusable passwords."""
+    to_hash = [password for password in passwords if password]
+    if pool is not None and len(to_hash) > 1:
+        hashed = iter(pool.map(make_password, to_hash, chunksize=HASH_BATCH_SIZE))
+    else:
+        hashed = iter([make_password(password) for password in to_hash])
+    return [next(hashed) if password else make_password(None) for password in passwords]
+
+
+def save_chunk(chunk, result, pool=None, dry_run=False):
+    """
+    Write a chunk of validated rows with one bulk_create per table.
+    Rows whose email already exists are reported instead of written.
+    :param chunk: list of (line number, cleaned row)
+    """
+    emails = [row['email'] for _, row in chunk]
+    existing = set(CustomUserProfile.objects.filter(email__in=emails).values_list('email', flat=True))
+    rows = []
+    for line, row in chunk:
+        if row['email'] in existing:
+            result.errors.append(RowError(line, row['email'], ['A user with this email already exists.']))
+        else:
+            rows.append((line, row))
+    if dry_run or not rows:
+        result.created += len(rows)
+        return
+
+    passwords = hash_passwords([row['password'] for _, row in rows], pool)
+    try:
+        with transaction.atomic():
+            # The batched equivalent of provisioning.provision_user
+            CustomUserProfile.objects.bulk_create([
+                CustomUserProfile(email=row['email'], first_name=row['first_name'],
+                                  middle_initial=row['middle_initial'], last_name=row['last_name'],
+                                  user_level=3, password=password)
+                for (_, row), password in zip(rows, passwords)
+            ])
+            # SQLite does not return the primary keys of bulk inserts, read them back by email
+            profile_ids = dict(CustomUserProfile.objects.filter(email__in=[row['email'] for _, row in rows])
+                               .values_list('email', 'id'))
+            Student.objects.bulk_create([
+                Student(user_profile_id=profile_ids[row['email']], gender=row['gender'], address=row['address'],
+                        course_id_id=row['course_id'], section_id=row['section_id'],
+                        school_year_id=row['school_year_id'], year_level=row['year_level'], stat=row['stat'])
+                for _, row in rows
+            ])
+            student_ids = dict(Student.objects.filter(user_profile_id__in=profile_ids.values())
+                               .values_list('user_profile_id', 'id'))
+            OfferedSubject.objects.bulk_create([
+                OfferedSubject(subject_id_id=subject_id, student_id_id=student_ids[profile_ids[row['email']]],
+                               school_year_id=row['school_year_id'])
+                for _, row in rows for subject_id in row['subject_ids']
+            ])
+    except IntegrityError as e:
+        for line, row in rows:
+            result.errors.append(RowError(line, row['email'], [f'The row could not be saved: {e}']))
+        return
+    result.created += len(rows)
+
+
+def import_students(fileobj, filename, chunk_size=DEFAULT_CHUNK_SIZE, workers=None, dry_run=False):
+    """
+    Import students from a .csv or .xlsx file.
+    The file is read row by row, valid rows are written in chunks of chunk_size with bulk_create and invalid rows
+    are collected in the error report of the result. Each chunk is saved in its own transaction.
+    :param fileobj: binary file object
+    :param filename: name of the file, its extension selects the format
+    :param chunk_size: rows written per bulk_create batch
+    :param workers: processes used to hash passwords, defaults to the number of CPUs. 0 or 1 hashes in-process.
+    :param dry_run: validate the file without writing anything
+    :return: ImportResult
+    """
+    maps = ReferenceMaps()
+    result = ImportResult()
+    seen = set()
+    chunk = []
+
+    pool = None
+    if not dry_run and (workers is None or workers > 1):
+        pool = ProcessPoolExecutor(workers, initializer=init_worker)
+    try:
+        for line, raw in read_rows(fileobj, filename):
+            result.total += 1
+            row, errors = clean_row(raw, maps)
+            if row is not None and row['email'] in seen:
+                errors.append('The email appears more than once in the file.')
+            if errors:
+                result.errors.append(RowError(line, (raw.get('email') or '').strip(), errors))
+                continue
+            seen.add(row['email'])
+            chunk.append((line, row))
+            if len(chunk) >= chunk_size:
+                save_chunk(chunk, result, pool, dry_run)
+                chunk = []
+        if chunk:
+            save_chunk(chunk, result, pool, dry_run)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if result.created and not dry_run:
+            # bulk_create skips the signal that drops the cached totals of the students table
+            lookups.bump_generation(Student)
+    result.errors.sort(key=lambda error: error.line)
+    return result
+
+
+def write_error_report(errors, fileobj):
+    """Write the rows that were not imported as CSV (line, email, error) to a text file object"""
+    writer = csv.writer(fileobj)
+    writer.writerow(('line', 'email', 'error'))
+    for error in errors:
+        writer.writerow((error.line, error.email, ' '.join(error.messages)))
@@ -0,0 +1,19 @@
+from django.test import TestCase
+
+from ..benchmarks import make_class
+
+
+class ClassTestCase(TestCase):
+    """
+    Tests of one class: a subject taught by a staff member to class_size students of a section, built once per
+    test case by benchmarks.make_class and available as cls.fixture.
+    """
+    class_size = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = make_class(cls.class_size)
+
+    def class_args(self):
+        """subject, section and school_year, the first arguments of create_attendance"""
+        return self.fixture['subject'], self.fixture['section'], self.fixture['school_year']
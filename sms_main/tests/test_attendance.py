@@ -0,0 +1,92 @@
+from datetime import date
+
+from django.utils import timezone
+
+from ..attendance import create_attendance, update_attendance, DuplicateAttendanceError, \
+    rebuild_attendance_summaries
+from ..models import Attendance, AttendanceReport, AttendanceSummary
+from .base import ClassTestCase
+
+
+class AttendanceConstraintTest(ClassTestCase):
+    """The database refuses a second attendance entry of a class on the same day"""
+    class_size = 2
+
+    def test_second_attendance_of_the_day_is_rejected(self):
+        # The check of the view can race with another submission, the constraint still refuses the second entry
+        create_attendance(*self.class_args(), self.fixture['user_profile_ids'])
+        with self.assertRaises(DuplicateAttendanceError):
+            create_attendance(*self.class_args(), self.fixture['user_profile_ids'])
+        self.assertEqual(Attendance.objects.filter(attendance_day=timezone.localdate()).count(), 1)
+        self.assertEqual(AttendanceReport.objects.count(), 2)
+
+
+class AttendanceSummaryTest(ClassTestCase):
+    """The summaries kept up to date by create_attendance and update_attendance match a rebuild from scratch"""
+    class_size = 4
+
+    def summaries(self):
+        return {(row.student_id_id, row.subject_id_id, row.school_year_id): (row.sessions_held, row.sessions_attended)
+                for row in AttendanceSummary.objects.all()}
+
+    def test_incremental_counts_match_a_rebuild(self):
+        fixture = self.fixture
+        first = create_attendance(*self.class_args(), fixture['user_profile_ids'][:3])
+        # The second session of the class, taken on another day
+        Attendance.objects.filter(pk=first.pk).update(attendance_day=date(2020, 6, 1))
+        second = create_attendance(*self.class_args(), fixture['user_profile_ids'][:1])
+        update_attendance(second.id, [{'id': student_id, 'status': index % 2}
+                                      for index, student_id in enumerate(fixture['student_ids'])])
+
+        student_ids = fixture['student_ids']
+        key = lambda student_id: (student_id, fixture['subject'].id, fixture['school_year'].id)
+        incremental = self.summaries()
+        self.assertEqual(incremental, {key(student_ids[0]): (2, 1), key(student_ids[1]): (2, 2),
+                                       key(student_ids[2]): (2, 1), key(student_ids[3]): (2, 1)})
+        self.assertEqual(AttendanceSummary.objects.get(student_id=student_ids[1]).attendance_rate, 1)
+
+        self.assertEqual(rebuild_attendance_summaries(), 4)
+        self.assertEqual(self.summaries(), incremental)
+
+
+class UpdateAttendanceTest(ClassTestCase):
+    """Corrections only touch the reports and summaries of the students whose state changed"""
+    class_size = 4
+
+    def setUp(self):
+        self.attendance = create_attendance(*self.class_args(), self.fixture['user_profile_ids'][:2])
+        self.student_ids = self.fixture['student_ids']
+
+    def reports(self):
+        return dict(AttendanceReport.objects.filter(attendance_id=self.attendance).values_list('student_id', 'id'))
+
+    def attended(self):
+        return dict(AttendanceSummary.objects.values_list('student_id', 'sessions_attended'))
+
+    def test_mixed_additions_and_removals(self):
+        before = self.reports()
+        first, second, third, fourth = self.student_ids
+        present = update_attendance(self.attendance.id, [
+            {'id': first, 'status': 1}, {'id': second, 'status': 0},
+            {'id': third, 'status': 1}, {'id': fourth, 'status': 0},
+        ])
+        self.assertEqual(present, sorted([first, third]))
+        after = self.reports()
+        self.assertEqual(set(after), {first, third})
+        # The report of the student who stayed present is kept, not deleted and written again
+        self.assertEqual(after[first], before[first])
+        self.assertEqual(self.attended(), {first: 1, second: 0, third: 1, fourth: 0})
+
+    def test_absent_student_marked_absent_again(self):
+        absent = self.student_ids[3]
+        with self.assertNumQueries(4):
+            present = update_attendance(self.attendance.id, [{'id': absent, 'status': 0}])
+        self.assertEqual(present, sorted(self.student_ids[:2]))
+        self.assertEqual(self.attended()[absent], 0)
+
+    def test_removal_with_a_summary_already_at_zero(self):
+        first = self.student_ids[0]
+        AttendanceSummary.objects.filter(student_id=first).update(sessions_attended=0)
+        update_attendance(self.attendance.id, [{'id': first, 'status': 0}])
+        self.assertNotIn(first, self.reports())
+        self.assertEqual(self.attended()[first], 0)
@@ -0,0 +1,112 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.urls import reverse
+
+from ..attendance import create_attendance
+from ..models import CustomUserProfile, CourseSection, Subject
+from ..provisioning import provision_user
+from .base import ClassTestCase
+
+
+class ConditionalGetTest(ClassTestCase):
+    """The AJAX lists answer 304 to a current validator and 200 once what they show changed"""
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.fixture['staff'])
+
+    def class_params(self, *names):
+        values = {
+            'subject_id': self.fixture['subject'].id,
+            'staff_id': self.fixture['staff'].id,
+            'section_id': self.fixture['section'].id,
+            'school_year_id': self.fixture['school_year'].id,
+            'course_id': self.fixture['course'].id,
+        }
+        return {name: values[name] for name in names}
+
+    def assertRevalidates(self, name, params, change):
+        """First answer 200, a revalidation with its ETag 304, after change() 200 with another ETag"""
+        url = reverse(name)
+        first = self.client.get(url, params)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        change()
+        changed = self.client.get(url, params, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+        return changed
+
+    def test_students_after_a_rename(self):
+        def rename():
+            profile = CustomUserProfile.objects.get(pk=self.fixture['user_profile_ids'][0])
+            profile.last_name = 'Renamed'
+            profile.save()
+
+        params = self.class_params('subject_id', 'staff_id', 'section_id', 'school_year_id')
+        response = self.assertRevalidates('ajax-staff-fetch-students', params, rename)
+        self.assertIn('Renamed', [row[3] for row in response.json()['rows']])
+
+    def test_students_ignore_logins(self):
+        params = self.class_params('subject_id', 'staff_id', 'section_id', 'school_year_id')
+        etag = self.client.get(reverse('ajax-staff-fetch-students'), params)['ETag']
+        profile = CustomUserProfile.objects.get(pk=self.fixture['user_profile_ids'][0])
+        profile.save(update_fields=['last_login'])
+        self.assertEqual(self.client.get(reverse('ajax-staff-fetch-students'), params,
+                                         HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_attendance_list_after_an_attendance(self):
+        params = self.class_params('subject_id', 'staff_id', 'school_year_id')
+        response = self.assertRevalidates(
+            'ajax-staff-fetch-attendance-report', params,
+            lambda: create_attendance(self.fixture['subject'], self.fixture['section'], self.fixture['school_year'],
+                                      self.fixture['user_profile_ids'])
+        )
+        self.assertEqual(len(response.json()['rows']), 1)
+
+    def test_attendance_list_last_modified(self):
+        create_attendance(self.fixture['subject'], self.fixture['section'], self.fixture['school_year'],
+                          self.fixture['user_profile_ids'])
+        url = reverse('ajax-staff-fetch-attendance-report')
+        params = self.class_params('subject_id', 'staff_id', 'school_year_id')
+        last_modified = self.client.get(url, params)['Last-Modified']
+        self.assertEqual(self.client.get(url, params, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_sections_after_a_new_section(self):
+        self.assertRevalidates(
+            'ajax-staff-fetch-sections', self.class_params('course_id'),
+            lambda: CourseSection.objects.create(section_name='second section', course_id=self.fixture['course'])
+        )
+
+    def test_sections_after_a_write_in_another_worker(self):
+        # The other worker's cache generations are never bumped here
+        def create_section():
+            with mock.patch('sms_main.signals.bump_generation'):
+                CourseSection.objects.create(section_name='second section', course_id=self.fixture['course'])
+
+        response = self.assertRevalidates('ajax-staff-fetch-sections', self.class_params('course_id'), create_section)
+        self.assertIn('second section', [row[1] for row in response.json()['rows']])
+
+    def test_subjects_after_a_write_in_another_worker(self):
+        admin = CustomUserProfile(email='conditional.admin@example.com', first_name='Admin', middle_initial='A',
+                                  last_name='Conditional', user_level=1, password='!')
+        provision_user(admin)
+        self.client.force_login(admin)
+
+        def create_subject():
+            with mock.patch('sms_main.signals.bump_generation'):
+                Subject.objects.create(subject_name='second subject', staff_id=self.fixture['staff'],
+                                       course_id=self.fixture['course'])
+
+        response = self.assertRevalidates('ajax-get-subjects', self.class_params('course_id'), create_subject)
+        self.assertIn('second subject', [row[1] for row in response.json()['rows']])
+
+    def test_validators_survive_a_cache_clear(self):
+        # A worker with an empty cache agrees with the one that answered first
+        params = self.class_params('subject_id', 'staff_id', 'section_id', 'school_year_id')
+        for name, params in (('ajax-staff-fetch-students', params),
+                             ('ajax-staff-fetch-sections', self.class_params('course_id'))):
+            etag = self.client.get(reverse(name), params)['ETag']
+            cache.clear()
+            self.assertEqual(self.client.get(reverse(name), params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
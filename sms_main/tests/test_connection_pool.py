@@ -0,0 +1,157 @@
+import importlib
+import sys
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase
+
+from ..database import database_config
+
+
+def fake_psycopg2():
+    """Stand-in psycopg2 modules, enough to import the PostgreSQL backend where psycopg2 is not installed"""
+    psycopg2 = mock.MagicMock(__version__='2.8.6 (dt dec pq3 ext lo64)')
+    psycopg2.Error = type('Error', (Exception,), {})
+    for name in ('InterfaceError', 'DatabaseError'):
+        setattr(psycopg2, name, type(name, (psycopg2.Error,), {}))
+    for name in ('DataError', 'OperationalError', 'IntegrityError', 'InternalError', 'ProgrammingError',
+                 'NotSupportedError'):
+        setattr(psycopg2, name, type(name, (psycopg2.DatabaseError,), {}))
+    return {'psycopg2': psycopg2, 'psycopg2.extensions': psycopg2.extensions, 'psycopg2.extras': psycopg2.extras,
+            'psycopg2.errorcodes': psycopg2.errorcodes}
+
+
+def import_backend():
+    """sms_main.backends.postgresql.base, imported with the fake psycopg2 when the real one is missing"""
+    try:
+        import psycopg2  # NOQA
+    except ImportError:
+        with mock.patch.dict(sys.modules, fake_psycopg2()):
+            # patch.dict drops the modules imported meanwhile again, so no other test sees the fake
+            return importlib.import_module('sms_main.backends.postgresql.base')
+    return importlib.import_module('sms_main.backends.postgresql.base')
+
+
+class FakeConnection:
+    """psycopg2 connection with the attributes the pool looks at"""
+
+    def __init__(self, status=None):
+        self.closed = 0
+        self.status = status
+
+    def get_transaction_status(self):
+        return self.status
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    """The pool hands out working connections, keeps the clean ones and never opens more than max_size"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.backend = import_backend()
+
+    def setUp(self):
+        self.pool = self.backend.ConnectionPool(max_size=2, timeout=0.01)
+        self.opened = []
+
+    def connect(self):
+        connection = FakeConnection(self.backend.extensions.TRANSACTION_STATUS_IDLE)
+        self.opened.append(connection)
+        return connection
+
+    def test_idle_connections_are_reused(self):
+        first = self.pool.get(self.connect, lambda connection: True)
+        self.pool.put(first)
+        self.assertIs(self.pool.get(self.connect, lambda connection: True), first)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_broken_idle_connections_are_replaced(self):
+        first = self.pool.get(self.connect, lambda connection: True)
+        self.pool.put(first)
+        second = self.pool.get(self.connect, lambda connection: False)
+        self.assertIsNot(second, first)
+        self.assertTrue(first.closed)
+
+    def test_closed_and_open_transaction_connections_are_discarded(self):
+        closed, in_transaction = self.pool.get(self.connect, bool), self.pool.get(self.connect, bool)
+        closed.closed = 1
+        in_transaction.status = self.backend.extensions.TRANSACTION_STATUS_INTRANS
+        self.pool.put(closed)
+        self.pool.put(in_transaction)
+        self.assertTrue(in_transaction.closed)
+        self.assertTrue(self.pool.idle.empty())
+        # Both slots were given back
+        self.pool.get(self.connect, bool)
+        self.pool.get(self.connect, bool)
+
+    def test_full_pool_times_out(self):
+        self.pool.get(self.connect, bool)
+        self.pool.get(self.connect, bool)
+        with self.assertRaises(self.backend.PoolTimeout):
+            self.pool.get(self.connect, bool)
+
+    def test_failed_connect_frees_its_slot(self):
+        def refuse():
+            raise self.backend.base.Database.OperationalError('refused')
+
+        for _ in range(3):
+            with self.assertRaises(self.backend.base.Database.OperationalError):
+                self.pool.get(refuse, bool)
+        self.pool.get(self.connect, bool)
+        self.pool.get(self.connect, bool)
+
+    def test_close(self):
+        connections = [self.pool.get(self.connect, bool) for _ in range(2)]
+        for connection in connections:
+            self.pool.put(connection)
+        self.pool.close()
+        self.assertTrue(all(connection.closed for connection in connections))
+        self.assertTrue(self.pool.idle.empty())
+
+
+class PooledDatabaseWrapperTest(SimpleTestCase):
+    """DatabaseWrapper takes its connections from the pool and checks them when health checks are on"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.backend = import_backend()
+
+    def tearDown(self):
+        self.backend.close_pools()
+
+    def wrapper(self, **environ):
+        settings_dict = database_config('postgres://localhost/sms', environ)
+        settings_dict.update(TIME_ZONE=None, AUTOCOMMIT=True, ATOMIC_REQUESTS=False)
+        return self.backend.DatabaseWrapper(settings_dict, alias='pool-test')
+
+    def test_connections_come_from_a_shared_pool(self):
+        first_wrapper, second_wrapper = self.wrapper(SMS_DB_POOL_SIZE='2'), self.wrapper(SMS_DB_POOL_SIZE='2')
+        new = FakeConnection(self.backend.extensions.TRANSACTION_STATUS_IDLE)
+        with mock.patch.object(self.backend.base.DatabaseWrapper, 'get_new_connection', return_value=new) as connect:
+            params = first_wrapper.get_connection_params()
+            self.assertNotIn('pool', params)
+            first_wrapper.connection = first_wrapper.get_new_connection(params)
+            first_wrapper._close()
+            self.assertIs(second_wrapper.get_new_connection(second_wrapper.get_connection_params()), new)
+        self.assertEqual(connect.call_count, 1)
+        self.assertIs(first_wrapper.pool, second_wrapper.pool)
+
+    def test_pool_refuses_persistent_connections(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.wrapper(SMS_DB_POOL_SIZE='2', SMS_CONN_MAX_AGE='60').get_connection_params()
+
+    def test_connection_works(self):
+        connection = mock.MagicMock()
+        self.assertTrue(self.wrapper(SMS_DB_POOL_SIZE='2').connection_works(connection))
+        connection.cursor.assert_not_called()
+
+        wrapper = self.wrapper(SMS_CONN_HEALTH_CHECKS='on')
+        self.assertTrue(wrapper.connection_works(connection))
+        connection.cursor.return_value.__enter__.return_value.execute.assert_called_once_with('SELECT 1')
+        connection.cursor.side_effect = self.backend.base.Database.OperationalError('server closed the connection')
+        self.assertFalse(wrapper.connection_works(connection))
@@ -0,0 +1,58 @@
+from unittest import skipUnless
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from ..database import database_config
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite pragma profile')
+class SqliteProfileTest(TestCase):
+    """Connections of the sms_main SQLite backend run with the SQLITE_PRAGMAS profile"""
+
+    def test_pragmas_are_applied(self):
+        # The test database lives in memory, so journal_mode and mmap_size are not checked
+        with connection.cursor() as cursor:
+            for name, expected in (('busy_timeout', 5000), ('synchronous', 1), ('cache_size', -65536),
+                                   ('temp_store', 2)):
+                cursor.execute(f'PRAGMA {name}')
+                self.assertEqual(cursor.fetchone()[0], expected, name)
+
+    def test_transaction_mode_is_not_a_connect_argument(self):
+        self.assertNotIn('transaction_mode', connection.get_connection_params())
+
+
+class DatabaseConfigTest(SimpleTestCase):
+    """SMS_DATABASE_URL and the SMS_CONN_* / SMS_DB_POOL_* variables map to the DATABASES entry"""
+
+    def test_sqlite(self):
+        config = database_config('sqlite:////srv/sms/db.sqlite3', {})
+        self.assertEqual(config['ENGINE'], 'sms_main.backends.sqlite3')
+        self.assertEqual(config['NAME'], '/srv/sms/db.sqlite3')
+        self.assertEqual(config['CONN_MAX_AGE'], 0)
+        self.assertEqual(config['OPTIONS'], {'transaction_mode': 'IMMEDIATE'})
+
+    def test_postgres(self):
+        config = database_config('postgres://sms:s%40cret@db:5433/school?sslmode=require', {})
+        self.assertEqual(config['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual((config['NAME'], config['USER'], config['PASSWORD'], config['HOST'], config['PORT']),
+                         ('school', 'sms', 's@cret', 'db', '5433'))
+        self.assertEqual(config['CONN_MAX_AGE'], 60)
+        self.assertFalse(config['CONN_HEALTH_CHECKS'])
+        self.assertEqual(config['OPTIONS'], {'sslmode': 'require'})
+
+    def test_health_checks_use_the_pooled_backend(self):
+        config = database_config('postgres://localhost/sms', {'SMS_CONN_HEALTH_CHECKS': 'on'})
+        self.assertEqual(config['ENGINE'], 'sms_main.backends.postgresql')
+        self.assertTrue(config['CONN_HEALTH_CHECKS'])
+
+    def test_pool_replaces_persistent_connections(self):
+        config = database_config('postgres://localhost/sms', {'SMS_DB_POOL_SIZE': '8'})
+        self.assertEqual(config['ENGINE'], 'sms_main.backends.postgresql')
+        self.assertEqual(config['CONN_MAX_AGE'], 0)
+        self.assertEqual(config['OPTIONS']['pool'], {'max_size': 8, 'timeout': 30})
+
+    def test_unknown_scheme(self):
+        with self.assertRaises(ImproperlyConfigured):
+            database_config('mysql://localhost/sms', {})
@@ -0,0 +1,41 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from ..models import CustomUserProfile, Student, OfferedSubject
+
+
+class GenerateDataCommandTest(TestCase):
+    """generate_sms_data writes the requested school and refuses sizes it can not fill"""
+
+    def generate(self, *args):
+        stdout = StringIO()
+        call_command('generate_sms_data', '--prefix', 'command', '--students', '8', '--staff', '2',
+                     '--feedback', '2', '--leave', '2', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_tiny_scale(self):
+        output = self.generate('--seed', '3')
+        self.assertIn('students: 8', output)
+        self.assertEqual(Student.objects.count(), 8)
+        self.assertEqual(CustomUserProfile.objects.filter(email__startswith='command.').count(), 11)
+        self.assertTrue(OfferedSubject.objects.exists())
+
+    def test_courses_without_subjects(self):
+        self.generate('--subjects-per-course', '0')
+        self.assertEqual(Student.objects.count(), 8)
+        self.assertFalse(OfferedSubject.objects.exists())
+
+    def test_sizes_that_can_not_be_filled(self):
+        for args in (['--courses', '0'], ['--sections-per-course', '0'], ['--school-years', '0'],
+                     ['--courses', '0', '--students', '0'], ['--staff', '0'], ['--students', '-1']):
+            with self.subTest(args=args), self.assertRaises(CommandError):
+                self.generate(*args)
+        self.assertFalse(CustomUserProfile.objects.exists())
+
+    def test_no_students_without_courses(self):
+        output = self.generate('--courses', '0', '--students', '0', '--subjects-per-course', '0')
+        self.assertIn('courses: 0', output)
+        self.assertFalse(Student.objects.exists())
@@ -0,0 +1,84 @@
+import csv
+
+from django.urls import reverse
+
+from .. import exports
+from ..attendance import create_attendance
+from ..benchmarks import make_class
+from ..models import CustomUserProfile
+from ..provisioning import provision_user
+from .base import ClassTestCase
+
+
+class ExportTest(ClassTestCase):
+    """Exports stream their rows as they are read and only contain the rows the user may see"""
+
+    def setUp(self):
+        self.client.force_login(self.fixture['staff'])
+
+    def rows(self, response):
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        return list(csv.reader(content.splitlines()))
+
+    def test_header_is_sent_before_the_query(self):
+        create_attendance(*self.class_args(), self.fixture['user_profile_ids'][:2])
+        params = {'subject_id': self.fixture['subject'].id, 'school_year_id': self.fixture['school_year'].id}
+        response = self.client.get(reverse('export-staff-attendance'), params)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+
+        chunks = iter(response.streaming_content)
+        with self.assertNumQueries(0):
+            header = next(chunks).decode('utf-8-sig')
+        self.assertTrue(header.startswith('Date,Subject,'))
+        with self.assertNumQueries(1):
+            rows = list(csv.reader(b''.join(chunks).decode().splitlines()))
+        self.assertEqual(sorted(row[7] for row in rows), ['Last0', 'Last1'])
+
+    def test_rows_are_sent_in_chunks(self):
+        chunks = list(exports.iter_csv(['n'], ([n] for n in range(exports.CHUNK_SIZE + 1))))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(chunks[1].count('\r\n'), exports.CHUNK_SIZE)
+
+    def test_staff_only_export_their_subjects(self):
+        other = make_class(2, prefix='other')
+        create_attendance(other['subject'], other['section'], other['school_year'], other['user_profile_ids'])
+        params = {'subject_id': other['subject'].id, 'school_year_id': other['school_year'].id}
+        response = self.client.get(reverse('export-staff-attendance'), params)
+        self.assertEqual(self.rows(response)[1:], [])
+
+    def test_missing_parameters_and_unknown_formats_redirect_back(self):
+        report_url = reverse('view-student-attendance-report', kwargs={'id': self.fixture['staff'].id})
+        self.assertRedirects(self.client.get(reverse('export-staff-attendance')), report_url,
+                             fetch_redirect_response=False)
+        params = {'subject_id': self.fixture['subject'].id, 'school_year_id': self.fixture['school_year'].id,
+                  'format': 'pdf'}
+        self.assertRedirects(self.client.get(reverse('export-staff-attendance'), params), report_url,
+                             fetch_redirect_response=False)
+
+    def test_students_export_follows_the_table_filters(self):
+        admin = CustomUserProfile(email='export.admin@example.com', first_name='Admin', middle_initial='A',
+                                  last_name='Export', user_level=1, password='!')
+        provision_user(admin)
+        make_class(2, prefix='other')
+        self.client.force_login(admin)
+
+        response = self.client.get(reverse('export-students'), {'section': self.fixture['section'].id,
+                                                                 'sort': 'name', 'dir': 'desc'})
+        rows = self.rows(response)
+        self.assertEqual(rows[0][:4], ['ID', 'Email', 'Last Name', 'First Name'])
+        self.assertEqual([row[2] for row in rows[1:]], ['Last2', 'Last1', 'Last0'])
+        self.assertEqual(rows[1][8], 'First Year')
+
+    def test_students_export_matches_the_table(self):
+        admin = CustomUserProfile(email='export.admin@example.com', first_name='Admin', middle_initial='A',
+                                  last_name='Export', user_level=1, password='!')
+        provision_user(admin)
+        make_class(2, prefix='other')
+        self.client.force_login(admin)
+
+        for params in ({'sort': 'email', 'dir': 'desc'}, {'course': self.fixture['course'].id, 'sort': 'name'}):
+            with self.subTest(params=params):
+                table = self.client.get(reverse('ajax-manage-students-data'), params).json()
+                export = self.rows(self.client.get(reverse('export-students'), params))
+                self.assertEqual([int(row[0]) for row in export[1:]], [row['id'] for row in table['rows']])
+                self.assertEqual(len(export) - 1, table['total'])
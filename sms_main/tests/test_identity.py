@@ -0,0 +1,63 @@
+from django.core.cache import cache
+from django.urls import reverse
+
+from ..identity import load_user
+from ..models import CustomUserProfile
+from ..provisioning import update_user
+from .base import ClassTestCase
+
+
+class CachedIdentityTest(ClassTestCase):
+    """The request user comes from the cache until the user or its role row is saved"""
+
+    def setUp(self):
+        cache.clear()
+        self.staff = self.fixture['staff']
+        self.client.force_login(self.staff)
+        self.url = reverse('staff-dashboard')
+        # The first request caches the session and the user
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def profile(self):
+        return CustomUserProfile.objects.get(pk=self.staff.pk)
+
+    def test_load_user(self):
+        cache.clear()
+        with self.assertNumQueries(1):
+            user = load_user(self.staff.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(load_user(self.staff.pk).staff.id, user.staff.id)
+        self.assertIsNone(load_user(0))
+
+    def test_warm_staff_page_runs_no_query(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.user.pk, self.staff.pk)
+
+    def test_deactivation_applies_on_the_next_request(self):
+        profile = self.profile()
+        profile.is_active = False
+        profile.save()
+        response = self.client.get(self.url)
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    def test_level_change_applies_on_the_next_request(self):
+        profile = self.profile()
+        profile.user_level = 1
+        profile.save()
+        self.assertRedirects(self.client.get(self.url), reverse('admin-dashboard'), fetch_redirect_response=False)
+
+    def test_edit_reloads_the_user_and_its_role(self):
+        profile = self.profile()
+        profile.last_name = 'Edited'
+        update_user(profile, address='Edited address')
+        user = self.client.get(self.url).wsgi_request.user
+        self.assertEqual((user.last_name, user.staff.address), ('Edited', 'Edited address'))
+
+    def test_role_row_save_reloads_the_user(self):
+        role = self.profile().staff
+        role.address = 'Saved address'
+        role.save()
+        self.assertEqual(self.client.get(self.url).wsgi_request.user.staff.address, 'Saved address')
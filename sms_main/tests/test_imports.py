@@ -0,0 +1,26 @@
+import importlib.util
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from ..benchmarks import make_class
+
+
+def execute_module(name):
+    """Run the code of a module again in a new module object, leaving the imported one in sys.modules alone"""
+    spec = importlib.util.find_spec(name)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class ImportQueryTest(TestCase):
+    """Importing the forms, views and URLconf runs no query, choices and lookups are read when they are used"""
+
+    def test_modules_import_without_queries(self):
+        make_class(2)
+        cache.clear()
+        for name in ('sms_main.forms', 'sms_main.admin_views', 'sms_main.staff_views', 'sms_main.student_views',
+                     'sms_main.views', 'sms_main.urls'):
+            with self.subTest(module=name), self.assertNumQueries(0):
+                execute_module(name)
@@ -0,0 +1,52 @@
+import re
+from unittest import skipUnless
+
+from django.db import connection, IntegrityError
+from django.test import RequestFactory, TestCase
+
+from .. import lookups
+from ..attendance import create_attendance, todays_attendance
+from ..benchmarks import make_class
+from ..models import Student, Attendance, AttendanceReport, OfferedSubject
+from ..rosters import attendance_roster
+from ..staff_views import attendance_list_queryset, enrolment_queryset
+
+
+@skipUnless(connection.vendor == 'sqlite', 'The plans are read in the SQLite EXPLAIN QUERY PLAN format')
+class HotQueryIndexTest(TestCase):
+    """The hot attendance and enrolment queries must read their rows through an index, never a full table scan"""
+
+    def assertSearches(self, queryset, index=None):
+        """Assert no table of the plan is scanned and, when given, that the named index is used"""
+        plan = queryset.explain()
+        self.assertIsNone(re.search(r'\bSCAN (TABLE )?\w+', plan), plan)
+        if index is not None:
+            self.assertRegex(plan, rf'SEARCH \w+ USING (COVERING )?INDEX {index}\b')
+
+    def test_attendance_queries(self):
+        # SQLite implements the unique constraints with automatic indexes
+        unique_reports = f'sqlite_autoindex_{AttendanceReport._meta.db_table}_\\d+'
+        unique_days = f'sqlite_autoindex_{Attendance._meta.db_table}_\\d+'
+        request = RequestFactory().get('/', {'subject_id': 1, 'staff_id': 1, 'school_year_id': 1})
+
+        self.assertRegex(todays_attendance(1, 1, 1).explain(), rf'SEARCH \w+ USING COVERING INDEX {unique_days}\b')
+        self.assertSearches(attendance_list_queryset(request).order_by('attendance_date'),
+                            'attendance_subject_year_idx')
+        self.assertSearches(AttendanceReport.objects.filter(attendance_id=1).values_list('student_id'),
+                            unique_reports)
+        self.assertSearches(attendance_roster(1, 1, 1), unique_reports)
+
+    def test_enrolment_queries(self):
+        request = RequestFactory().get('/', {'subject_id': 1, 'staff_id': 1, 'section_id': 1, 'school_year_id': 1})
+
+        self.assertSearches(OfferedSubject.objects.filter(subject_id=1, school_year=1), 'enrolment_subject_year_idx')
+        self.assertSearches(Student.objects.filter(section=1, school_year=1), 'student_section_year_idx')
+        self.assertSearches(lookups.staff_subjects.queryset(1), 'subject_staff_name_idx')
+        self.assertSearches(enrolment_queryset(request))
+
+    def test_duplicate_reports_are_rejected(self):
+        fixture = make_class(2)
+        attendance = create_attendance(fixture['subject'], fixture['section'], fixture['school_year'],
+                                       fixture['user_profile_ids'])
+        with self.assertRaises(IntegrityError):
+            AttendanceReport.objects.create(attendance_id=attendance, student_id_id=fixture['student_ids'][0])
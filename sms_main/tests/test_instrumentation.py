@@ -0,0 +1,98 @@
+from collections import deque
+from unittest import mock
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import ResolverMatch
+
+from .. import instrumentation
+from ..instrumentation import InstrumentationMiddleware
+from ..models import Course
+
+THRESHOLDS = {
+    '*': {'queries': 30, 'ms': 60000, 'duplicates': 5},
+}
+
+
+def course_view(request):
+    return HttpResponse('courses')
+
+
+class InstrumentationMiddlewareTest(TestCase):
+    """Every request is recorded, reported in Server-Timing and logged when it goes over a threshold"""
+
+    def setUp(self):
+        self.recent = deque(maxlen=settings.INSTRUMENTATION_SUMMARY_SIZE)
+        patcher = mock.patch.object(instrumentation, 'RECENT', self.recent)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def call(self, queries=0, distinct=False, response=None):
+        """Send a request through the middleware to a view reading the courses queries times"""
+        def get_response(request):
+            request.resolver_match = ResolverMatch(course_view, (), {}, url_name='courses')
+            for number in range(queries):
+                courses = Course.objects.filter(id__gt=number) if distinct else Course.objects.all()
+                list(courses[:number + 1] if distinct else courses)
+            return response or HttpResponse('courses')
+        return InstrumentationMiddleware(get_response)(RequestFactory().get('/courses/'))
+
+    @override_settings(INSTRUMENTATION_THRESHOLDS=THRESHOLDS)
+    def test_queries_are_counted(self):
+        self.call(queries=3)
+        record = self.recent[-1]
+        self.assertEqual((record['view'], record['url_name'], record['status']), ('course_view', 'courses', 200))
+        self.assertEqual((record['queries'], record['bytes']), (3, len(b'courses')))
+        self.assertEqual(list(record['duplicates'].values()), [3])
+
+    @override_settings(INSTRUMENTATION_THRESHOLDS=THRESHOLDS)
+    def test_streaming_responses_have_no_size(self):
+        self.call(response=StreamingHttpResponse(iter([b'a', b'b'])))
+        self.assertIsNone(self.recent[-1]['bytes'])
+
+    @override_settings(INSTRUMENTATION_THRESHOLDS={'*': {'queries': 2, 'ms': 60000, 'duplicates': 5}})
+    def test_too_many_queries_are_logged(self):
+        with self.assertLogs('sms_main.instrumentation', 'WARNING') as logs:
+            self.call(queries=3, distinct=True)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('course_view ran 3 queries (threshold 2): /courses/', logs.output[0])
+
+    @override_settings(INSTRUMENTATION_THRESHOLDS={'*': {'ms': 0}})
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs('sms_main.instrumentation', 'WARNING') as logs:
+            self.call()
+        self.assertIn('course_view took', logs.output[0])
+        self.assertIn('(threshold 0 ms): /courses/', logs.output[0])
+
+    @override_settings(INSTRUMENTATION_THRESHOLDS={'*': {'ms': 60000, 'duplicates': 2}})
+    def test_repeated_queries_are_logged(self):
+        with self.assertLogs('sms_main.instrumentation', 'WARNING') as logs:
+            self.call(queries=3)
+        self.assertIn('ran the same query 3 times, possible N+1', logs.output[0])
+
+    @override_settings(INSTRUMENTATION_THRESHOLDS={'*': {'queries': 2, 'ms': 60000}, 'courses': {'queries': 5}})
+    def test_view_thresholds_override_the_default(self):
+        with self.assertNoLogs('sms_main.instrumentation', 'WARNING'):
+            self.call(queries=3, distinct=True)
+
+    @override_settings(INSTRUMENTATION_THRESHOLDS=THRESHOLDS)
+    def test_server_timing_header(self):
+        header = self.call(queries=2)['Server-Timing']
+        self.assertRegex(header, r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="2 queries"$')
+        with override_settings(INSTRUMENTATION_SERVER_TIMING=False):
+            self.assertFalse(self.call().has_header('Server-Timing'))
+
+    @override_settings(INSTRUMENTATION_THRESHOLDS=THRESHOLDS)
+    def test_recent_requests_are_bounded(self):
+        self.assertEqual(instrumentation.RECENT.maxlen, settings.INSTRUMENTATION_SUMMARY_SIZE)
+        with mock.patch.object(instrumentation, 'RECENT', deque(maxlen=3)) as recent:
+            for queries in range(5):
+                self.call(queries=queries)
+        self.assertEqual([record['queries'] for record in recent], [2, 3, 4])
+
+    @override_settings(INSTRUMENTATION_ENABLED=False)
+    def test_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            InstrumentationMiddleware(course_view)
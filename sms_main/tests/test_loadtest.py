@@ -0,0 +1,165 @@
+import json
+import os
+import random
+import tempfile
+from datetime import date
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase
+
+from ..attendance import create_attendance
+from ..loadtest import LoadTestError, Stats, assign_scenarios, compare, load_users
+from ..models import Attendance
+from .base import ClassTestCase
+
+
+def report(p95=100.0, p99=200.0, rps=50.0, error_rate=0.0, endpoints=('manage-students',)):
+    """A Stats report where every row holds the same figures"""
+    def row(name):
+        return {'name': name, 'requests': 100, 'failures': int(error_rate * 100), 'error_rate': error_rate,
+                'rps': rps, 'avg_ms': p95 / 2, 'p50_ms': p95 / 2, 'p95_ms': p95, 'p99_ms': p99, 'max_ms': p99}
+    return {'endpoints': [row(name) for name in endpoints], 'total': row('total'),
+            'meta': {'concurrency': 10, 'wait': [0.0, 0.0], 'server': 'external', 'label': 'baseline',
+                     'login_errors': []}}
+
+
+class StatsTest(SimpleTestCase):
+    """The figures of a run, per request name and in total"""
+
+    def test_report(self):
+        stats = Stats()
+        for elapsed in range(1, 101):
+            stats.add('fetch', float(elapsed), elapsed > 2)
+        stats.add('login', 500.0, True)
+        result = stats.report(10)
+
+        fetch, login = result['endpoints']
+        self.assertEqual(fetch['name'], 'fetch')
+        self.assertEqual((fetch['requests'], fetch['failures'], fetch['error_rate']), (100, 2, 0.02))
+        self.assertEqual(fetch['rps'], 10)
+        self.assertEqual(fetch['avg_ms'], 50.5)
+        self.assertEqual((fetch['p50_ms'], fetch['p95_ms'], fetch['p99_ms'], fetch['max_ms']), (51, 96, 100, 100))
+        self.assertEqual((login['requests'], login['p99_ms']), (1, 500))
+
+        total = result['total']
+        self.assertEqual((total['requests'], total['failures'], total['rps']), (101, 2, 10.1))
+        self.assertEqual((total['p99_ms'], total['max_ms']), (100, 500))
+
+    def test_report_without_requests(self):
+        self.assertEqual(Stats().report(1), {'endpoints': [], 'total': None})
+
+
+class CompareTest(SimpleTestCase):
+    """A run against a saved baseline"""
+
+    def regressions(self, current, baseline=None, tolerance=0.1):
+        return {(row['name'], row['metric']) for row in compare(current, baseline or report(), tolerance)
+                if row['regression']}
+
+    def test_within_tolerance(self):
+        self.assertEqual(self.regressions(report(p95=109, p99=219, rps=46)), set())
+
+    def test_slower_percentiles(self):
+        self.assertEqual(self.regressions(report(p95=111)), {('manage-students', 'p95_ms'), ('total', 'p95_ms')})
+        self.assertEqual(self.regressions(report(p99=221)), {('manage-students', 'p99_ms'), ('total', 'p99_ms')})
+        self.assertEqual(self.regressions(report(p95=130), tolerance=0.5), set())
+
+    def test_lower_throughput(self):
+        # Only the total throughput counts, the split between the endpoints is random
+        self.assertEqual(self.regressions(report(rps=40)), {('total', 'rps')})
+        self.assertEqual(self.regressions(report(rps=80)), set())
+
+    def test_more_errors(self):
+        self.assertEqual(self.regressions(report(error_rate=0.01)),
+                         {('manage-students', 'error_rate'), ('total', 'error_rate')})
+        self.assertEqual(self.regressions(report(), report(error_rate=0.01)), set())
+
+    def test_changes(self):
+        rows = {(row['name'], row['metric']): row for row in compare(report(p95=150), report())}
+        self.assertEqual(rows['total', 'p95_ms']['change'], 0.5)
+        self.assertEqual(rows['total', 'error_rate']['change'], 0.0)
+        self.assertNotIn(('manage-students', 'rps'), rows)
+
+    def test_endpoints_missing_from_the_baseline(self):
+        rows = compare(report(endpoints=('manage-students', 'manage-staff')), report())
+        self.assertNotIn('manage-staff', {row['name'] for row in rows})
+
+
+class CompareCommandTest(SimpleTestCase):
+    """sms_loadtest --compare fails on a regression"""
+
+    def run_command(self, current, baseline):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(baseline, f)
+            stdout = StringIO()
+            with mock.patch('sms_main.management.commands.sms_loadtest.load_users', return_value={}), \
+                    mock.patch('sms_main.management.commands.sms_loadtest.run', return_value=current):
+                call_command('sms_loadtest', '--url', 'http://127.0.0.1:1', '--compare', path,
+                             stdout=stdout, stderr=StringIO())
+        return stdout.getvalue()
+
+    def test_no_regression(self):
+        self.assertIn('No regression', self.run_command(report(p95=105), report()))
+
+    def test_regression(self):
+        with self.assertRaisesMessage(CommandError, '2 regression(s)'):
+            self.run_command(report(p95=150), report())
+
+
+class AssignScenariosTest(SimpleTestCase):
+    """Every scenario with users gets a session, the rest go by weight"""
+
+    def test_every_scenario_runs(self):
+        for seed in range(20):
+            scenarios = assign_scenarios(['staff', 'admin', 'student'], 4, random.Random(seed))
+            self.assertEqual(len(scenarios), 4)
+            self.assertEqual(set(scenarios), {'staff', 'admin', 'student'})
+
+    def test_remaining_sessions_by_weight(self):
+        scenarios = assign_scenarios(['staff', 'admin', 'student'], 1000, random.Random(0))
+        self.assertGreater(scenarios.count('staff'), scenarios.count('student'))
+        self.assertGreater(scenarios.count('student'), scenarios.count('admin'))
+
+    def test_fewer_sessions_than_scenarios(self):
+        self.assertEqual(assign_scenarios(['staff', 'admin', 'student'], 2, random.Random(0)), ['staff', 'student'])
+
+    def test_scenarios_without_users(self):
+        self.assertEqual(set(assign_scenarios(['admin'], 3, random.Random(0))), {'admin'})
+
+
+class LoadUsersTest(ClassTestCase):
+    """The users and classes a run is set up with"""
+
+    def test_staff_classes(self):
+        users = load_users('bench', 'secret')
+        staff, = users['staff']
+        self.assertEqual((staff['id'], staff['email'], staff['password']),
+                         (self.fixture['staff'].id, 'bench.staff@example.com', 'secret'))
+        current, = staff['classes']
+        self.assertEqual((current['subject_id'], current['section_id'], current['school_year_id']),
+                         (self.fixture['subject'].id, self.fixture['section'].id, self.fixture['school_year'].id))
+        self.assertIsNone(current['attendance_id'])
+        self.assertEqual([student['id'] for student in current['students']], self.fixture['student_ids'])
+        self.assertEqual([student['user_profile_id'] for student in current['students']],
+                         self.fixture['user_profile_ids'])
+        self.assertEqual(len(users['student']), self.class_size)
+        self.assertEqual(users['admin'], [])
+
+    def test_latest_attendance(self):
+        first = create_attendance(*self.class_args(), self.fixture['user_profile_ids'])
+        Attendance.objects.filter(pk=first.pk).update(attendance_day=date(2020, 6, 1))
+        latest = create_attendance(*self.class_args(), self.fixture['user_profile_ids'][:1])
+        current, = load_users('bench', 'secret')['staff'][0]['classes']
+        self.assertEqual(current['attendance_id'], latest.id)
+
+    def test_limit(self):
+        self.assertEqual(len(load_users('bench', 'secret', limit=2)['student']), 2)
+
+    def test_unknown_prefix(self):
+        with self.assertRaises(LoadTestError):
+            load_users('unknown', 'secret')
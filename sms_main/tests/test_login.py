@@ -0,0 +1,51 @@
+from unittest import mock
+
+from django.contrib.auth import hashers
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ..models import CustomUserProfile
+from ..provisioning import provision_user
+
+
+@override_settings(PASSWORD_HASH_ITERATIONS=1000)
+class LoginFormTest(TestCase):
+    """A login hashes the password once and only lets active users in at their own level"""
+
+    def setUp(self):
+        self.user = CustomUserProfile(email='login.staff@example.com', first_name='Login', middle_initial='L',
+                                      last_name='Staff', user_level=2)
+        self.user.set_password('secret123')
+        provision_user(self.user, address='Login address')
+
+    def login(self, password='secret123', user_level=2):
+        with mock.patch('django.contrib.auth.hashers.pbkdf2', wraps=hashers.pbkdf2) as pbkdf2:
+            response = self.client.post(reverse('login'), {'username': self.user.email, 'password': password,
+                                                           'user_level': user_level})
+        return response, pbkdf2.call_count
+
+    def test_password_is_hashed_once(self):
+        response, hashes = self.login()
+        self.assertRedirects(response, reverse('demo'), fetch_redirect_response=False)
+        self.assertEqual(hashes, 1)
+        self.assertEqual(int(self.client.session['_auth_user_id']), self.user.pk)
+
+    def test_wrong_password(self):
+        response, hashes = self.login(password='wrong')
+        self.assertEqual(hashes, 1)
+        self.assertFormError(response, 'form', None, 'Invalid username or password')
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_wrong_user_level(self):
+        response, hashes = self.login(user_level=1)
+        self.assertEqual(hashes, 1)
+        self.assertFormError(response, 'form', None, 'Invalid Login')
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_inactive_user(self):
+        self.user.is_active = False
+        self.user.save()
+        response, hashes = self.login()
+        self.assertEqual(hashes, 1)
+        self.assertFormError(response, 'form', None, 'Invalid username or password')
+        self.assertNotIn('_auth_user_id', self.client.session)
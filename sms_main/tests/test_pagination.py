@@ -0,0 +1,128 @@
+from datetime import timedelta
+
+from django.core import signing
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+
+from ..lookups import generation_key
+from ..models import CustomUserProfile, Student
+from ..pagination import KeysetPaginator, InvalidCursor, cached_count, encode_cursor
+from ..provisioning import provision_user
+from .base import ClassTestCase
+
+
+class KeysetPaginatorTest(ClassTestCase):
+    """Pages follow each other without gaps or repeats, cursors only continue the ordering they were made for"""
+    class_size = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Three students share their last name, the seek filter must continue inside the tie
+        CustomUserProfile.objects.filter(id__in=cls.fixture['user_profile_ids'][1:4]).update(last_name='Same')
+        cls.students = Student.objects.filter(section=cls.fixture['section']).values('id', 'user_profile__last_name')
+
+    def all_pages(self, ordering, page_size):
+        paginator = KeysetPaginator(self.students, ordering, page_size)
+        rows, cursor = paginator.page()
+        pages = [rows]
+        while cursor:
+            rows, cursor = paginator.page(cursor)
+            pages.append(rows)
+        return [[row['id'] for row in page] for page in pages]
+
+    def test_pages_continue_across_tied_values(self):
+        for ordering in (['user_profile__last_name', 'id'], ['-user_profile__last_name', 'id'],
+                         ['user_profile__last_name', '-id']):
+            with self.subTest(ordering=ordering):
+                expected = list(self.students.order_by(*ordering).values_list('id', flat=True))
+                pages = self.all_pages(ordering, 2)
+                self.assertEqual([len(page) for page in pages], [2, 2, 1])
+                self.assertEqual(sum(pages, []), expected)
+
+    def test_pages_continue_across_datetimes(self):
+        # Creation times a microsecond apart, two of them equal, all within the same millisecond
+        start = timezone.now().replace(microsecond=1000)
+        for offset, student_id in zip((0, 1, 1, 2, 3), self.fixture['student_ids']):
+            Student.objects.filter(id=student_id).update(date_created=start + timedelta(microseconds=offset))
+        students = Student.objects.filter(section=self.fixture['section']).values('id', 'date_created')
+        for ordering in (['date_created', 'id'], ['-date_created', 'id']):
+            with self.subTest(ordering=ordering):
+                paginator = KeysetPaginator(students, ordering, 2)
+                rows, cursor = paginator.page()
+                pages = [rows]
+                while cursor and len(pages) < 5:
+                    rows, cursor = paginator.page(cursor)
+                    pages.append(rows)
+                self.assertEqual([row['id'] for page in pages for row in page],
+                                 list(students.order_by(*ordering).values_list('id', flat=True)))
+
+    def test_last_page_has_no_cursor(self):
+        # A full last page: the extra row read to look ahead is missing, so no cursor is returned
+        self.assertEqual([len(page) for page in self.all_pages(['id'], 5)], [5])
+        self.assertEqual([len(page) for page in self.all_pages(['id'], 10)], [5])
+
+    def test_invalid_cursors(self):
+        paginator = KeysetPaginator(self.students, ['user_profile__last_name', 'id'], 2)
+        _, cursor = paginator.page()
+        foreign = signing.dumps({'ordering': paginator.ordering, 'values': ['Same', 1]}, salt='another.salt')
+        other_ordering = encode_cursor(['Same', 1], ['-user_profile__last_name', 'id'])
+        for value in (cursor[:-2] + 'xx', 'garbage', foreign, other_ordering):
+            with self.subTest(cursor=value), self.assertRaises(InvalidCursor):
+                paginator.page(value)
+
+    def test_malformed_datetime_cursor(self):
+        paginator = KeysetPaginator(self.students, ['user_profile__last_name', 'id'], 2)
+        for values in ([{'datetime': 'yesterday'}, 1], [{'datetime': 1}, 1], [{'date': '2020-01-01'}, 1]):
+            with self.subTest(values=values), self.assertRaises(InvalidCursor):
+                paginator.page(encode_cursor(values, paginator.ordering))
+
+    def test_null_ordering_values_are_refused(self):
+        students = Student.objects.filter(section=self.fixture['section']).values('id', 'address')
+        with self.assertRaises(ValueError):
+            KeysetPaginator(students, ['address', 'id'], 2).page()
+
+
+class CachedCountTest(ClassTestCase):
+    """Cached totals are dropped by a write, even when the cache lost the generation counter meanwhile"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_evicted_generation_does_not_bring_back_old_totals(self):
+        count = lambda: cached_count(Student.objects.all(), {})
+        self.assertEqual(count(), 3)
+        Student.objects.filter(id=self.fixture['student_ids'][0]).delete()
+        self.assertEqual(count(), 2)
+        # The counter is evicted, the totals cached under the earlier generations are still there
+        cache.delete(generation_key(Student))
+        self.assertEqual(count(), 2)
+        Student.objects.filter(id=self.fixture['student_ids'][1]).delete()
+        cache.delete(generation_key(Student))
+        Student.objects.filter(id=self.fixture['student_ids'][2]).delete()
+        self.assertEqual(count(), 0)
+
+
+class CursorRequestTest(ClassTestCase):
+    """A bad cursor is a 400 answer, not a server error"""
+
+    def setUp(self):
+        admin = CustomUserProfile(email='pages.admin@example.com', first_name='Admin', middle_initial='A',
+                                  last_name='Pages', user_level=1, password='!')
+        provision_user(admin)
+        self.client.force_login(admin)
+
+    def test_students_table(self):
+        url = reverse('ajax-manage-students-data')
+        first = self.client.get(url, {'sort': 'name', 'limit': 2}).json()
+        self.assertEqual(len(first['rows']), 2)
+        self.assertEqual(self.client.get(url, {'sort': 'name', 'limit': 2, 'cursor': first['next_cursor']})
+                         .json()['rows'][0]['last_name'], 'Last2')
+        # The cursor of the name order after the user sorted by email
+        self.assertEqual(self.client.get(url, {'sort': 'email', 'limit': 2, 'cursor': first['next_cursor']})
+                         .status_code, 400)
+        self.assertEqual(self.client.get(url, {'cursor': 'tampered'}).status_code, 400)
+
+    def test_list_views(self):
+        self.assertEqual(self.client.get(reverse('manage-subjects'), {'cursor': 'tampered'}).status_code, 400)
@@ -0,0 +1,18 @@
+from ..models import Course, CourseSection, CustomUserProfile, Student
+from ..pagination import cached_count
+from ..provisioning import update_user
+from .base import ClassTestCase
+
+
+class UpdateUserTest(ClassTestCase):
+    """Editing a user's role row keeps the caches built from it current"""
+
+    def test_course_change_drops_the_cached_totals(self):
+        course = Course.objects.create(course_name='second course')
+        section = CourseSection.objects.create(section_name='second section', course_id=course)
+        in_course = lambda: cached_count(Student.objects.filter(course_id=course.id), {'course': course.id})
+        self.assertEqual(in_course(), 0)
+
+        user = CustomUserProfile.objects.get(pk=self.fixture['user_profile_ids'][0])
+        update_user(user, course_id=course, section=section)
+        self.assertEqual(in_course(), 1)
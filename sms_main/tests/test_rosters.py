@@ -0,0 +1,47 @@
+from datetime import date
+
+from django.test import TestCase
+
+from ..attendance import create_attendance
+from ..benchmarks import make_class
+from ..models import Attendance
+from ..rosters import attendance_roster, attendance_matrix
+from .base import ClassTestCase
+
+
+class AttendanceRosterQueryTest(TestCase):
+    """The attendance roster must be read with one query regardless of the class size"""
+
+    def test_roster_is_a_single_query(self):
+        for size, prefix in ((5, 'small'), (50, 'large')):
+            fixture = make_class(size, prefix=prefix)
+            present = fixture['user_profile_ids'][:2]
+            attendance = create_attendance(fixture['subject'], fixture['section'], fixture['school_year'], present)
+
+            with self.assertNumQueries(1):
+                roster = list(attendance_roster(attendance.id, fixture['subject'].id, fixture['school_year'].id))
+
+            self.assertEqual(len(roster), size)
+            self.assertEqual(sum(student['is_present'] for student in roster), 2)
+            self.assertEqual(roster[0]['full_name'], 'Last0, First0 M.')
+
+
+class AttendanceMatrixTest(ClassTestCase):
+    """The term matrix of a class holds a bit per attended session and the row and column totals"""
+
+    def test_bitsets_and_totals(self):
+        fixture = self.fixture
+        first = create_attendance(*self.class_args(), fixture['user_profile_ids'][:2])
+        Attendance.objects.filter(pk=first.pk).update(attendance_day=date(2020, 6, 1))
+        second = create_attendance(*self.class_args(), fixture['user_profile_ids'][1:])
+
+        with self.assertNumQueries(3):
+            matrix = attendance_matrix(fixture['subject'].id, fixture['section'].id, fixture['school_year'].id,
+                                       fixture['staff'].id)
+        self.assertEqual([session[0] for session in matrix['sessions']], [first.id, second.id])
+        self.assertEqual(matrix['session_totals'], [2, 2])
+        # Students are listed by name, Last0 to Last2
+        self.assertEqual([row[2:] for row in matrix['students']], [['1', 1], ['3', 2], ['2', 1]])
+
+        other_staff = attendance_matrix(fixture['subject'].id, fixture['section'].id, fixture['school_year'].id, 0)
+        self.assertEqual(other_staff, {'sessions': [], 'session_totals': [], 'students': []})
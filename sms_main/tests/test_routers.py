@@ -0,0 +1,75 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import override_settings
+from django.urls import reverse
+
+from ..attendance import create_attendance
+from ..database import database_config
+from ..models import Attendance
+from ..routers import STICKY_COOKIE
+from .base import ClassTestCase
+
+
+@override_settings(REPLICA_DATABASE='test_replica')
+class ReplicaRoutingTest(ClassTestCase):
+    """Read-only views read from the replica, a user who wrote reads from the primary for a while"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # The stand-in replica is a second SQLite database nothing is replicated to, so the answer of a view shows
+        # which database served it. It is added after the test runner set up the databases and stays outside the
+        # test transactions.
+        cls.directory = tempfile.mkdtemp()
+        connections.databases['test_replica'] = database_config(
+            'sqlite:///' + os.path.join(cls.directory, 'replica.sqlite3'), {}
+        )
+        call_command('migrate', database='test_replica', verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['test_replica'].close()
+        del connections['test_replica']
+        del connections.databases['test_replica']
+        shutil.rmtree(cls.directory)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.attendance = create_attendance(cls.fixture['subject'], cls.fixture['section'], cls.fixture['school_year'],
+                                           cls.fixture['user_profile_ids'])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.fixture['staff'])
+
+    def attendance_list(self):
+        response = self.client.get(reverse('ajax-staff-fetch-attendance-report'), {
+            'subject_id': self.fixture['subject'].id, 'staff_id': self.fixture['staff'].id,
+            'school_year_id': self.fixture['school_year'].id,
+        })
+        self.assertEqual(response.status_code, 200)
+        return [row[0] for row in response.json()['rows']]
+
+    def test_read_only_views_read_the_replica(self):
+        self.assertEqual(self.attendance_list(), [])
+        self.assertEqual(Attendance.objects.count(), 1)
+
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        response = self.client.post(reverse('ajax-update-student-attendance-report'), json.dumps({
+            'attendance_id': self.attendance.id,
+            'id_list': [{'id': student_id, 'status': False} for student_id in self.fixture['student_ids']],
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies[STICKY_COOKIE]['max-age'], settings.REPLICA_STICKY_SECONDS)
+
+        self.assertEqual(self.attendance_list(), [self.attendance.id])
+        self.assertNotIn(STICKY_COOKIE, self.client.get(reverse('staff-dashboard')).cookies)
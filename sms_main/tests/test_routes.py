@@ -0,0 +1,246 @@
+import json
+import os
+import time
+
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.test import TestCase
+from django.urls import URLPattern, reverse
+
+from .. import urls
+from ..datasets import SCALES, generate_dataset
+from ..instrumentation import QueryRecorder
+from ..models import CustomUserProfile, Student, Attendance, AttendanceReport, StaffFeedBack, LeaveReportStaff
+
+# Dataset the route budgets are checked against. Set SMS_TEST_SCALE=realistic for a full-sized school.
+TEST_SCALE = os.environ.get('SMS_TEST_SCALE', 'tiny')
+
+# Datasets every route must run the same number of queries on, the second has lists and classes longer than a page
+SCALING_SCALES = ('tiny', 'small')
+
+# Multiplier of the latency budgets, for slow CI machines
+LATENCY_FACTOR = float(os.environ.get('SMS_TEST_LATENCY_FACTOR', 1))
+
+# How often one SQL statement may run in a request before it counts as an N+1
+MAX_REPEATS = 2
+
+
+def route(name, role=None, method='get', kwargs=None, data=None, queries=0, ms=300):
+    """
+    How a named route is requested and what it may cost
+    :param role: 'admin', 'staff' or 'student' to log in as, None for an anonymous request
+    :param method: 'get', 'post' for a form post or 'json' for a JSON body posted by the AJAX calls
+    :param kwargs: callable returning the url kwargs, called with the test case
+    :param data: callable returning the query string, form or JSON data, called with the test case
+    :param queries: upper bound of SQL queries, counting the session and user lookups
+    :param ms: latency budget in milliseconds
+    """
+    return {'name': name, 'role': role, 'method': method, 'kwargs': kwargs, 'data': data, 'queries': queries,
+            'ms': ms}
+
+
+ROUTES = [
+    route('demo', queries=0),
+    route('register', queries=0),
+    route('login', queries=0),
+    route('logout', 'admin', queries=2),
+    route('user-detail', 'admin', kwargs=lambda t: {'pk': t.student.user_profile_id}, queries=1),
+    route('admin', 'admin', queries=0),
+    route('admin-dashboard', 'admin', queries=0),
+    route('view-student-feedback', 'admin', queries=0),
+    route('instrumentation-summary', 'admin', queries=0),
+    route('add-staff', 'admin', queries=0),
+    route('add-student', 'admin', queries=2),
+    route('import-students', 'admin', queries=0),
+    route('add-student-check-email', 'admin', 'json', data=lambda t: {'email': t.student.user_profile.email},
+          queries=1, ms=100),
+    route('add-course', 'admin', queries=0),
+    route('add-subject', 'admin', queries=2),
+    route('add-section', 'admin', queries=1),
+    route('add-school-year', 'admin', queries=0),
+    # The validator aggregate and the rows, both read from the database
+    route('ajax-get-subjects', 'admin', data=lambda t: {'course_id': t.attendance.subject_id.course_id_id},
+          queries=2, ms=100),
+    route('manage-staff', 'admin', queries=1),
+    route('manage-students', 'admin', queries=3),
+    route('ajax-manage-students-data', 'admin', data=lambda t: {'sort': 'name', 'limit': 50}, queries=2, ms=100),
+    route('export-students', 'admin', data=lambda t: {'sort': 'name'}, queries=1),
+    route('manage-subjects', 'admin', queries=1),
+    route('manage-courses', 'admin', queries=1),
+    route('manage-school-years', 'admin', queries=1),
+    route('edit-staff', 'admin', kwargs=lambda t: {'id': t.staff.id}, queries=2),
+    route('edit-student', 'admin', kwargs=lambda t: {'id': t.student.user_profile_id}, queries=7),
+    route('edit-subject', 'admin', kwargs=lambda t: {'id': t.attendance.subject_id_id}, queries=5),
+    route('edit-course', 'admin', kwargs=lambda t: {'id': t.attendance.subject_id.course_id_id}, queries=1),
+    route('edit-school-year', 'admin', kwargs=lambda t: {'id': t.attendance.school_year_id}, queries=1),
+    route('delete-staff', 'admin', kwargs=lambda t: {'id': t.staff.id}, queries=1),
+    route('delete-student', 'admin', kwargs=lambda t: {'id': t.student.user_profile_id}, queries=1),
+    route('delete-subject', 'admin', kwargs=lambda t: {'id': t.attendance.subject_id_id}, queries=1),
+    route('delete-course', 'admin', kwargs=lambda t: {'id': t.attendance.subject_id.course_id_id}, queries=1),
+    route('delete-school-year', 'admin', kwargs=lambda t: {'id': t.attendance.school_year_id}, queries=1),
+    route('view-staff-feedbacks', 'admin', queries=1),
+    route('feedback-reply', 'admin', 'json', kwargs=lambda t: {'id': t.feedback.id},
+          data=lambda t: {'fid': t.feedback.id, 'msg': 'Noted.'}, queries=2, ms=100),
+    route('manage-staff-leaves', 'admin', queries=1),
+    route('export-staff-leaves', 'admin', queries=1),
+    route('process-staff-leave', 'admin', 'json', data=lambda t: {'leave_id': t.leave.id, 'action': 1}, queries=2,
+          ms=100),
+    route('staff-dashboard', 'staff', queries=0),
+    route('view-student-attendance', 'staff', queries=3),
+    # Creating an attendance also counts the session in the summaries of the class (4 queries)
+    route('view-student-attendance', 'staff', 'post', data=lambda t: t.attendance_form(), queries=19),
+    route('view-student-attendance-report', 'staff', kwargs=lambda t: {'id': t.staff.id}, queries=2),
+    route('ajax-staff-fetch-attendance-report', 'staff', data=lambda t: t.class_params('subject_id', 'staff_id',
+                                                                                       'school_year_id'),
+          queries=2, ms=100),
+    route('ajax-staff-attendance-matrix', 'staff', data=lambda t: t.class_params('subject_id', 'section_id',
+                                                                                 'school_year_id'),
+          queries=3, ms=100),
+    route('export-staff-attendance', 'staff', data=lambda t: t.class_params('subject_id', 'school_year_id'),
+          queries=1),
+    route('ajax-view-student-attendance', 'staff', 'json',
+          data=lambda t: {'attendance': t.attendance.id, **t.class_params('subject_id', 'school_year_id')},
+          queries=1, ms=100),
+    # Adding and removing reports each update the summaries once
+    route('ajax-update-student-attendance-report', 'staff', 'json', data=lambda t: t.attendance_update(),
+          queries=8, ms=100),
+    route('ajax-staff-fetch-students', 'staff', data=lambda t: t.class_params('subject_id', 'staff_id',
+                                                                              'section_id', 'school_year_id'),
+          queries=2, ms=100),
+    route('ajax-admin-fetch-sections', 'admin', data=lambda t: {'course_id': t.attendance.subject_id.course_id_id},
+          queries=2, ms=100),
+    route('ajax-staff-fetch-sections', 'staff', data=lambda t: {'course_id': t.attendance.subject_id.course_id_id},
+          queries=2, ms=100),
+    route('staff-leave-application', 'staff', queries=0),
+    route('staff-leave-report', 'staff', queries=1),
+    route('staff-feedback', 'staff', queries=1),
+    route('staff-edit-feedback', 'staff', kwargs=lambda t: {'id': t.feedback.id}, queries=1),
+    route('student-dashboard', 'student', queries=0),
+]
+
+
+class RouteRequestMixin:
+    """
+    Generated dataset of the route tests and the requests of the route specs.
+    Each route is requested once its user, session and the caches filled by the dashboard are warm.
+    """
+
+    @classmethod
+    def load_dataset(cls, scale):
+        generate_dataset(seed=15, prefix='test', **SCALES[scale])
+        cls.users = {
+            'admin': CustomUserProfile.objects.get(email='test.admin@example.com'),
+            'student': CustomUserProfile.objects.filter(user_level=3).order_by('id').first(),
+        }
+        # The latest attendance entry, its subject's teacher is the user of the staff routes
+        cls.attendance = (Attendance.objects.select_related('subject_id', 'subject_id__staff_id')
+                          .order_by('-id').first())
+        cls.staff = cls.users['staff'] = cls.attendance.subject_id.staff_id
+        cls.student = Student.objects.select_related('user_profile').filter(
+            offeredsubject__subject_id=cls.attendance.subject_id, section=cls.attendance.section_id).first()
+        cls.feedback = StaffFeedBack.objects.order_by('id').first()
+        cls.leave = LeaveReportStaff.objects.order_by('id').first()
+
+    def class_params(self, *names):
+        values = {
+            'subject_id': self.attendance.subject_id_id,
+            'staff_id': self.staff.id,
+            'section_id': self.attendance.section_id_id,
+            'school_year_id': self.attendance.school_year_id,
+        }
+        return {name: values[name] for name in names}
+
+    def class_user_profile_ids(self):
+        return list(Student.objects.filter(offeredsubject__subject_id=self.attendance.subject_id,
+                                           section=self.attendance.section_id)
+                    .values_list('user_profile_id', flat=True))
+
+    def attendance_form(self):
+        return {
+            'subject_id': self.attendance.subject_id_id,
+            'section_id': self.attendance.section_id_id,
+            'school_year': self.attendance.school_year_id,
+            'students': self.class_user_profile_ids(),
+        }
+
+    def attendance_update(self):
+        students = list(Student.objects.filter(offeredsubject__subject_id=self.attendance.subject_id,
+                                               section=self.attendance.section_id).values_list('id', flat=True))
+        # Whatever reports were generated, the update removes the first student and adds the second
+        AttendanceReport.objects.get_or_create(attendance_id=self.attendance, student_id_id=students[0])
+        AttendanceReport.objects.filter(attendance_id=self.attendance, student_id=students[1]).delete()
+        return {'attendance_id': self.attendance.id,
+                'id_list': [{'id': student_id, 'status': index % 2} for index, student_id in enumerate(students)]}
+
+    def request(self, spec):
+        """Send the request of a route spec, return (response, QueryRecorder, elapsed ms)"""
+        cache.clear()
+        if spec['role']:
+            self.client.force_login(self.users[spec['role']])
+            self.client.get(self.users[spec['role']].get_absolute_url())
+        path = reverse(spec['name'], kwargs=spec['kwargs'](self) if spec['kwargs'] else None)
+        data = spec['data'](self) if spec['data'] else None
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with connections['default'].execute_wrapper(recorder):
+            if spec['method'] == 'json':
+                response = self.client.post(path, json.dumps(data), content_type='application/json')
+            else:
+                response = getattr(self.client, spec['method'])(path, data)
+            if response.streaming:
+                # The rows of a streamed response are read while it is sent
+                b''.join(response.streaming_content)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.client.logout()
+        return response, recorder, elapsed
+
+    def assertWithinBudgets(self):
+        """
+        Request every route and check its status, query bound, repeated statements and latency
+        :return: dict of the query count per (route name, method)
+        """
+        counts = {}
+        for spec in ROUTES:
+            with self.subTest(route=spec['name'], method=spec['method']):
+                response, recorder, elapsed = self.request(spec)
+                counts[spec['name'], spec['method']] = recorder.count
+                self.assertLess(response.status_code, 400)
+                self.assertLessEqual(recorder.count, spec['queries'], '\n'.join(recorder.fingerprints))
+                repeated = {sql: count for sql, count in recorder.duplicates().items() if count > MAX_REPEATS}
+                self.assertEqual(repeated, {}, 'Possible N+1')
+                self.assertLessEqual(elapsed, spec['ms'] * LATENCY_FACTOR)
+        return counts
+
+
+class RouteBudgetTest(RouteRequestMixin, TestCase):
+    """
+    Every named route of sms_main.urls must stay within its query bound and latency budget on a generated dataset,
+    and no SQL statement may run more than MAX_REPEATS times in a request, so an N+1 in a view fails the build.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.load_dataset(TEST_SCALE)
+
+    def test_every_named_route_has_a_budget(self):
+        named = {pattern.name for pattern in urls.urlpatterns if isinstance(pattern, URLPattern) and pattern.name}
+        self.assertEqual(named - {spec['name'] for spec in ROUTES}, set())
+
+    def test_routes_stay_within_budget(self):
+        self.assertWithinBudgets()
+
+
+class RouteScalingTest(RouteRequestMixin, TestCase):
+    """A route runs as many queries on a dataset longer than its pages as on a small one, within its budget on both"""
+
+    def test_query_counts_do_not_grow_with_the_data(self):
+        counts = {}
+        for scale in SCALING_SCALES:
+            # Each dataset is rolled back before the next one is generated
+            with transaction.atomic():
+                self.load_dataset(scale)
+                counts[scale] = self.assertWithinBudgets()
+                transaction.set_rollback(True)
+        smaller, larger = (counts[scale] for scale in SCALING_SCALES)
+        self.assertEqual({route: count for route, count in larger.items() if count != smaller[route]}, {})
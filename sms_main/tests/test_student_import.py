@@ -0,0 +1,112 @@
+import io
+from unittest import mock, skipIf, skipUnless
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+
+from ..models import CustomUserProfile, Student, OfferedSubject
+from ..pagination import cached_count
+from ..provisioning import provision_user
+from ..student_import import COLUMNS, StudentImportError, import_students
+from .base import ClassTestCase
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+
+class StudentImportTest(ClassTestCase):
+    """Valid rows are written in bulk, the others are reported with their line and reason"""
+    class_size = 2
+
+    def rows(self):
+        fixture = self.fixture
+        return [
+            ['new1@example.com', 'Ann', 'B', 'Cruz', 'secret123', 'F', '', 'bench course', 'bench section',
+             '2020 - 2021', 'I', '', 'bench subject'],
+            # By id, school year without spaces, no password and no subject
+            ['new2@example.com', 'Ben', 'C', 'Diaz', '', 'm', 'Manila', str(fixture['course'].id),
+             str(fixture['section'].id), '2020-2021', 'II', 'R', ''],
+            ['new1@example.com', 'Ann', 'B', 'Cruz', '', 'F', '', 'bench course', 'bench section', '2020 - 2021',
+             'I', '', ''],
+            ['bench.student0@example.com', 'Old', 'O', 'Student', '', 'M', '', 'bench course', 'bench section',
+             '2020 - 2021', 'I', '', ''],
+            ['bad@example.com', 'Bad', 'B', 'Row', '', 'X', '', 'no such course', 'bench section', '2020 - 2021',
+             'I', '', ''],
+            ['missing@example.com', '', 'M', 'Name', '', 'F', '', 'bench course', 'bench section', '2020 - 2021',
+             'I', '', ''],
+        ]
+
+    def csv_file(self):
+        lines = [','.join(COLUMNS)] + [','.join(row) for row in self.rows()]
+        return io.BytesIO('\n'.join(lines).encode())
+
+    def assertImported(self, result):
+        self.assertEqual((result.total, result.created, result.failed), (6, 2, 4))
+        self.assertEqual([(error.line, error.email) for error in result.errors], [
+            (4, 'new1@example.com'), (5, 'bench.student0@example.com'), (6, 'bad@example.com'),
+            (7, 'missing@example.com'),
+        ])
+        self.assertIn('more than once', result.errors[0].messages[0])
+        self.assertIn('already exists', result.errors[1].messages[0])
+        self.assertEqual(len(result.errors[2].messages), 2)
+        self.assertEqual(result.errors[3].messages, ['first_name is required.'])
+
+        ann = Student.objects.select_related('user_profile').get(user_profile__email='new1@example.com')
+        self.assertEqual((ann.gender, ann.address, ann.stat), ('F', 'Unspecified', Student.Status.REGULAR))
+        self.assertTrue(ann.user_profile.check_password('secret123'))
+        self.assertEqual(list(OfferedSubject.objects.filter(student_id=ann).values_list('subject_id', flat=True)),
+                         [self.fixture['subject'].id])
+        ben = Student.objects.select_related('user_profile').get(user_profile__email='new2@example.com')
+        self.assertEqual((ben.gender, ben.year_level, ben.section_id), ('M', 'II', self.fixture['section'].id))
+        self.assertFalse(ben.user_profile.has_usable_password())
+
+    def test_csv(self):
+        # Small chunks, the rows are written by more than one bulk_create
+        self.assertImported(import_students(self.csv_file(), 'students.csv', chunk_size=1, workers=0))
+
+    @skipUnless(openpyxl, 'openpyxl is not installed')
+    def test_xlsx(self):
+        workbook = openpyxl.Workbook()
+        workbook.active.append(COLUMNS)
+        for row in self.rows():
+            workbook.active.append(row)
+        output = io.BytesIO()
+        workbook.save(output)
+        output.seek(0)
+        self.assertImported(import_students(output, 'students.xlsx', workers=0))
+
+    @skipIf(openpyxl, 'openpyxl is installed')
+    def test_xlsx_without_openpyxl(self):
+        with self.assertRaisesMessage(StudentImportError, 'requires the openpyxl package'):
+            import_students(io.BytesIO(b'PK'), 'students.xlsx', workers=0)
+
+    def test_unknown_format(self):
+        with self.assertRaises(StudentImportError):
+            import_students(io.BytesIO(b''), 'students.txt', workers=0)
+
+    def test_dry_run_writes_nothing(self):
+        students = cached_count(Student.objects.all(), {})
+        result = import_students(self.csv_file(), 'students.csv', dry_run=True)
+        self.assertEqual((result.created, result.failed), (2, 4))
+        self.assertFalse(CustomUserProfile.objects.filter(email__in=['new1@example.com', 'new2@example.com'])
+                         .exists())
+        self.assertEqual(cached_count(Student.objects.all(), {}), students)
+
+    def test_import_drops_the_cached_totals(self):
+        students = cached_count(Student.objects.all(), {})
+        import_students(self.csv_file(), 'students.csv', workers=0)
+        self.assertEqual(cached_count(Student.objects.all(), {}), students + 2)
+
+    def test_upload_hashes_in_the_request(self):
+        admin = CustomUserProfile(email='import.admin@example.com', first_name='Admin', middle_initial='A',
+                                  last_name='Import', user_level=1, password='!')
+        provision_user(admin)
+        self.client.force_login(admin)
+        upload = SimpleUploadedFile('students.csv', self.csv_file().getvalue(), content_type='text/csv')
+        with mock.patch('sms_main.student_import.ProcessPoolExecutor') as pool:
+            response = self.client.post(reverse('import-students'), {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        pool.assert_not_called()
+        self.assertEqual(response.context['result'].created, 2)
@@ -16,6 +16,8 @@ urlpatterns = [
     path('admin/', admin_views.AdminDashboardView.as_view(), name='admin'),
     path('admin/staff/new', admin_views.AddStaffView.as_view(), name='add-staff'),
     path('admin/student/new/', admin_views.AddStudentView.as_view(), name='add-student'),
+    path('admin/instrumentation/', admin_views.InstrumentationSummaryView.as_view(), name='instrumentation-summary'),
+    path('admin/student/import/', admin_views.ImportStudentsView.as_view(), name='import-students'),
     path('admin/student/new/checkemail/', admin_views.AjaxCheckEmailDuplicate.as_view(), name='add-student-check-email'),
     path('admin/courses/new/', admin_views.AddCourseView.as_view(), name='add-course'),
     path('admin/subjects/new/', admin_views.AddSubjectView.as_view(), name='add-subject'),
@@ -25,6 +27,8 @@ urlpatterns = [
     path('admin/dashboard/', admin_views.AdminDashboardView.as_view(), name='admin-dashboard'),
     path('admin/manage/staff/', admin_views.ManageStaffView.as_view(), name='manage-staff'),
     path('admin/manage/students/', admin_views.ManageStudentsView.as_view(), name='manage-students'),
+    path('admin/manage/students/data/', admin_views.AjaxManageStudentsData.as_view(), name='ajax-manage-students-data'),
+    path('admin/manage/students/export/', admin_views.ExportStudentsView.as_view(), name='export-students'),
     path('admin/manage/subjects/', admin_views.ManageSubjectsView.as_view(), name='manage-subjects'),
     path('admin/manage/courses/', admin_views.ManageCoursesView.as_view(), name='manage-courses'),
     path('admin/manage/schoolyear/', admin_views.ManageSchoolYearView.as_view(), name='manage-school-years'),
@@ -41,12 +45,15 @@ urlpatterns = [
     path('admin/feedbacks/', admin_views.ViewFeedbacks.as_view(), name='view-staff-feedbacks'),
     path('admin/feedback/<int:id>/reply/', admin_views.AjaxFeedbackReply.as_view(), name='feedback-reply'),
     path('admin/manage/leaves/', admin_views.ManageStaffLeaves.as_view(), name='manage-staff-leaves'),
+    path('admin/manage/leaves/export/', admin_views.ExportStaffLeaves.as_view(), name='export-staff-leaves'),
     path('admin/leave/process/', admin_views.ApproveRejectStaffLeave.as_view(), name='process-staff-leave'),
     path('admin/', admin_views.DeleteSchoolYearView.as_view(), name='view-student-feedback'),
     path('staff/dashboard/', staff_views.StaffDashboardView.as_view(), name='staff-dashboard'),
     path('staff/dashboard/attendance/', staff_views.CreateStudentAttendanceView.as_view(), name='view-student-attendance'),
     path('staff/dashboard/attendance/report/u/<int:id>/', staff_views.StudentAttendanceReport.as_view(), name='view-student-attendance-report'),
     path('staff/dashboard/attendance/report/list/', staff_views.AjaxFetchAttendanceList.as_view(), name='ajax-staff-fetch-attendance-report'),
+    path('staff/dashboard/attendance/report/matrix/', staff_views.AjaxAttendanceMatrix.as_view(), name='ajax-staff-attendance-matrix'),
+    path('staff/dashboard/attendance/report/export/', staff_views.ExportAttendance.as_view(), name='export-staff-attendance'),
     path('staff/dashboard/attendance/report/', staff_views.AjaxViewAttendance.as_view(), name='ajax-view-student-attendance'),
     path('staff/dashboard/attendance/report/update', staff_views.AjaxUpdateAttendance.as_view(), name='ajax-update-student-attendance-report'),
     path('staff/students/fetch/', staff_views.AjaxFetchStudents.as_view(), name='ajax-staff-fetch-students'),